@@ -0,0 +1,267 @@
+# Offline benchmarks for the bot's hot paths. Nothing here talks to Discord.
+#
+#   python bench.py writes --actions 2000 --concurrency 50
+#   python bench.py memory --sizes 1000 10000 50000
+#   python bench.py locks --users 5000
+#   python bench.py usercache --users 100000
+#
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import discord
+
+import bot
+
+
+# =========================
+# WRITES (group commit vs per-call commit)
+# =========================
+async def _write_workload(storage: bot.SQLiteStorage, actions: int, concurrency: int, users: int) -> int:
+    rng = random.Random(42)
+    sem = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(i: int):
+        nonlocal failed
+        uid = rng.randrange(users) + 1
+        async with sem:
+            kind = i % 4
+            try:
+                if kind == 0:
+                    await storage.add_envelopes(uid, 2)
+                elif kind == 1:
+                    await storage.consume_envelope_and_award(uid, 1, False)
+                elif kind == 2:
+                    await storage.adjust_user_field(uid, "points", 1)
+                else:
+                    await storage.set_daily_claim(uid)
+            except sqlite3.OperationalError:  # "database is locked" under write contention
+                failed += 1
+
+    await asyncio.gather(*(one(i) for i in range(actions)))
+    return failed
+
+
+async def bench_writes(args):
+    print(f"{'mode':<20} {'actions/s':>10} {'commits':>8} {'commits/s':>10} {'failed':>7} {'elapsed':>8}")
+    for label, window_ms in (("per-call commit", 0), (f"group commit {args.window_ms:g}ms", args.window_ms)):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = bot.SQLiteStorage(os.path.join(tmp, "bench.db"), batch_window_ms=window_ms)
+            await storage.init()
+            t0 = time.perf_counter()
+            failed = await _write_workload(storage, args.actions, args.concurrency, args.users)
+            elapsed = time.perf_counter() - t0
+            commits = storage.commits
+            await storage.close()
+
+        print(
+            f"{label:<20} {args.actions / elapsed:>10.0f} {commits:>8} "
+            f"{commits / elapsed:>10.0f} {failed:>7} {elapsed:>7.2f}s"
+        )
+
+
+# =========================
+# LOCKS (per-user striped locks vs none vs one global lock)
+# =========================
+async def _lock_workload(storage: bot.Storage, hold, actions: int, concurrency: int, users: int):
+    # same read -> write -> read shape as /event open
+    rng = random.Random(7)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        uid = rng.randrange(users) + 1
+        async with sem:
+            async with hold(uid):
+                await storage.get_user_stats(uid)
+                await storage.consume_envelope_and_award(uid, 1, False)
+                await storage.get_user_stats(uid)
+
+    await asyncio.gather(*(one(i) for i in range(actions)))
+
+
+async def bench_locks(args):
+    global_lock = asyncio.Lock()
+
+    @contextlib.asynccontextmanager
+    async def no_lock(uid):
+        yield
+
+    @contextlib.asynccontextmanager
+    async def one_lock(uid):
+        async with global_lock:
+            yield
+
+    locks = bot.UserLocks(bot.USER_LOCK_STRIPES)
+    modes = [("no lock", no_lock), ("per-user striped", locks.hold), ("global lock", one_lock)]
+
+    print(f"{'mode':<18} {'actions/s':>10} {'elapsed':>8}")
+    for label, hold in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = (
+                bot.MemoryStorage() if args.memory
+                else bot.SQLiteStorage(os.path.join(tmp, "bench.db"), archive_path=os.path.join(tmp, "archive.db"))
+            )
+            await storage.init()
+            for uid in range(1, args.users + 1):
+                await storage.add_envelopes(uid, args.actions)
+            t0 = time.perf_counter()
+            await _lock_workload(storage, hold, args.actions, args.concurrency, args.users)
+            elapsed = time.perf_counter() - t0
+            await storage.close()
+        print(f"{label:<18} {args.actions / elapsed:>10.0f} {elapsed:>7.2f}s")
+    print(f"lock table after run: {len(locks.table)} entries • contended {locks.contended}/{locks.acquired}")
+
+
+# =========================
+# USER CACHE (memory per 100k rows + balance reads with / without it)
+# =========================
+async def bench_usercache(args):
+    tracemalloc.start()
+    cache = bot.UserCache(args.users)
+    before = tracemalloc.get_traced_memory()[0]
+    for uid in range(1, args.users + 1):
+        cache.put(10**17 + uid, uid % 50, uid * 7, uid % 3)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"cache: {args.users} rows • {used / args.users:.0f} B/row • {used / args.users * 100_000 / 2**20:.1f} MB per 100k users")
+
+    print(f"{'mode':<10} {'reads/s':>10} {'elapsed':>8}")
+    for label, capacity in (("no cache", 0), ("cache", bot.USER_CACHE_SIZE)):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = bot.SQLiteStorage(os.path.join(tmp, "bench.db"), archive_path=os.path.join(tmp, "archive.db"))
+            storage.user_cache = bot.UserCache(capacity)
+            await storage.init()
+            await storage.grant_envelopes(range(1, args.players + 1), 5)
+            rng = random.Random(3)
+            t0 = time.perf_counter()
+            for _ in range(args.reads):
+                await storage.get_user_stats(rng.randrange(args.players) + 1)
+            elapsed = time.perf_counter() - t0
+            await storage.close()
+        print(f"{label:<10} {args.reads / elapsed:>10.0f} {elapsed:>7.2f}s")
+
+
+# =========================
+# MEMORY (client profiles vs guild size)
+# =========================
+# Each (profile, guild size) runs in a fresh process: a synthetic GUILD_CREATE is fed into the
+# client's cache, followed by the MESSAGE_CREATE traffic the profile's intents would receive
+# (one message per member). RSS is read after a full GC.
+def _rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _guild_payload(guild_id: int, size: int) -> dict:
+    channels = [
+        {"id": str(guild_id + 1 + i), "type": 0, "name": f"channel-{i}", "position": i, "permission_overwrites": []}
+        for i in range(min(500, 20 + size // 200))
+    ]
+    roles = [
+        {"id": str(guild_id + 10_000 + i), "name": f"role-{i}", "permissions": "0", "position": i,
+         "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}
+        for i in range(min(250, 10 + size // 500))
+    ]
+    roles[0]["id"] = str(guild_id)  # @everyone
+    return {
+        "id": str(guild_id), "name": "bench", "owner_id": "1", "member_count": size, "large": size > 250,
+        "channels": channels, "roles": roles, "members": [], "emojis": [], "stickers": [],
+        "threads": [], "presences": [], "voice_states": [], "features": [],
+    }
+
+
+def _message_payload(guild_id: int, channel_id: int, msg_id: int, user_id: int) -> dict:
+    author = {"id": str(user_id), "username": f"player{user_id}", "discriminator": "0", "avatar": None}
+    return {
+        "id": str(msg_id), "channel_id": str(channel_id), "guild_id": str(guild_id), "author": author,
+        "member": {"roles": [], "joined_at": "2024-02-10T00:00:00+00:00", "deaf": False, "mute": False},
+        "content": "gong xi fa cai! " * 4, "timestamp": "2024-02-10T00:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False, "type": 0,
+    }
+
+
+def _memory_child(profile: str, size: int):
+    opts = bot.client_options(profile)
+    client = discord.Client(**opts)
+    state = client._connection
+    gc.collect()
+    base = _rss_kb()
+
+    guild_id = 10**17
+    state._add_guild_from_data(_guild_payload(guild_id, size))
+    if opts["intents"].guild_messages:
+        for i in range(size):
+            state.parse_message_create(_message_payload(guild_id, guild_id + 1 + i % 20, 10**18 + i, 10**16 + i))
+
+    gc.collect()
+    cached = len(state._messages) if state._messages is not None else 0
+    print(f"{_rss_kb() - base} {cached}")
+
+
+def bench_memory(args):
+    print(f"{'profile':<8} {'guild size':>10} {'cached msgs':>12} {'RSS delta':>10}")
+    for profile in ("default", "lowmem"):
+        for size in args.sizes:
+            out = subprocess.run(
+                [sys.executable, __file__, "memory-child", profile, str(size)],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            delta_kb, cached = int(out[0]), int(out[1])
+            print(f"{profile:<8} {size:>10} {cached:>12} {delta_kb / 1024:>8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fortune bot offline benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("writes", help="balance mutations: group commit vs per-call commit")
+    p.add_argument("--actions", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--window-ms", type=float, default=bot.WRITE_BATCH_WINDOW_MS or 4)
+    p.set_defaults(func=bench_writes)
+
+    p = sub.add_parser("locks", help="read-write-read per user: striped per-user locks vs none vs global")
+    p.add_argument("--actions", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--memory", action="store_true", help="use MemoryStorage (lock overhead only)")
+    p.set_defaults(func=bench_locks)
+
+    p = sub.add_parser("usercache", help="user row cache: memory per 100k users, balance reads with / without it")
+    p.add_argument("--users", type=int, default=100_000, help="rows to put in the cache for the memory figure")
+    p.add_argument("--players", type=int, default=2000, help="distinct players in the read benchmark")
+    p.add_argument("--reads", type=int, default=5000)
+    p.set_defaults(func=bench_usercache)
+
+    p = sub.add_parser("memory", help="RSS vs guild size for the default and lowmem client profiles")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser("memory-child")  # internal: one measurement per process
+    p.add_argument("profile")
+    p.add_argument("size", type=int)
+    p.set_defaults(func=lambda a: _memory_child(a.profile, a.size))
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+
+
+if __name__ == "__main__":
+    main()
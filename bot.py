@@ -1,10 +1,33 @@
 import os
+import io
+import re
+import sys
 import time
 import random
 import math
 import asyncio
+import hashlib
+import copy
+import json
+import queue
+import logging
+import logging.handlers
+import types
+import marshal
+import cProfile
+import pstats
+import sqlite3
+import tempfile
+import threading
+import traceback
+import contextlib
+import contextvars
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, deque
 import discord
+import discord.webhook.async_
 import aiosqlite
+from PIL import Image
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
@@ -30,6 +53,26 @@ LEDGER_CHANNEL_ID = int(os.getenv("LEDGER_CHANNEL_ID", "0"))
 STAFF_ROLE_ID = int(os.getenv("STAFF_ROLE_ID", "0"))
 DB_PATH = os.getenv("DB_PATH", "event.db")
 
+# "sqlite" (default) or "memory" (dry-run: nothing is written to disk, data is lost on restart)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+
+# Slash commands are only re-synced when the command tree changed (hash kept in this file)
+COMMAND_SYNC_STATE_PATH = os.getenv("COMMAND_SYNC_STATE_PATH", "command_sync.json")
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0").strip().lower() in ("1", "true", "yes")
+
+# Gateway/client memory profile: "default" (discord.py defaults) or "lowmem" (small VPS, long events)
+CLIENT_PROFILE = os.getenv("CLIENT_PROFILE", "default").strip().lower()
+LOWMEM_MAX_MESSAGES = int(os.getenv("LOWMEM_MAX_MESSAGES", "0"))  # 0 = no message cache at all
+# /event grant needs the privileged Server Members intent (also enable it in the Developer Portal)
+MEMBERS_INTENT = os.getenv("MEMBERS_INTENT", "0").strip().lower() in ("1", "true", "yes")
+
+# Group-commit: balance writes arriving within this window share one transaction (0 = commit each write)
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "4"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "256"))
+
+# Balances of the most recently active players are kept in memory (write-through, LRU)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+
 # Optional: /open thumbnail URLs by tier (set these later)
 OPEN_THUMBNAIL_GREEN = os.getenv("OPEN_THUMBNAIL_GREEN", "").strip()
 OPEN_THUMBNAIL_BLUE = os.getenv("OPEN_THUMBNAIL_BLUE", "").strip()
@@ -39,8 +82,44 @@ OPEN_THUMBNAIL_GOLD = os.getenv("OPEN_THUMBNAIL_GOLD", "").strip()
 # Backwards-compatible single thumbnail (optional). Used only if tier thumb missing.
 OPEN_THUMBNAIL_URL = os.getenv("OPEN_THUMBNAIL_URL", "").strip()
 
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN is missing. Put it in your .env file.")
+# Cold storage: closed quests + settled submissions are moved here once they are old enough
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", "event_archive.db")
+ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", "72"))  # hours since the quest closed
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# Online snapshots (SQLite backup API): every N hours (0 = only /event snapshot), newest N kept
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_INTERVAL_HOURS = float(os.getenv("SNAPSHOT_INTERVAL_HOURS", "6"))
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "12"))
+
+# Event-loop watchdog: lag above this is reported with the stack that held the loop.
+# LOOP_DEBUG=1 also turns on asyncio debug mode (slow callbacks get logged, with their source).
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0").strip().lower() in ("1", "true", "yes")
+
+# Live leaderboard (/event liveboard): at most one edit of the pinned message per N seconds
+LIVE_LEADERBOARD_INTERVAL = float(os.getenv("LIVE_LEADERBOARD_INTERVAL", "30"))
+
+# Admission control: commands beyond their class's slots + short wait queue get a quick "busy" reply (0 = off)
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1").strip().lower() in ("1", "true", "yes")
+
+# Local copies of submission screenshots (content-addressed) + thumbnail cache size cap
+PROOF_DIR = os.getenv("PROOF_DIR", "proofs")
+PROOF_THUMB_CACHE_MB = float(os.getenv("PROOF_THUMB_CACHE_MB", "64"))
+
+# Logging: one JSON object per line on stderr (+ LOG_FILE if set). Errors the bot shrugs off
+# are logged as warnings, at most once per LOG_WARN_INTERVAL_SECONDS for each kind.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FILE = os.getenv("LOG_FILE", "").strip()
+LOG_WARN_INTERVAL_SECONDS = float(os.getenv("LOG_WARN_INTERVAL_SECONDS", "60"))
+
+# Span tracing (Chrome trace-event JSON in TRACE_DIR, open with ui.perfetto.dev or chrome://tracing).
+# A random TRACE_SAMPLE_RATE of interactions is kept, plus every one slower than TRACE_SLOW_MS.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))  # 0 = only sampled ones
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_FILE_MB = float(os.getenv("TRACE_FILE_MB", "20"))
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "5"))
 
 # =========================
 # EVENT SETTINGS
@@ -51,6 +130,14 @@ DAILY_ENVELOPES_AWARD = 1
 
 PARTICIPATION_GOAL = 7  # "Participation Reward" threshold (approved missions)
 
+# Proofs whose perceptual hashes differ by <= this many bits are flagged as near-duplicates (max 3)
+PROOF_NEAR_DUP_DISTANCE = 3
+PROOF_THUMB_SIZE = 256  # px, longest side
+
+LIVE_LEADERBOARD_SIZE = 10  # players shown on the live leaderboard
+
+REVIEW_LEASE_SECONDS = 5 * 60  # /event nextreview: how long a submission stays reserved for one reviewer
+
 # RNG tiers (name, weight, points)
 TIERS = [
     ("🟢 Small Blessing", 55, 1),
@@ -93,423 +180,2842 @@ FLAVOR = {
     ],
 }
 
+# =========================
+# LOGGING (JSON, queue-backed, correlation IDs)
+# =========================
+# Records are put on a queue by the caller and written by a listener thread, so a slow disk
+# or terminal never stalls the event loop. The correlation ID lives in a contextvar: it is set
+# once per interaction and follows every await (DB helpers, REST calls) made while handling it.
+log = logging.getLogger("fortune")
+
+correlation_id: contextvars.ContextVar[str] = contextvars.ContextVar("correlation_id", default="-")
+
+
+class CorrelationFilter(logging.Filter):
+    # runs in the logging caller's context, before the record crosses to the listener thread
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.corr = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "corr": getattr(record, "corr", "-"),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class JsonQueueHandler(logging.handlers.QueueHandler):
+    # the stock prepare() folds the traceback into msg; keep it apart for the "exc" field
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=20 * 2**20, backupCount=5, encoding="utf-8"))
+    for h in handlers:
+        h.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = JsonQueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for noisy in ("discord", "aiosqlite", "asyncio"):  # their DEBUG is per-packet / per-statement noise
+        logging.getLogger(noisy).setLevel(max(logging.INFO, root.level))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def bind_interaction(interaction: discord.Interaction) -> str:
+    # new correlation ID for everything this interaction triggers (same task from here on)
+    corr = format(interaction.id, "x")
+    correlation_id.set(corr)
+    name = interaction.command.qualified_name if interaction.command else (interaction.data or {}).get("custom_id", "?")
+    log.info("interaction", extra={"fields": {"what": name, "user": interaction.user.id, "channel": interaction.channel_id}})
+    start_trace(name, corr)
+    return corr
+
+
+class CorrelatedView(discord.ui.View):
+    # every button/select click gets its own correlation ID, like slash commands do
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        bind_interaction(interaction)
+        return await admission.admit(interaction)
+
+
+class SampledWarnings:
+    # For errors we deliberately survive: the first of each kind is logged with its traceback,
+    # repeats within `interval` are only counted and reported with the next one that gets out.
+    def __init__(self, interval: float):
+        self.interval = float(interval)
+        self.last_logged: dict[str, float] = {}
+        self.suppressed: Counter[str] = Counter()
+        self.totals: Counter[str] = Counter()
+
+    def warn(self, kind: str, message: str, exc: BaseException | None = None, **fields):
+        self.totals[kind] += 1
+        now = time.monotonic()
+        if now - self.last_logged.get(kind, -self.interval) < self.interval:
+            self.suppressed[kind] += 1
+            return
+        self.last_logged[kind] = now
+        fields.update(kind=kind, suppressed=self.suppressed.pop(kind, 0))
+        log.warning(message, exc_info=(type(exc), exc, exc.__traceback__) if exc else None, extra={"fields": fields})
+
+
+swallowed = SampledWarnings(LOG_WARN_INTERVAL_SECONDS)
+
+
+# =========================
+# TRACING (spans -> Chrome trace-event files)
+# =========================
+# Every interaction records its spans (command, DB helpers, REST calls) in memory; when its task
+# finishes the trace is either dropped or, if sampled or slow, handed to a writer thread. Each
+# kept interaction gets its own row ("tid") in the viewer, labelled with command + correlation ID.
+TRACE_MAX_SPANS = 500  # per interaction
+
+current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    __slots__ = ("name", "corr", "sampled", "start_us", "t0", "events")
+
+    def __init__(self, name: str, corr: str, sampled: bool):
+        self.name = name
+        self.corr = corr
+        self.sampled = sampled
+        self.start_us = time.time_ns() // 1000
+        self.t0 = time.perf_counter()
+        self.events: list[tuple[str, str, float, float, dict]] = []  # (name, cat, start s, dur s, args)
+
+
+class TraceWriter:
+    # JSON-array trace files ("[" then one event per line; the closing "]" is optional in the
+    # format, so a file that is cut off by a crash still loads). Rotated by size, oldest pruned.
+    def __init__(self, directory: str, max_bytes: int, keep: int):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.keep = int(keep)
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread: threading.Thread | None = None
+        self.file = None
+        self.started = 0
+        self.kept = 0
+        self._next_tid = 1
+
+    def submit(self, trace: Trace):
+        self.kept += 1
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self.thread.start()
+        self.queue.put(trace)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"trace-{stamp}.json")
+        n = 1
+        while os.path.exists(path):
+            n += 1
+            path = os.path.join(self.directory, f"trace-{stamp}-{n}.json")
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write("[\n")
+
+        traces = sorted(f for f in os.listdir(self.directory) if f.startswith("trace-") and f.endswith(".json"))
+        for old in traces[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            trace = self.queue.get()
+            try:
+                if self.file is None or self.file.tell() >= self.max_bytes:
+                    if self.file is not None:
+                        self.file.close()
+                    self._open()
+                tid = self._next_tid
+                self._next_tid += 1
+                lines = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                          "args": {"name": f"{trace.name} [{trace.corr}]"}}]
+                for name, cat, start, dur, args in trace.events:
+                    lines.append({
+                        "name": name, "cat": cat, "ph": "X", "pid": 1, "tid": tid,
+                        "ts": trace.start_us + round((start - trace.t0) * 1e6), "dur": round(dur * 1e6),
+                        "args": args,
+                    })
+                self.file.write("".join(json.dumps(e, default=str) + ",\n" for e in lines))
+                self.file.flush()
+            except Exception as e:
+                swallowed.warn("trace.write", "Trace not written", e)
+
+
+trace_writer = TraceWriter(TRACE_DIR, int(TRACE_FILE_MB * 2**20), TRACE_KEEP)
+
+
+def start_trace(name: str, corr: str):
+    # called from bind_interaction, i.e. inside the task that runs the interaction
+    if TRACE_SAMPLE_RATE <= 0 and TRACE_SLOW_MS <= 0:
+        return
+    trace = Trace(name, corr, random.random() < TRACE_SAMPLE_RATE)
+    current_trace.set(trace)
+    trace_writer.started += 1
+    task = asyncio.current_task()
+    if task is not None:
+        task.add_done_callback(lambda _t: finish_trace(trace))
+
+
+def finish_trace(trace: Trace):
+    total = time.perf_counter() - trace.t0
+    if not trace.sampled and not (TRACE_SLOW_MS > 0 and total * 1000 >= TRACE_SLOW_MS):
+        return
+    trace.events.insert(0, (trace.name, "interaction", trace.t0, total, {"corr": trace.corr, "sampled": trace.sampled}))
+    trace_writer.submit(trace)
+
+
+@contextlib.contextmanager
+def span(name: str, cat: str, **args):
+    trace = current_trace.get()
+    if trace is None or len(trace.events) >= TRACE_MAX_SPANS:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.events.append((name, cat, t0, time.perf_counter() - t0, args))
+
+
+def trace_methods(obj, cat: str):
+    # wrap the public async methods of `obj` (on the instance) in spans named after the method
+    for name in dir(type(obj)):
+        fn = getattr(obj, name, None)
+        if name.startswith("_") or not asyncio.iscoroutinefunction(fn):
+            continue
+
+        def bind(name=name, fn=fn):
+            async def traced(*args, **kwargs):
+                if current_trace.get() is None:
+                    return await fn(*args, **kwargs)
+                with span(name, cat):
+                    return await fn(*args, **kwargs)
+            traced.__wrapped__ = fn
+            return traced
+
+        setattr(obj, name, bind())
+
+
 # =========================
 # BOT SETUP
 # =========================
-intents = discord.Intents.default()
+def client_options(profile: str) -> dict:
+    if profile == "default":
+        intents = discord.Intents.default()
+        intents.members = MEMBERS_INTENT
+        return {"intents": intents}
+    if profile == "lowmem":
+        # Slash commands arrive with the invoking member/roles attached and messages are only
+        # ever read through fetch_message, so only the guild/channel cache is really needed.
+        # With MEMBERS_INTENT, /event grant pages members over REST instead of caching them.
+        return {
+            "intents": discord.Intents(guilds=True, members=MEMBERS_INTENT),
+            "max_messages": LOWMEM_MAX_MESSAGES or None,
+            "chunk_guilds_at_startup": False,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+        }
+    raise RuntimeError(f"Unknown CLIENT_PROFILE: {profile!r} (use 'default' or 'lowmem')")
+
+
 open_cooldowns: dict[int, float] = {}  # user_id -> last_open_time
 
 
 # =========================
-# DB HELPERS
+# STORAGE (pluggable backend)
 # =========================
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        # users
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            envelopes INTEGER NOT NULL DEFAULT 0,
-            points INTEGER NOT NULL DEFAULT 0,
-            dragon INTEGER NOT NULL DEFAULT 0
-        )
-        """)
+# Every command goes through `storage`, never raw SQL. SQLiteStorage is the real
+# backend; MemoryStorage has the same semantics with no disk I/O and is used for
+# dry-run rehearsals (STORAGE_BACKEND=memory) and fast local benchmarking.
+PHASH_BANDS = 4  # 64-bit perceptual hash -> 4 x 16-bit bands
 
-        # quests (staff-posted missions)
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS quests (
-            quest_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            body TEXT NOT NULL,
-            bonus TEXT,
-            reward_envelopes INTEGER NOT NULL DEFAULT 1,
-            image_url TEXT,
-            active INTEGER NOT NULL DEFAULT 1,
-            message_id INTEGER,
-            channel_id INTEGER,
-            created_at INTEGER NOT NULL,
-            expires_at INTEGER
-        )
-        """)
 
-        # submissions (player proof submissions tied to quest_id)
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS submissions (
-            submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            quest_id INTEGER NOT NULL,
-            proof_url TEXT NOT NULL,
-            note TEXT,
-            status TEXT NOT NULL DEFAULT 'PENDING',
-            reward_envelopes_awarded INTEGER NOT NULL DEFAULT 0,
-            message_id INTEGER,
-            channel_id INTEGER,
-            created_at INTEGER NOT NULL
-        )
-        """)
+def phash_bands(phash: int) -> list[int]:
+    return [(int(phash) >> (16 * band)) & 0xFFFF for band in range(PHASH_BANDS)]
 
-        # daily claims (6h cooldown)
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS daily_claims (
-            user_id INTEGER PRIMARY KEY,
-            last_claim_at INTEGER NOT NULL DEFAULT 0
-        )
-        """)
 
-        # --- MIGRATION: add expires_at if missing (safe to run every startup)
+def to_sqlite_int64(value: int | None) -> int | None:
+    # SQLite INTEGER is signed 64-bit
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+# Quest search index. MemoryStorage keeps the same table in an in-memory SQLite database, so a
+# dry run finds, ranks and highlights exactly what production does.
+QUESTS_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS quests_fts USING fts5(
+        title, body, bonus, reward UNINDEXED, active UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+QUESTS_FTS_COUNT = "SELECT COUNT(*) FROM quests_fts WHERE quests_fts MATCH ? {active_sql}"
+# bm25 column weights: title 10, body 1, bonus 3
+QUESTS_FTS_SEARCH = """
+    SELECT rowid, title, reward, active, snippet(quests_fts, 1, '**', '**', '…', 12)
+    FROM quests_fts
+    WHERE quests_fts MATCH ? {active_sql}
+    ORDER BY bm25(quests_fts, 10.0, 1.0, 3.0), rowid
+    LIMIT ? OFFSET ?
+"""
+
+
+def fts_match_query(text: str) -> str:
+    # free text -> safe FTS5 query: every word must match, as a prefix ("drag" finds "dragon")
+    words = re.findall(r"\w+", text.lower())[:8]
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def filter_proof_matches(rows, sha256: str, phash: int | None, max_distance: int):
+    # rows = (submission_id, user_id, quest_id, sha256, phash) candidates from the index
+    # -> (submission_id, user_id, quest_id, bit distance, sha256) for real matches
+    matches = []
+    for sid, uid, qid, p_sha, p_phash in rows:
+        if p_sha == sha256:
+            distance = 0
+        elif phash is not None and p_phash is not None:
+            distance = bin((int(p_phash) ^ int(phash)) & 0xFFFFFFFFFFFFFFFF).count("1")
+            if distance > max_distance:
+                continue
+        else:
+            continue
+        matches.append((int(sid), int(uid), int(qid), distance, p_sha))
+    return matches
+
+
+class Storage(ABC):
+    @abstractmethod
+    async def init(self):
+        ...
+
+    @abstractmethod
+    async def reset_all(self):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @abstractmethod
+    async def snapshot(self, dest_dir: str, label: str) -> list[str]:
+        # consistent copy of the live database file(s) into dest_dir -> paths written
+        ...
+
+    # -------- users --------
+    @abstractmethod
+    async def add_envelopes(self, user_id: int, amount: int):
+        ...
+
+    @abstractmethod
+    async def grant_envelopes(self, user_ids, amount: int) -> int:
+        # +amount envelopes for every user in one transaction; -> users credited
+        ...
+
+    @abstractmethod
+    async def get_user_stats(self, user_id: int) -> tuple[int, int, int]:
+        ...
+
+    @abstractmethod
+    async def consume_envelope_and_award(self, user_id: int, points: int, is_dragon: bool, tier: str | None = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def count_users(self) -> int:
+        ...
+
+    @abstractmethod
+    async def top_leaderboard_page(self, offset: int, limit: int):
+        ...
+
+    @abstractmethod
+    async def adjust_user_field(self, user_id: int, field: str, delta: int) -> tuple[int, int]:
+        ...
+
+    @abstractmethod
+    async def get_rank_row(self, user_id: int):
+        ...
+
+    @abstractmethod
+    async def get_rank_context(self, rank: int, around: int = 2):
+        ...
+
+    # -------- quests --------
+    @abstractmethod
+    async def create_quest(
+        self,
+        title: str,
+        body: str,
+        bonus: str | None,
+        reward_envelopes: int,
+        image_url: str | None,
+        message_id: int,
+        channel_id: int,
+        expires_at: int | None = None
+    ) -> int:
+        ...
+
+    @abstractmethod
+    async def get_quest(self, quest_id: int):
+        ...
+
+    @abstractmethod
+    async def list_active_quests(self, limit: int = 25):
+        ...
+
+    @abstractmethod
+    async def close_quest(self, quest_id: int, effects=()) -> bool:
+        # -> True if the quest was open; effects are queued in the same commit
+        ...
+
+    @abstractmethod
+    async def get_expired_active_quests(self, now_ts: int):
+        ...
+
+    @abstractmethod
+    async def search_quests(self, query: str, offset: int, limit: int, active_only: bool = False):
+        # ranked full-text search (archived quests included)
+        # -> (total hits, [(quest_id, title, reward_envelopes, active, snippet)])
+        ...
+
+    # -------- submissions --------
+    @abstractmethod
+    async def create_submission(self, user_id: int, quest_id: int, proof_url: str,
+                                note: str | None) -> tuple[str, int | None, str | None, int]:
+        # -> (result, submission_id, quest_title, quest_reward); result is one of
+        #    "ok", "missing" (no such quest), "closed" or "duplicate" (already PENDING/APPROVED)
+        ...
+
+    @abstractmethod
+    async def update_submission_message(self, submission_id: int, message_id: int, channel_id: int):
+        ...
+
+    @abstractmethod
+    async def get_submission(self, submission_id: int):
+        # hot or archived
+        ...
+
+    @abstractmethod
+    async def review_submission(self, submission_id: int, status: str, reward: int, effects=()) -> bool:
+        # PENDING -> APPROVED/REJECTED, crediting `reward` envelopes; False if no longer PENDING
+        ...
+
+    @abstractmethod
+    async def revoke_submission(self, submission_id: int, effects=()) -> tuple[str | None, bool]:
+        # APPROVED -> REVOKED, removing the awarded envelopes if the user still has them.
+        # -> (status before, envelopes removed); only the APPROVED case changes anything.
+        # Archived submissions are final: (None, False), same as a missing one.
+        ...
+
+    @abstractmethod
+    async def count_user_approved(self, user_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def list_pending_submission_ids(self) -> list[int]:
+        ...
+
+    @abstractmethod
+    async def list_unposted_submissions(self) -> list[tuple]:
+        # PENDING submissions whose staff post never went out (crash/restart or a failed send)
+        # -> [(submission_id, user_id, quest_id, proof_url, note), ...] oldest first
+        ...
+
+    # -------- review queue (leases) --------
+    @abstractmethod
+    async def lease_next_submission(self, reviewer_id: int, lease_seconds: int, skip: bool = False):
+        # Oldest PENDING submission that isn't leased (or whose lease expired), reserved for
+        # `reviewer_id`. A reviewer who already holds a live lease gets that one back, unless
+        # `skip`, which hands it back to the queue first.
+        # -> (submission_id, user_id, quest_id, proof_url, note, message_id, channel_id, created_at, lease_expires_at) | None
+        ...
+
+    @abstractmethod
+    async def review_queue_stats(self, sample: int = 200) -> tuple[int, int, float]:
+        # -> (PENDING count, of which leased right now, median seconds submit -> review over the last `sample` reviews)
+        ...
+
+    @abstractmethod
+    async def list_user_submissions(self, user_id: int, before_id: int | None, limit: int):
+        # newest first, keyset on (user_id, submission_id): pass the last id of a page to get the next
+        # -> [(submission_id, quest_id, quest_title, status, reward_envelopes_awarded, created_at)]
+        ...
+
+    # -------- archive (cold storage) --------
+    @abstractmethod
+    async def archive_batch(self, closed_before: int, limit: int) -> tuple[int, int]:
+        # Moves up to `limit` submissions of quests closed before `closed_before` (and with
+        # nothing PENDING) to the archive, then every such quest left with no hot submissions.
+        # -> (quests moved, submissions moved); (0, 0) means nothing is left to archive
+        ...
+
+    @abstractmethod
+    async def archive_counts(self) -> dict[str, int]:
+        ...
+
+    # -------- proof index (duplicate screenshots) --------
+    @abstractmethod
+    async def record_proof(self, submission_id: int, sha256: str, phash: int | None):
+        ...
+
+    @abstractmethod
+    async def find_proof_matches(self, sha256: str, phash: int | None, max_distance: int):
+        ...
+
+    # -------- daily claim --------
+    @abstractmethod
+    async def can_claim_daily(self, user_id: int) -> tuple[bool, int]:
+        ...
+
+    @abstractmethod
+    async def set_daily_claim(self, user_id: int):
+        ...
+
+    # -------- event counters (/event stats) --------
+    @abstractmethod
+    async def get_counters(self) -> dict[str, int]:
+        # counters that are at 0 are left out; callers use .get(name, 0)
+        ...
+
+    # -------- settings (staff-configured, key -> text) --------
+    @abstractmethod
+    async def get_setting(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    async def set_setting(self, key: str, value: str | None):
+        # None removes the key
+        ...
+
+    # -------- outbox (Discord side effects) --------
+    @abstractmethod
+    async def enqueue_effects(self, effects):
+        ...
+
+    @abstractmethod
+    async def due_effects(self, now: float, limit: int):
+        # -> [(outbox_id, kind, channel_id, payload_json, attempts)] oldest first
+        ...
+
+    @abstractmethod
+    async def complete_effect(self, outbox_id: int):
+        ...
+
+    @abstractmethod
+    async def fail_effect(self, outbox_id: int, error: str, dead: bool, next_attempt_at: float = 0.0):
+        ...
+
+    @abstractmethod
+    async def count_pending_effects(self) -> int:
+        ...
+
+
+QUEST_COLUMNS = (
+    "quest_id, title, body, bonus, reward_envelopes, image_url, active, "
+    "message_id, channel_id, created_at, expires_at, closed_at"
+)
+SUBMISSION_COLUMNS = (
+    "submission_id, user_id, quest_id, proof_url, note, status, "
+    "reward_envelopes_awarded, message_id, channel_id, created_at"
+)
+
+
+SNAPSHOT_PAGES_PER_STEP = 128  # pages copied per backup step (source is only locked during a step)
+SNAPSHOT_STEP_SLEEP = 0.005  # seconds between steps, lets queued writes through
+SNAPSHOT_MAX_RESTARTS = 5  # copy restarts (source changed mid-copy) before finishing in one step
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+async def backup_sqlite_file(src_path: str, dest_path: str):
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # a write from another connection makes SQLite restart the copy from page 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > SNAPSHOT_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining = remaining
+
+    tmp = f"{dest_path}.tmp"
+    async with aiosqlite.connect(src_path) as src, aiosqlite.connect(tmp) as dst:
         try:
-            await db.execute("ALTER TABLE quests ADD COLUMN expires_at INTEGER")
-        except Exception:
-            pass
+            await src.backup(dst, pages=SNAPSHOT_PAGES_PER_STEP, progress=progress, sleep=SNAPSHOT_STEP_SLEEP)
+        except _BackupRestarted:
+            await src.backup(dst)  # busy DB: one step, holds the read lock for the whole copy
+    os.replace(tmp, dest_path)
 
-        await db.commit()
 
+# Callbacks of the write op that is running, run once its transaction has COMMITted (in commit
+# order). Whoever runs the op sets the list; a rolled-back op's callbacks are dropped.
+commit_hooks: contextvars.ContextVar[list | None] = contextvars.ContextVar("commit_hooks", default=None)
 
-async def ensure_user(db: aiosqlite.Connection, user_id: int):
-    await db.execute(
-        "INSERT OR IGNORE INTO users(user_id, envelopes, points, dragon) VALUES (?, 0, 0, 0)",
-        (user_id,),
-    )
 
+def after_commit(fn):
+    commit_hooks.get().append(fn)
 
-async def add_envelopes(user_id: int, amount: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, user_id)
-        await db.execute(
-            "UPDATE users SET envelopes = envelopes + ? WHERE user_id = ?",
-            (int(amount), int(user_id)),
-        )
-        await db.commit()
 
+def run_commit_hooks(hooks):
+    for fn in hooks:
+        try:
+            fn()
+        except Exception as e:
+            swallowed.warn("db.after_commit", "After-commit callback failed", e)
+
+
+class GroupCommitWriter:
+    # Runs write ops that arrive within `window` seconds in ONE transaction (one fsync).
+    # Each op gets its own SAVEPOINT so a failing op doesn't undo its neighbours, and
+    # every caller is resumed with its own result only after the batch COMMIT succeeds.
+    def __init__(self, path: str, window: float, max_batch: int):
+        self.path = path
+        self.window = float(window)
+        self.max_batch = int(max_batch)
+        self.db: aiosqlite.Connection | None = None
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.commits = 0
+        self.ops = 0
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
 
-async def get_user_stats(user_id: int) -> tuple[int, int, int]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, user_id)
-        async with db.execute(
-            "SELECT envelopes, points, dragon FROM users WHERE user_id = ?",
-            (int(user_id),),
-        ) as cur:
-            row = await cur.fetchone()
-            return int(row[0]), int(row[1]), int(row[2])
+    async def close(self):
+        if self.task is None:
+            return
+        # finish what's already queued (a caller awaiting a write during shutdown still gets
+        # its result), then stop at the marker
+        self.queue.put_nowait(None)
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.task = None
 
+    async def submit(self, op):
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((op, fut, correlation_id.get()))
+        return await fut
 
-async def consume_envelope_and_award(user_id: int, points: int, is_dragon: bool) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, user_id)
-        async with db.execute(
-            "SELECT envelopes FROM users WHERE user_id = ?",
-            (int(user_id),),
-        ) as cur:
-            row = await cur.fetchone()
-            if not row or int(row[0]) <= 0:
-                return False
+    async def _run(self):
+        try:
+            self.db = await aiosqlite.connect(self.path, isolation_level=None)
+        except Exception as e:
+            while not self.queue.empty():
+                _, fut, _ = self.queue.get_nowait()
+                if not fut.done():
+                    fut.set_exception(e)
+            self.task = None
+            return
 
-        await db.execute(
-            "UPDATE users SET envelopes = envelopes - 1, points = points + ? WHERE user_id = ?",
-            (int(points), int(user_id)),
-        )
-        if is_dragon:
-            await db.execute(
-                "UPDATE users SET dragon = dragon + 1 WHERE user_id = ?",
-                (int(user_id),),
-            )
-        await db.commit()
-        return True
+        batch = []
+        try:
+            closing = False
+            while not closing:
+                item = await self.queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+                while len(batch) < self.max_batch and not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append(item)
+                await self._commit_batch(batch)
+                batch = []
+        finally:
+            # cancelled mid-batch (the transaction dies with the connection) or queued behind the
+            # close marker: fail those callers instead of leaving them waiting forever
+            error = RuntimeError("database writer closed")
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(error)
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is not None and not item[1].done():
+                    item[1].set_exception(error)
+            # the connection thread would otherwise keep the process alive on shutdown
+            db, self.db = self.db, None
+            await db.close()
+
+    async def _commit_batch(self, batch):
+        outcomes = []
+        t0 = time.perf_counter()
+        try:
+            await self.db.execute("BEGIN IMMEDIATE")
+            for op, fut, _ in batch:
+                await self.db.execute("SAVEPOINT op")
+                hooks = []
+                token = commit_hooks.set(hooks)
+                try:
+                    result = await op(self.db)
+                except Exception as e:
+                    await self.db.execute("ROLLBACK TO op")
+                    outcomes.append((fut, None, e, ()))
+                else:
+                    outcomes.append((fut, result, None, hooks))
+                finally:
+                    commit_hooks.reset(token)
+                await self.db.execute("RELEASE op")
+            await self.db.execute("COMMIT")
+        except Exception as e:
+            try:
+                await self.db.execute("ROLLBACK")
+            except Exception as rollback_error:
+                swallowed.warn("db.rollback", "Rollback after a failed batch failed too", rollback_error)
+            log.error("Group commit failed", exc_info=True, extra={"fields": {"ops": len(batch), "corrs": [c for _, _, c in batch]}})
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
 
+        self.commits += 1
+        self.ops += len(batch)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("group commit", extra={"fields": {
+                "ops": len(batch), "ms": round((time.perf_counter() - t0) * 1000, 2), "corrs": [c for _, _, c in batch],
+            }})
+        for _, _, _, hooks in outcomes:
+            run_commit_hooks(hooks)
+        for fut, result, err, _ in outcomes:
+            if fut.done():  # caller went away (cancelled)
+                continue
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(result)
+
+
+class UserRow:
+    __slots__ = ("envelopes", "points", "dragon")
+
+    def __init__(self, envelopes: int, points: int, dragon: int):
+        self.envelopes = envelopes
+        self.points = points
+        self.dragon = dragon
+
+
+class UserCache:
+    # LRU of committed `users` rows. Writers put the row their own statement RETURNed (in
+    # commit order, from an after_commit() callback), readers only fill rows that aren't there yet,
+    # so a slow read can never put an older balance back over a newer one. Writes that don't
+    # put a row (grant skips uncached members) call invalidate() once committed instead.
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self.rows: OrderedDict[int, UserRow] = OrderedDict()
+        self.reading: dict[int, list] = {}  # user_id -> [reads in flight, written meanwhile]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> UserRow | None:
+        row = self.rows.get(user_id)
+        if row is None:
+            self.misses += 1
+            return None
+        self.rows.move_to_end(user_id)
+        self.hits += 1
+        return row
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.rows
+
+    def put(self, user_id: int, envelopes: int, points: int, dragon: int):
+        if self.capacity <= 0:
+            return
+        row = self.rows.get(user_id)
+        if row is None:
+            self.rows[user_id] = UserRow(int(envelopes), int(points), int(dragon))
+            if len(self.rows) > self.capacity:
+                self.rows.popitem(last=False)
+        else:
+            row.envelopes, row.points, row.dragon = int(envelopes), int(points), int(dragon)
+            self.rows.move_to_end(user_id)
+
+    def fill(self, user_id: int, envelopes: int, points: int, dragon: int):
+        if user_id not in self.rows:
+            self.put(user_id, envelopes, points, dragon)
+
+    def begin_read(self, user_id: int):
+        entry = self.reading.setdefault(user_id, [0, False])
+        entry[0] += 1
+
+    def end_read(self, user_id: int, row: tuple | None):
+        # fill with what the read saw, unless a write committed while it was in flight
+        entry = self.reading[user_id]
+        entry[0] -= 1
+        if entry[0] == 0:
+            del self.reading[user_id]
+        if row is not None and not entry[1]:
+            self.fill(user_id, *row)
+
+    def invalidate(self, user_id: int):
+        self.rows.pop(user_id, None)
+        entry = self.reading.get(user_id)
+        if entry is not None:
+            entry[1] = True
+
+    def clear(self):
+        self.rows.clear()
+        for entry in self.reading.values():
+            entry[1] = True
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str, batch_window_ms: float = WRITE_BATCH_WINDOW_MS, archive_path: str = ARCHIVE_DB_PATH):
+        self.path = path
+        self.archive_path = archive_path
+        self.user_cache = UserCache(USER_CACHE_SIZE)
+        self.writer: GroupCommitWriter | None = None
+        if batch_window_ms > 0:
+            self.writer = GroupCommitWriter(path, batch_window_ms / 1000.0, WRITE_BATCH_MAX)
+        self.direct_commits = 0
+
+    @property
+    def commits(self) -> int:
+        return self.direct_commits + (self.writer.commits if self.writer else 0)
+
+    async def _write(self, op):
+        # Balance mutations: batched through the group-commit writer when enabled,
+        # otherwise one connection + one commit per call (the old behaviour).
+        if self.writer is not None:
+            return await self.writer.submit(op)
+        t0 = time.perf_counter()
+        hooks = []
+        token = commit_hooks.set(hooks)
+        try:
+            async with aiosqlite.connect(self.path) as db:
+                result = await op(db)
+                await db.commit()
+                self.direct_commits += 1
+        finally:
+            commit_hooks.reset(token)
+        run_commit_hooks(hooks)
+        log.debug("db write", extra={"fields": {"ms": round((time.perf_counter() - t0) * 1000, 2)}})
+        return result
+
+    async def close(self):
+        if self.writer is not None:
+            await self.writer.close()
+
+    async def snapshot(self, dest_dir: str, label: str) -> list[str]:
+        os.makedirs(dest_dir, exist_ok=True)
+        paths = []
+        for src, suffix in ((self.path, ".db"), (self.archive_path, ".archive.db")):
+            if not os.path.exists(src):
+                continue
+            dest = os.path.join(dest_dir, f"{label}{suffix}")
+            await backup_sqlite_file(src, dest)
+            paths.append(dest)
+        return paths
+
+    async def init(self):
+        async with aiosqlite.connect(self.path) as db:
+            # users
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                envelopes INTEGER NOT NULL DEFAULT 0,
+                points INTEGER NOT NULL DEFAULT 0,
+                dragon INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+
+            # quests (staff-posted missions)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS quests (
+                quest_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                body TEXT NOT NULL,
+                bonus TEXT,
+                reward_envelopes INTEGER NOT NULL DEFAULT 1,
+                image_url TEXT,
+                active INTEGER NOT NULL DEFAULT 1,
+                message_id INTEGER,
+                channel_id INTEGER,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER
+            )
+            """)
+
+            # submissions (player proof submissions tied to quest_id)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                quest_id INTEGER NOT NULL,
+                proof_url TEXT NOT NULL,
+                note TEXT,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                reward_envelopes_awarded INTEGER NOT NULL DEFAULT 0,
+                message_id INTEGER,
+                channel_id INTEGER,
+                created_at INTEGER NOT NULL
+            )
+            """)
 
-async def count_users() -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT COUNT(*) FROM users") as cur:
-            row = await cur.fetchone()
-            return int(row[0]) if row else 0
+            # daily claims (6h cooldown)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS daily_claims (
+                user_id INTEGER PRIMARY KEY,
+                last_claim_at INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+
+            # proof index: content hash + perceptual hash split into 4 x 16-bit bands.
+            # Two hashes within 3 bits of each other share at least one band, so a
+            # near-duplicate lookup is 4 indexed probes instead of a table scan.
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS proof_index (
+                submission_id INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                phash INTEGER,
+                b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER
+            )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_proof_sha256 ON proof_index(sha256)")
+            for band in range(PHASH_BANDS):
+                await db.execute(f"CREATE INDEX IF NOT EXISTS idx_proof_b{band} ON proof_index(b{band})")
+
+            # outbox: Discord side effects, written in the same commit as the state change
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                channel_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at INTEGER NOT NULL
+            )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(dead, next_attempt_at)")
+
+            # running totals for /event stats, bumped in the same transaction as the change they count
+            async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_counters'") as cur:
+                had_counters = await cur.fetchone() is not None
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+            if not had_counters:
+                # first start with counters: seed what the existing rows can tell (opens/tiers start at 0)
+                await db.execute("""
+                    INSERT INTO event_counters(name, value)
+                    SELECT 'submissions_' || lower(status), COUNT(*) FROM submissions GROUP BY status
+                """)
+                await db.execute("""
+                    INSERT INTO event_counters(name, value)
+                    SELECT 'submissions_received', COUNT(*) FROM submissions
+                    UNION ALL SELECT 'envelopes_awarded', COALESCE(SUM(reward_envelopes_awarded), 0) FROM submissions WHERE status IN ('APPROVED','REVOKED')
+                    UNION ALL SELECT 'dragon_marks', COALESCE(SUM(dragon), 0) FROM users
+                """)
+
+            # approved submissions that were moved to the archive, per user (participation progress)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS archived_approved (
+                user_id INTEGER PRIMARY KEY,
+                approved INTEGER NOT NULL DEFAULT 0
+            )
+            """)
 
+            # --- MIGRATION: add expires_at if missing (safe to run every startup)
+            try:
+                await db.execute("ALTER TABLE quests ADD COLUMN expires_at INTEGER")
+            except Exception:
+                pass
 
-async def top_leaderboard_page(offset: int, limit: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT user_id, points, envelopes, dragon
-            FROM users
-            ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC
-            LIMIT ? OFFSET ?
-        """, (int(limit), int(offset))) as cur:
-            return await cur.fetchall()
+            # --- MIGRATION: closed_at (archive age); quests closed before this fall back to expires_at/created_at
+            try:
+                await db.execute("ALTER TABLE quests ADD COLUMN closed_at INTEGER")
+            except Exception:
+                pass
 
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_submissions_quest ON submissions(quest_id, status)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_submissions_user ON submissions(user_id, submission_id)")
 
-async def adjust_user_field(user_id: int, field: str, delta: int) -> tuple[int, int]:
-    if field not in ("envelopes", "points", "dragon"):
-        raise ValueError("Invalid field")
+            # --- MIGRATION: review queue leases + review time (safe to run every startup)
+            for column in ("leased_by INTEGER", "lease_expires_at INTEGER", "reviewed_at INTEGER"):
+                try:
+                    await db.execute(f"ALTER TABLE submissions ADD COLUMN {column}")
+                except Exception:
+                    pass
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_submissions_queue ON submissions(status, created_at)")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_submissions_reviewed ON submissions(reviewed_at) WHERE reviewed_at IS NOT NULL"
+            )
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, user_id)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+
+            # quest search: FTS5 with its own copy of the text (not external content), so quests
+            # moved to the archive stay searchable; there's deliberately no DELETE trigger.
+            async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quests_fts'") as cur:
+                had_fts = await cur.fetchone() is not None
+            await db.execute(QUESTS_FTS_TABLE)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS quests_fts_insert AFTER INSERT ON quests BEGIN
+                    INSERT INTO quests_fts(rowid, title, body, bonus, reward, active)
+                    VALUES (new.quest_id, new.title, new.body, COALESCE(new.bonus, ''), new.reward_envelopes, new.active);
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS quests_fts_update
+                AFTER UPDATE OF title, body, bonus, reward_envelopes, active ON quests BEGIN
+                    UPDATE quests_fts
+                    SET title = new.title, body = new.body, bonus = COALESCE(new.bonus, ''),
+                        reward = new.reward_envelopes, active = new.active
+                    WHERE rowid = new.quest_id;
+                END
+            """)
+            if not had_fts:
+                await db.execute("""
+                    INSERT INTO quests_fts(rowid, title, body, bonus, reward, active)
+                    SELECT quest_id, title, body, COALESCE(bonus, ''), reward_envelopes, active FROM quests
+                """)
+
+            # --- MIGRATION: one PENDING/APPROVED submission per user+quest (also serves the dedupe lookup).
+            # Databases from before the index can hold duplicates: keep the approved one (its reward
+            # was paid), else the newest, and reject the rest so the index can be built.
+            async with db.execute("""
+                SELECT submission_id, status FROM (
+                    SELECT submission_id, status, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, quest_id
+                        ORDER BY status = 'APPROVED' DESC, created_at DESC, submission_id DESC
+                    ) AS n
+                    FROM submissions WHERE status IN ('PENDING','APPROVED')
+                ) WHERE n > 1
+            """) as cur:
+                duplicates = await cur.fetchall()
+            if duplicates:
+                await db.executemany(
+                    "UPDATE submissions SET status = 'REJECTED', reviewed_at = ?, leased_by = NULL, lease_expires_at = NULL "
+                    "WHERE submission_id = ?",
+                    [(int(time.time()), int(sid)) for sid, _ in duplicates],
+                )
+                approved = sum(1 for _, status in duplicates if status == "APPROVED")
+                await self._bump(
+                    db, submissions_pending=-(len(duplicates) - approved),
+                    submissions_approved=-approved, submissions_rejected=len(duplicates),
+                )
+                log.warning(
+                    "Rejected duplicate PENDING/APPROVED submissions",
+                    extra={"fields": {"count": len(duplicates), "submissions": [int(r[0]) for r in duplicates[:50]]}},
+                )
+            await db.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_submissions_active
+                ON submissions(user_id, quest_id) WHERE status IN ('PENDING','APPROVED')
+            """)
 
-        async with db.execute(
-            f"SELECT {field} FROM users WHERE user_id = ?",
-            (int(user_id),),
-        ) as cur:
-            row = await cur.fetchone()
-            current = int(row[0]) if row else 0
+            await db.commit()
 
-        new_val = current + int(delta)
-        if new_val < 0:
-            new_val = 0
+        # archive file: same columns as the hot tables + when the row was moved
+        async with aiosqlite.connect(self.archive_path) as db:
+            await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS quests (
+                {QUEST_COLUMNS.replace("quest_id,", "quest_id INTEGER PRIMARY KEY,", 1)},
+                archived_at INTEGER NOT NULL
+            )
+            """)
+            await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS submissions (
+                {SUBMISSION_COLUMNS.replace("submission_id,", "submission_id INTEGER PRIMARY KEY,", 1)},
+                archived_at INTEGER NOT NULL
+            )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_archive_submissions_user ON submissions(user_id, submission_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_archive_submissions_quest ON submissions(quest_id)")
+            await db.commit()
 
+        if self.writer is not None:
+            self.writer.start()
+
+    async def _connect_with_archive(self, **kwargs) -> aiosqlite.Connection:
+        # Hot DB with the archive attached as `archive`; all_quests / all_submissions
+        # (TEMP views, so per-connection) read hot and archived rows together.
+        db = await aiosqlite.connect(self.path, **kwargs)
+        await db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        await db.execute(f"""
+            CREATE TEMP VIEW all_quests AS
+            SELECT {QUEST_COLUMNS} FROM main.quests
+            UNION ALL
+            SELECT {QUEST_COLUMNS} FROM archive.quests
+        """)
+        await db.execute(f"""
+            CREATE TEMP VIEW all_submissions AS
+            SELECT {SUBMISSION_COLUMNS} FROM main.submissions
+            UNION ALL
+            SELECT {SUBMISSION_COLUMNS} FROM archive.submissions
+        """)
+        return db
+
+    async def reset_all(self):
+        # Switch to a fresh database: an empty, initialised file is copied over the live one
+        # with the backup API. That's one locked page copy instead of row-by-row DELETEs, and
+        # connections that are already open (the group-commit writer) just see the new file.
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(self.path))) as tmp_dir:
+            fresh = SQLiteStorage(
+                os.path.join(tmp_dir, "fresh.db"),
+                batch_window_ms=0,
+                archive_path=os.path.join(tmp_dir, "fresh_archive.db"),
+            )
+            await fresh.init()
+            for src_path, dest_path in ((fresh.path, self.path), (fresh.archive_path, self.archive_path)):
+                async with aiosqlite.connect(src_path) as src, aiosqlite.connect(dest_path) as dest:
+                    await src.backup(dest)
+        self.user_cache.clear()
+
+    async def _ensure_user(self, db: aiosqlite.Connection, user_id: int):
+        # a cached row exists in the table, so only genuine first contact needs the INSERT
+        if int(user_id) in self.user_cache:
+            return
         await db.execute(
-            f"UPDATE users SET {field} = ? WHERE user_id = ?",
-            (int(new_val), int(user_id)),
+            "INSERT OR IGNORE INTO users(user_id, envelopes, points, dragon) VALUES (?, 0, 0, 0)",
+            (int(user_id),),
         )
-        await db.commit()
-        return current, new_val
 
+    async def _cache_user(self, db: aiosqlite.Connection, user_id: int, sql: str, params: tuple):
+        # run an UPDATE ... RETURNING envelopes, points, dragon and write the row through once committed
+        async with db.execute(sql, params) as cur:
+            row = await cur.fetchone()
+        if row:
+            after_commit(lambda: self.user_cache.put(int(user_id), *row))
+        return row
+
+    @staticmethod
+    async def _bump(db: aiosqlite.Connection, **deltas: int):
+        # event_counters += deltas; part of the caller's transaction
+        await db.executemany(
+            "INSERT INTO event_counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, int(delta)) for name, delta in deltas.items() if delta],
+        )
 
-async def try_remove_envelopes(user_id: int, amount: int) -> bool:
-    amount = int(amount)
-    if amount <= 0:
-        return True
+    @staticmethod
+    async def _enqueue_effects(db: aiosqlite.Connection, effects):
+        if not effects:
+            return
+        now = int(time.time())
+        await db.executemany(
+            "INSERT INTO outbox(kind, channel_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, 0, ?)",
+            [(kind, int(channel_id), json.dumps(payload), now) for kind, channel_id, payload in effects],
+        )
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, user_id)
-        async with db.execute(
-            "SELECT envelopes FROM users WHERE user_id = ?",
-            (int(user_id),),
-        ) as cur:
-            row = await cur.fetchone()
-            bal = int(row[0]) if row else 0
-            if bal < amount:
+    # -------- users --------
+    async def add_envelopes(self, user_id: int, amount: int):
+        async def op(db: aiosqlite.Connection):
+            await self._ensure_user(db, user_id)
+            await self._cache_user(
+                db, user_id,
+                "UPDATE users SET envelopes = envelopes + ? WHERE user_id = ? RETURNING envelopes, points, dragon",
+                (int(amount), int(user_id)),
+            )
+            await self._bump(db, envelopes_granted=int(amount))
+
+        await self._write(op)
+
+    async def grant_envelopes(self, user_ids, amount: int) -> int:
+        rows = [(int(uid), int(amount)) for uid in dict.fromkeys(user_ids)]
+
+        async def op(db: aiosqlite.Connection) -> int:
+            await db.executemany("""
+                INSERT INTO users (user_id, envelopes) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET envelopes = envelopes + excluded.envelopes
+            """, rows)
+            await self._bump(db, envelopes_granted=int(amount) * len(rows))
+            after_commit(refresh_cache)
+            return len(rows)
+
+        def refresh_cache():
+            # cached rows are committed state, so the same increment keeps them exact; members
+            # who aren't cached stay out (a big grant shouldn't flush the LRU), and a balance read
+            # that started before the commit mustn't cache a pre-grant row for them
+            for uid, _ in rows:
+                row = self.user_cache.rows.get(uid)
+                if row is not None:
+                    row.envelopes += int(amount)
+                else:
+                    self.user_cache.invalidate(uid)
+
+        if not rows:
+            return 0
+        return await self._write(op)
+
+    async def get_user_stats(self, user_id: int) -> tuple[int, int, int]:
+        cached = self.user_cache.get(int(user_id))
+        if cached is not None:
+            return cached.envelopes, cached.points, cached.dragon
+
+        # plain read: a player with no row yet simply has nothing (no INSERT on a read path)
+        self.user_cache.begin_read(int(user_id))
+        row = None
+        try:
+            async with aiosqlite.connect(self.path) as db:
+                async with db.execute(
+                    "SELECT envelopes, points, dragon FROM users WHERE user_id = ?",
+                    (int(user_id),),
+                ) as cur:
+                    row = await cur.fetchone()
+        finally:
+            self.user_cache.end_read(int(user_id), row)
+        if not row:
+            return 0, 0, 0
+        return int(row[0]), int(row[1]), int(row[2])
+
+    async def consume_envelope_and_award(self, user_id: int, points: int, is_dragon: bool, tier: str | None = None) -> bool:
+        # no ensure_user: a missing row has no envelopes to spend anyway
+        async def op(db: aiosqlite.Connection) -> bool:
+            row = await self._cache_user(
+                db, user_id,
+                "UPDATE users SET envelopes = envelopes - 1, points = points + ?, dragon = dragon + ? "
+                "WHERE user_id = ? AND envelopes > 0 RETURNING envelopes, points, dragon",
+                (int(points), 1 if is_dragon else 0, int(user_id)),
+            )
+            if not row:
                 return False
+            await self._bump(db, envelopes_opened=1, points_awarded=int(points), dragon_marks=1 if is_dragon else 0)
+            if tier:
+                await self._bump(db, **{f"tier:{tier}": 1})
+            return True
+
+        return await self._write(op)
+
+    async def count_users(self) -> int:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT COUNT(*) FROM users") as cur:
+                row = await cur.fetchone()
+                return int(row[0]) if row else 0
+
+    async def top_leaderboard_page(self, offset: int, limit: int):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT user_id, points, envelopes, dragon
+                FROM users
+                ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC
+                LIMIT ? OFFSET ?
+            """, (int(limit), int(offset))) as cur:
+                return await cur.fetchall()
 
-        await db.execute(
-            "UPDATE users SET envelopes = envelopes - ? WHERE user_id = ?",
-            (amount, int(user_id)),
-        )
-        await db.commit()
-        return True
+    async def adjust_user_field(self, user_id: int, field: str, delta: int) -> tuple[int, int]:
+        if field not in ("envelopes", "points", "dragon"):
+            raise ValueError("Invalid field")
 
+        async def op(db: aiosqlite.Connection) -> tuple[int, int]:
+            await self._ensure_user(db, user_id)
 
-# -------- rank helpers (exact rank + context) --------
-async def get_rank_row(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await ensure_user(db, int(user_id))
-        async with db.execute("""
-            WITH ranked AS (
-                SELECT
-                    user_id, points, envelopes, dragon,
-                    ROW_NUMBER() OVER (ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC) AS r,
-                    COUNT(*) OVER () AS total
-                FROM users
+            async with db.execute(
+                f"SELECT {field} FROM users WHERE user_id = ?",
+                (int(user_id),),
+            ) as cur:
+                row = await cur.fetchone()
+                current = int(row[0]) if row else 0
+
+            new_val = current + int(delta)
+            if new_val < 0:
+                new_val = 0
+
+            await self._cache_user(
+                db, user_id,
+                f"UPDATE users SET {field} = ? WHERE user_id = ? RETURNING envelopes, points, dragon",
+                (int(new_val), int(user_id)),
             )
-            SELECT user_id, points, envelopes, dragon, r, total
-            FROM ranked
-            WHERE user_id = ?
-        """, (int(user_id),)) as cur:
-            row = await cur.fetchone()
+            await self._bump(db, **{f"{field}_adjusted": new_val - current})
+            if field == "dragon":
+                await self._bump(db, dragon_marks=new_val - current)
+            return current, new_val
+
+        return await self._write(op)
+
+    # -------- rank helpers (exact rank + context) --------
+    async def get_rank_row(self, user_id: int):
+        async with aiosqlite.connect(self.path) as db:
+            await self._ensure_user(db, int(user_id))
+            async with db.execute("""
+                WITH ranked AS (
+                    SELECT
+                        user_id, points, envelopes, dragon,
+                        ROW_NUMBER() OVER (ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC) AS r,
+                        COUNT(*) OVER () AS total
+                    FROM users
+                )
+                SELECT user_id, points, envelopes, dragon, r, total
+                FROM ranked
+                WHERE user_id = ?
+            """, (int(user_id),)) as cur:
+                row = await cur.fetchone()
+                if not row:
+                    return None
+                return {
+                    "user_id": int(row[0]),
+                    "points": int(row[1]),
+                    "envelopes": int(row[2]),
+                    "dragon": int(row[3]),
+                    "rank": int(row[4]),
+                    "total": int(row[5]),
+                }
+
+    async def get_rank_context(self, rank: int, around: int = 2):
+        start_r = max(1, int(rank) - int(around))
+        end_r = int(rank) + int(around)
+
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                WITH ranked AS (
+                    SELECT
+                        user_id, points, envelopes, dragon,
+                        ROW_NUMBER() OVER (ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC) AS r
+                    FROM users
+                )
+                SELECT r, user_id, points, envelopes, dragon
+                FROM ranked
+                WHERE r BETWEEN ? AND ?
+                ORDER BY r ASC
+            """, (int(start_r), int(end_r))) as cur:
+                return await cur.fetchall()
+
+    # -------- quests --------
+    async def create_quest(
+        self,
+        title: str,
+        body: str,
+        bonus: str | None,
+        reward_envelopes: int,
+        image_url: str | None,
+        message_id: int,
+        channel_id: int,
+        expires_at: int | None = None
+    ) -> int:
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("""
+                INSERT INTO quests(title, body, bonus, reward_envelopes, image_url, active, message_id, channel_id, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
+            """, (
+                title.strip(),
+                body.strip(),
+                bonus.strip() if bonus else None,
+                int(reward_envelopes),
+                image_url,
+                int(message_id) if message_id else None,
+                int(channel_id) if channel_id else None,
+                int(time.time()),
+                int(expires_at) if expires_at else None,
+            ))
+            await db.commit()
+            async with db.execute("SELECT last_insert_rowid()") as cur:
+                row = await cur.fetchone()
+                return int(row[0])
+
+    async def get_quest(self, quest_id: int):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT quest_id, title, body, bonus, reward_envelopes, image_url, active, message_id, channel_id, created_at, expires_at
+                FROM quests WHERE quest_id = ?
+            """, (int(quest_id),)) as cur:
+                return await cur.fetchone()
+
+    async def list_active_quests(self, limit: int = 25):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT quest_id, title, reward_envelopes
+                FROM quests
+                WHERE active = 1
+                ORDER BY quest_id DESC
+                LIMIT ?
+            """, (int(limit),)) as cur:
+                return await cur.fetchall()
+
+    async def close_quest(self, quest_id: int, effects=()) -> bool:
+        async def op(db: aiosqlite.Connection) -> bool:
+            cur = await db.execute(
+                "UPDATE quests SET active = 0, closed_at = ? WHERE quest_id = ? AND active = 1",
+                (int(time.time()), int(quest_id)),
+            )
+            if cur.rowcount == 0:
+                return False
+            await self._enqueue_effects(db, effects)
+            return True
+
+        return await self._write(op)
+
+    async def get_expired_active_quests(self, now_ts: int):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT quest_id, title, message_id, channel_id, expires_at
+                FROM quests
+                WHERE active = 1
+                  AND expires_at IS NOT NULL
+                  AND expires_at <= ?
+                ORDER BY expires_at ASC
+            """, (int(now_ts),)) as cur:
+                return await cur.fetchall()
+
+    async def search_quests(self, query: str, offset: int, limit: int, active_only: bool = False):
+        match = fts_match_query(query)
+        if not match:
+            return 0, []
+        active_sql = "AND active = 1" if active_only else ""
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(QUESTS_FTS_COUNT.format(active_sql=active_sql), (match,)) as cur:
+                total = int((await cur.fetchone())[0])
+            async with db.execute(
+                QUESTS_FTS_SEARCH.format(active_sql=active_sql), (match, int(limit), int(offset))
+            ) as cur:
+                rows = await cur.fetchall()
+        return total, [(int(r[0]), r[1], int(r[2]), int(r[3]), r[4]) for r in rows]
+
+    # -------- submissions --------
+    async def create_submission(self, user_id: int, quest_id: int, proof_url: str,
+                                note: str | None) -> tuple[str, int | None, str | None, int]:
+        async def op(db: aiosqlite.Connection):
+            async with db.execute(
+                "SELECT title, reward_envelopes, active FROM quests WHERE quest_id = ?",
+                (int(quest_id),),
+            ) as cur:
+                quest = await cur.fetchone()
+            if not quest:
+                return "missing", None, None, 0
+            title, reward, active = quest
+            if int(active) != 1:
+                return "closed", None, title, int(reward)
+
+            async with db.execute("""
+                INSERT INTO submissions(user_id, quest_id, proof_url, note, status, reward_envelopes_awarded, message_id, channel_id, created_at)
+                VALUES (?, ?, ?, ?, 'PENDING', 0, NULL, NULL, ?)
+                ON CONFLICT(user_id, quest_id) WHERE status IN ('PENDING','APPROVED') DO NOTHING
+                RETURNING submission_id
+            """, (int(user_id), int(quest_id), proof_url, note, int(time.time()))) as cur:
+                row = await cur.fetchone()
             if not row:
-                return None
-            return {
-                "user_id": int(row[0]),
-                "points": int(row[1]),
-                "envelopes": int(row[2]),
-                "dragon": int(row[3]),
-                "rank": int(row[4]),
-                "total": int(row[5]),
-            }
+                return "duplicate", None, title, int(reward)
+            await self._bump(db, submissions_received=1, submissions_pending=1)
+            return "ok", int(row[0]), title, int(reward)
 
+        return await self._write(op)
 
-async def get_rank_context(rank: int, around: int = 2):
-    start_r = max(1, int(rank) - int(around))
-    end_r = int(rank) + int(around)
+    async def update_submission_message(self, submission_id: int, message_id: int, channel_id: int):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(
+                "UPDATE submissions SET message_id=?, channel_id=? WHERE submission_id=?",
+                (int(message_id), int(channel_id), int(submission_id)),
+            )
+            await db.commit()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            WITH ranked AS (
+    async def get_submission(self, submission_id: int):
+        db = await self._connect_with_archive()
+        try:
+            async with db.execute("""
+                SELECT submission_id, user_id, quest_id, proof_url, note, status, reward_envelopes_awarded, message_id, channel_id
+                FROM all_submissions WHERE submission_id = ?
+            """, (int(submission_id),)) as cur:
+                return await cur.fetchone()
+        finally:
+            await db.close()
+
+    async def review_submission(self, submission_id: int, status: str, reward: int, effects=()) -> bool:
+        async def op(db: aiosqlite.Connection) -> bool:
+            async with db.execute(
+                "UPDATE submissions SET status = ?, reward_envelopes_awarded = ?, reviewed_at = ?, "
+                "leased_by = NULL, lease_expires_at = NULL "
+                "WHERE submission_id = ? AND status = 'PENDING' RETURNING user_id",
+                (status, int(reward), int(time.time()), int(submission_id)),
+            ) as cur:
+                row = await cur.fetchone()
+            if not row:
+                return False
+
+            if int(reward) > 0:
+                await self._ensure_user(db, int(row[0]))
+                await self._cache_user(
+                    db, int(row[0]),
+                    "UPDATE users SET envelopes = envelopes + ? WHERE user_id = ? RETURNING envelopes, points, dragon",
+                    (int(reward), int(row[0])),
+                )
+            await self._bump(db, submissions_pending=-1, envelopes_awarded=int(reward),
+                             **{f"submissions_{status.lower()}": 1})
+            await self._enqueue_effects(db, effects)
+            return True
+
+        return await self._write(op)
+
+    async def revoke_submission(self, submission_id: int, effects=()) -> tuple[str | None, bool]:
+        async def op(db: aiosqlite.Connection) -> tuple[str | None, bool]:
+            async with db.execute(
+                "SELECT user_id, status, reward_envelopes_awarded FROM submissions WHERE submission_id = ?",
+                (int(submission_id),),
+            ) as cur:
+                row = await cur.fetchone()
+            if not row:
+                return None, False
+            user_id, status, awarded = int(row[0]), row[1], int(row[2])
+            if status != "APPROVED":
+                return status, False
+
+            await db.execute("UPDATE submissions SET status = 'REVOKED' WHERE submission_id = ?", (int(submission_id),))
+
+            # only take the envelopes back if the user still has them all
+            removed = True
+            if awarded > 0:
+                removed = await self._cache_user(
+                    db, user_id,
+                    "UPDATE users SET envelopes = envelopes - ? WHERE user_id = ? AND envelopes >= ? "
+                    "RETURNING envelopes, points, dragon",
+                    (awarded, user_id, awarded),
+                ) is not None
+            await self._bump(db, submissions_approved=-1, submissions_revoked=1,
+                             envelopes_revoked=awarded if removed else 0)
+            await self._enqueue_effects(db, effects)
+            return status, removed
+
+        return await self._write(op)
+
+    async def count_user_approved(self, user_id: int) -> int:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
                 SELECT
-                    user_id, points, envelopes, dragon,
-                    ROW_NUMBER() OVER (ORDER BY points DESC, dragon DESC, envelopes DESC, user_id ASC) AS r
-                FROM users
-            )
-            SELECT r, user_id, points, envelopes, dragon
-            FROM ranked
-            WHERE r BETWEEN ? AND ?
-            ORDER BY r ASC
-        """, (int(start_r), int(end_r))) as cur:
-            return await cur.fetchall()
-
-
-# -------- quests --------
-async def create_quest(
-    title: str,
-    body: str,
-    bonus: str | None,
-    reward_envelopes: int,
-    image_url: str | None,
-    message_id: int,
-    channel_id: int,
-    expires_at: int | None = None
-) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO quests(title, body, bonus, reward_envelopes, image_url, active, message_id, channel_id, created_at, expires_at)
-            VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
-        """, (
+                    (SELECT COUNT(*) FROM submissions WHERE user_id = ? AND status = 'APPROVED')
+                    + COALESCE((SELECT approved FROM archived_approved WHERE user_id = ?), 0)
+            """, (int(user_id), int(user_id))) as cur:
+                row = await cur.fetchone()
+                return int(row[0]) if row else 0
+
+    async def list_pending_submission_ids(self) -> list[int]:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT submission_id FROM submissions WHERE status='PENDING'") as cur:
+                return [int(r[0]) for r in await cur.fetchall()]
+
+    async def list_unposted_submissions(self) -> list[tuple]:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT submission_id, user_id, quest_id, proof_url, note FROM submissions
+                WHERE status = 'PENDING' AND message_id IS NULL ORDER BY submission_id
+            """) as cur:
+                return [tuple(r) for r in await cur.fetchall()]
+
+    # -------- review queue (leases) --------
+    async def lease_next_submission(self, reviewer_id: int, lease_seconds: int, skip: bool = False):
+        returning = (
+            "RETURNING submission_id, user_id, quest_id, proof_url, note, message_id, channel_id, "
+            "created_at, lease_expires_at"
+        )
+
+        async def op(db: aiosqlite.Connection):
+            now = int(time.time())
+            expires = now + int(lease_seconds)
+            skipped = None
+            if skip:
+                async with db.execute(
+                    "UPDATE submissions SET leased_by = NULL, lease_expires_at = NULL "
+                    "WHERE status = 'PENDING' AND leased_by = ? AND lease_expires_at > ? RETURNING submission_id",
+                    (int(reviewer_id), now),
+                ) as cur:
+                    row = await cur.fetchone()
+                    skipped = int(row[0]) if row else None
+            else:
+                # still holding one: renew it instead of handing out a second
+                async with db.execute(
+                    "UPDATE submissions SET lease_expires_at = ? "
+                    "WHERE submission_id = (SELECT submission_id FROM submissions WHERE status = 'PENDING' "
+                    "AND leased_by = ? AND lease_expires_at > ? LIMIT 1) " + returning,
+                    (expires, int(reviewer_id), now),
+                ) as cur:
+                    row = await cur.fetchone()
+                if row:
+                    return row
+
+            # (status, created_at) index: walk PENDING oldest first, skipping live leases
+            async with db.execute(
+                "UPDATE submissions SET leased_by = ?, lease_expires_at = ? "
+                "WHERE submission_id = (SELECT submission_id FROM submissions "
+                "WHERE status = 'PENDING' AND (lease_expires_at IS NULL OR lease_expires_at <= ?) "
+                "AND submission_id IS NOT ? ORDER BY created_at, submission_id LIMIT 1) " + returning,
+                (int(reviewer_id), expires, now, skipped),
+            ) as cur:
+                return await cur.fetchone()
+
+        return await self._write(op)
+
+    async def review_queue_stats(self, sample: int = 200) -> tuple[int, int, float]:
+        now = int(time.time())
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT COUNT(*), COALESCE(SUM(lease_expires_at > ?), 0)
+                FROM submissions WHERE status = 'PENDING'
+            """, (now,)) as cur:
+                depth, leased = await cur.fetchone()
+            async with db.execute("""
+                SELECT reviewed_at - created_at FROM submissions
+                WHERE reviewed_at IS NOT NULL
+                ORDER BY reviewed_at DESC LIMIT ?
+            """, (int(sample),)) as cur:
+                waits = [int(r[0]) for r in await cur.fetchall()]
+        return int(depth), int(leased), percentile(waits, 50)
+
+    async def list_user_submissions(self, user_id: int, before_id: int | None, limit: int):
+        # (user_id, submission_id) index range scan on each side of the view; titles by primary key
+        before = int(before_id) if before_id is not None else 2 ** 63 - 1
+        db = await self._connect_with_archive()
+        try:
+            async with db.execute("""
+                SELECT submission_id, quest_id, status, reward_envelopes_awarded, created_at
+                FROM all_submissions WHERE user_id = ? AND submission_id < ?
+                ORDER BY submission_id DESC LIMIT ?
+            """, (int(user_id), before, int(limit))) as cur:
+                page = await cur.fetchall()
+            quest_ids = sorted({int(r[1]) for r in page})
+            q_marks = ",".join("?" * len(quest_ids))
+            async with db.execute(f"SELECT quest_id, title FROM all_quests WHERE quest_id IN ({q_marks})", quest_ids) as cur:
+                titles = dict(await cur.fetchall())
+        finally:
+            await db.close()
+        return [(sid, qid, titles.get(qid, "?"), status, awarded, created_at) for sid, qid, status, awarded, created_at in page]
+
+    # -------- archive (cold storage) --------
+    async def archive_batch(self, closed_before: int, limit: int) -> tuple[int, int]:
+        # Own connection (ATTACH can't happen inside the writer's transaction); one short
+        # BEGIN IMMEDIATE per batch, so balance writes only ever wait for one batch.
+        db = await self._connect_with_archive(isolation_level=None)
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                async with db.execute("""
+                    SELECT q.quest_id FROM main.quests q
+                    WHERE q.active = 0
+                      AND COALESCE(q.closed_at, q.expires_at, q.created_at) <= ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM main.submissions s WHERE s.quest_id = q.quest_id AND s.status = 'PENDING'
+                      )
+                    ORDER BY q.quest_id ASC
+                    LIMIT ?
+                """, (int(closed_before), int(limit))) as cur:
+                    quest_ids = [int(r[0]) for r in await cur.fetchall()]
+                if not quest_ids:
+                    await db.execute("ROLLBACK")
+                    return 0, 0
+
+                now = int(time.time())
+                q_marks = ",".join("?" * len(quest_ids))
+                async with db.execute(
+                    f"SELECT submission_id FROM main.submissions WHERE quest_id IN ({q_marks}) "
+                    f"ORDER BY submission_id ASC LIMIT ?",
+                    (*quest_ids, int(limit)),
+                ) as cur:
+                    sub_ids = [int(r[0]) for r in await cur.fetchall()]
+
+                if sub_ids:
+                    s_marks = ",".join("?" * len(sub_ids))
+                    await db.execute(f"""
+                        INSERT OR REPLACE INTO archive.submissions({SUBMISSION_COLUMNS}, archived_at)
+                        SELECT {SUBMISSION_COLUMNS}, ? FROM main.submissions WHERE submission_id IN ({s_marks})
+                    """, (now, *sub_ids))
+                    await db.execute(f"""
+                        INSERT INTO main.archived_approved(user_id, approved)
+                        SELECT user_id, COUNT(*) FROM main.submissions
+                        WHERE submission_id IN ({s_marks}) AND status = 'APPROVED'
+                        GROUP BY user_id
+                        ON CONFLICT(user_id) DO UPDATE SET approved = approved + excluded.approved
+                    """, sub_ids)
+                    await db.execute(f"DELETE FROM main.submissions WHERE submission_id IN ({s_marks})", sub_ids)
+
+                # quests go last, once none of their submissions are left in the hot table
+                async with db.execute(f"""
+                    SELECT q.quest_id FROM main.quests q
+                    WHERE q.quest_id IN ({q_marks})
+                      AND NOT EXISTS (SELECT 1 FROM main.submissions s WHERE s.quest_id = q.quest_id)
+                """, quest_ids) as cur:
+                    done_ids = [int(r[0]) for r in await cur.fetchall()]
+                if done_ids:
+                    d_marks = ",".join("?" * len(done_ids))
+                    await db.execute(f"""
+                        INSERT OR REPLACE INTO archive.quests({QUEST_COLUMNS}, archived_at)
+                        SELECT {QUEST_COLUMNS}, ? FROM main.quests WHERE quest_id IN ({d_marks})
+                    """, (now, *done_ids))
+                    await db.execute(f"DELETE FROM main.quests WHERE quest_id IN ({d_marks})", done_ids)
+
+                await db.execute("COMMIT")
+                return len(done_ids), len(sub_ids)
+            except BaseException:
+                await db.execute("ROLLBACK")
+                raise
+        finally:
+            await db.close()
+
+    async def archive_counts(self) -> dict[str, int]:
+        db = await self._connect_with_archive()
+        try:
+            async with db.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM main.quests),
+                    (SELECT COUNT(*) FROM main.submissions),
+                    (SELECT COUNT(*) FROM archive.quests),
+                    (SELECT COUNT(*) FROM archive.submissions)
+            """) as cur:
+                row = await cur.fetchone()
+        finally:
+            await db.close()
+        return {
+            "hot_quests": int(row[0]),
+            "hot_submissions": int(row[1]),
+            "archived_quests": int(row[2]),
+            "archived_submissions": int(row[3]),
+        }
+
+    # -------- proof index (duplicate screenshots) --------
+    async def record_proof(self, submission_id: int, sha256: str, phash: int | None):
+        bands = phash_bands(phash) if phash is not None else [None] * PHASH_BANDS
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO proof_index(submission_id, sha256, phash, b0, b1, b2, b3)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (int(submission_id), sha256, to_sqlite_int64(phash), *bands))
+            await db.commit()
+
+    async def find_proof_matches(self, sha256: str, phash: int | None, max_distance: int):
+        bands = phash_bands(phash) if phash is not None else [None] * PHASH_BANDS
+        # archived submissions still count: a screenshot from last event is still a reused screenshot
+        # (candidates first: joining a UNION ALL view would scan every submission)
+        db = await self._connect_with_archive()
+        try:
+            async with db.execute("""
+                SELECT submission_id, sha256, phash FROM proof_index
+                WHERE sha256 = ? OR b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?
+                ORDER BY submission_id ASC
+            """, (sha256, *bands)) as cur:
+                candidates = await cur.fetchall()
+            sub_ids = [int(r[0]) for r in candidates]
+            s_marks = ",".join("?" * len(sub_ids))
+            async with db.execute(
+                f"SELECT submission_id, user_id, quest_id FROM all_submissions WHERE submission_id IN ({s_marks})", sub_ids
+            ) as cur:
+                owners = {int(sid): (uid, qid) for sid, uid, qid in await cur.fetchall()}
+        finally:
+            await db.close()
+        rows = [(sid, *owners[sid], sha, ph) for sid, sha, ph in candidates if sid in owners]
+        return filter_proof_matches(rows, sha256, phash, max_distance)
+
+    # -------- daily claim --------
+    async def can_claim_daily(self, user_id: int) -> tuple[bool, int]:
+        now = int(time.time())
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(
+                "SELECT last_claim_at FROM daily_claims WHERE user_id = ?",
+                (int(user_id),),
+            ) as cur:
+                row = await cur.fetchone()
+                last = int(row[0]) if row else 0
+
+            if now - last >= DAILY_COOLDOWN_SECONDS:
+                return True, 0
+            return False, int(DAILY_COOLDOWN_SECONDS - (now - last))
+
+    async def set_daily_claim(self, user_id: int):
+        now = int(time.time())
+
+        async def op(db: aiosqlite.Connection):
+            await db.execute("""
+                INSERT INTO daily_claims(user_id, last_claim_at)
+                VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET last_claim_at = excluded.last_claim_at
+            """, (int(user_id), now))
+
+        await self._write(op)
+
+    # -------- event counters (/event stats) --------
+    async def get_counters(self) -> dict[str, int]:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT name, value FROM event_counters WHERE value != 0") as cur:
+                return {name: int(value) for name, value in await cur.fetchall()}
+
+    # -------- settings (staff-configured, key -> text) --------
+    async def get_setting(self, key: str) -> str | None:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT value FROM settings WHERE key = ?", (key,)) as cur:
+                row = await cur.fetchone()
+                return row[0] if row else None
+
+    async def set_setting(self, key: str, value: str | None):
+        async def op(db: aiosqlite.Connection):
+            if value is None:
+                await db.execute("DELETE FROM settings WHERE key = ?", (key,))
+            else:
+                await db.execute("""
+                    INSERT INTO settings (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (key, str(value)))
+
+        await self._write(op)
+
+    # -------- outbox (Discord side effects) --------
+    async def enqueue_effects(self, effects):
+        async def op(db: aiosqlite.Connection):
+            await self._enqueue_effects(db, effects)
+
+        await self._write(op)
+
+    async def due_effects(self, now: float, limit: int):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("""
+                SELECT outbox_id, kind, channel_id, payload, attempts
+                FROM outbox
+                WHERE dead = 0 AND next_attempt_at <= ?
+                ORDER BY outbox_id ASC
+                LIMIT ?
+            """, (float(now), int(limit))) as cur:
+                return await cur.fetchall()
+
+    async def complete_effect(self, outbox_id: int):
+        async def op(db: aiosqlite.Connection):
+            await db.execute("DELETE FROM outbox WHERE outbox_id = ?", (int(outbox_id),))
+
+        await self._write(op)
+
+    async def fail_effect(self, outbox_id: int, error: str, dead: bool, next_attempt_at: float = 0.0):
+        async def op(db: aiosqlite.Connection):
+            await db.execute("""
+                UPDATE outbox
+                SET attempts = attempts + 1, last_error = ?, dead = ?, next_attempt_at = ?
+                WHERE outbox_id = ?
+            """, (error[:500], 1 if dead else 0, float(next_attempt_at), int(outbox_id)))
+
+        await self._write(op)
+
+    async def count_pending_effects(self) -> int:
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0") as cur:
+                row = await cur.fetchone()
+                return int(row[0]) if row else 0
+
+
+def leaderboard_sort_key(row: tuple) -> tuple:
+    # row = (user_id, envelopes, points, dragon); same order as the SQL ORDER BY
+    user_id, envelopes, points, dragon = row
+    return (-points, -dragon, -envelopes, user_id)
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.users: dict[int, list[int]] = {}  # user_id -> [envelopes, points, dragon]
+        self.quests: dict[int, list] = {}  # quest_id -> row (same columns as SQL)
+        self.submissions: dict[int, list] = {}  # submission_id -> row (same columns as SQL)
+        self.daily_claims: dict[int, int] = {}  # user_id -> last_claim_at
+        self.active_submissions: dict[tuple[int, int], int] = {}  # (user_id, quest_id) -> PENDING/APPROVED submission
+        self.proofs: dict[int, tuple[str, int | None]] = {}  # submission_id -> (sha256, phash)
+        self.proofs_by_sha: dict[str, list[int]] = {}
+        self.proofs_by_band: dict[tuple[int, int], list[int]] = {}  # (band, value) -> submission_ids
+        self.outbox: dict[int, list] = {}  # outbox_id -> [kind, channel_id, payload_json, attempts, next_attempt_at, dead, last_error]
+        self.archived_quests: dict[int, list] = {}  # quest_id -> row + [archived_at]
+        self.archived_submissions: dict[int, list] = {}  # submission_id -> row + [archived_at]
+        self.archived_approved: dict[int, int] = {}  # user_id -> archived APPROVED submissions
+        self.counters: dict[str, int] = {}  # name -> value (event_counters)
+        self.settings: dict[str, str] = {}
+        self.quests_fts = sqlite3.connect(":memory:")  # search index only; rows stay in self.quests
+        self.quests_fts.execute(QUESTS_FTS_TABLE)
+        self._next_quest_id = 1
+        self._next_submission_id = 1
+        self._next_outbox_id = 1
+
+    async def init(self):
+        return
+
+    async def close(self):
+        return
+
+    async def snapshot(self, dest_dir: str, label: str) -> list[str]:
+        return []  # dry-run: nothing on disk to copy
+
+    async def reset_all(self):
+        self.users.clear()
+        self.quests.clear()
+        self.submissions.clear()
+        self.daily_claims.clear()
+        self.active_submissions.clear()
+        self.proofs.clear()
+        self.proofs_by_sha.clear()
+        self.proofs_by_band.clear()
+        self.outbox.clear()
+        self.archived_quests.clear()
+        self.archived_submissions.clear()
+        self.archived_approved.clear()
+        self.counters.clear()
+        self.settings.clear()
+        self.quests_fts.execute("DELETE FROM quests_fts")
+        # a fresh database numbers from 1 again
+        self._next_quest_id = self._next_submission_id = self._next_outbox_id = 1
+
+    def _bump(self, **deltas: int):
+        for name, delta in deltas.items():
+            if delta:
+                self.counters[name] = self.counters.get(name, 0) + int(delta)
+
+    # Mirrors SQLite: ensure_user only sticks when the surrounding write commits,
+    # so read-only paths and refused writes never create a row.
+    def _ensure_user(self, user_id: int) -> list[int]:
+        return self.users.setdefault(int(user_id), [0, 0, 0])
+
+    def _peek_user(self, user_id: int) -> list[int]:
+        return self.users.get(int(user_id)) or [0, 0, 0]
+
+    def _ranked(self, extra_user_id: int | None = None) -> list[tuple]:
+        rows = [(uid, e, p, d) for uid, (e, p, d) in self.users.items()]
+        if extra_user_id is not None and int(extra_user_id) not in self.users:
+            rows.append((int(extra_user_id), 0, 0, 0))
+        rows.sort(key=leaderboard_sort_key)
+        return rows
+
+    # -------- users --------
+    async def add_envelopes(self, user_id: int, amount: int):
+        self._ensure_user(user_id)[0] += int(amount)
+        self._bump(envelopes_granted=int(amount))
+
+    async def grant_envelopes(self, user_ids, amount: int) -> int:
+        unique = dict.fromkeys(int(uid) for uid in user_ids)
+        for uid in unique:
+            self._ensure_user(uid)[0] += int(amount)
+        self._bump(envelopes_granted=int(amount) * len(unique))
+        return len(unique)
+
+    async def get_user_stats(self, user_id: int) -> tuple[int, int, int]:
+        e, p, d = self._peek_user(user_id)
+        return e, p, d
+
+    async def consume_envelope_and_award(self, user_id: int, points: int, is_dragon: bool, tier: str | None = None) -> bool:
+        if self._peek_user(user_id)[0] <= 0:
+            return False
+        u = self._ensure_user(user_id)
+        u[0] -= 1
+        u[1] += int(points)
+        if is_dragon:
+            u[2] += 1
+        self._bump(envelopes_opened=1, points_awarded=int(points), dragon_marks=1 if is_dragon else 0)
+        if tier:
+            self._bump(**{f"tier:{tier}": 1})
+        return True
+
+    async def count_users(self) -> int:
+        return len(self.users)
+
+    async def top_leaderboard_page(self, offset: int, limit: int):
+        ranked = self._ranked()[int(offset):int(offset) + int(limit)]
+        return [(uid, p, e, d) for (uid, e, p, d) in ranked]
+
+    async def adjust_user_field(self, user_id: int, field: str, delta: int) -> tuple[int, int]:
+        if field not in ("envelopes", "points", "dragon"):
+            raise ValueError("Invalid field")
+
+        u = self._ensure_user(user_id)
+        idx = ("envelopes", "points", "dragon").index(field)
+        current = u[idx]
+        new_val = max(0, current + int(delta))
+        u[idx] = new_val
+        self._bump(**{f"{field}_adjusted": new_val - current})
+        if field == "dragon":
+            self._bump(dragon_marks=new_val - current)
+        return current, new_val
+
+    # -------- rank helpers (exact rank + context) --------
+    async def get_rank_row(self, user_id: int):
+        ranked = self._ranked(extra_user_id=user_id)
+        for r, (uid, e, p, d) in enumerate(ranked, start=1):
+            if uid == int(user_id):
+                return {
+                    "user_id": uid,
+                    "points": p,
+                    "envelopes": e,
+                    "dragon": d,
+                    "rank": r,
+                    "total": len(ranked),
+                }
+        return None
+
+    async def get_rank_context(self, rank: int, around: int = 2):
+        start_r = max(1, int(rank) - int(around))
+        end_r = int(rank) + int(around)
+        ranked = self._ranked()
+        return [
+            (r, uid, p, e, d)
+            for r, (uid, e, p, d) in enumerate(ranked, start=1)
+            if start_r <= r <= end_r
+        ]
+
+    # -------- quests --------
+    async def create_quest(
+        self,
+        title: str,
+        body: str,
+        bonus: str | None,
+        reward_envelopes: int,
+        image_url: str | None,
+        message_id: int,
+        channel_id: int,
+        expires_at: int | None = None
+    ) -> int:
+        quest_id = self._next_quest_id
+        self._next_quest_id += 1
+        self.quests[quest_id] = [
+            quest_id,
             title.strip(),
             body.strip(),
             bonus.strip() if bonus else None,
             int(reward_envelopes),
             image_url,
+            1,
             int(message_id) if message_id else None,
             int(channel_id) if channel_id else None,
             int(time.time()),
             int(expires_at) if expires_at else None,
-        ))
-        await db.commit()
-        async with db.execute("SELECT last_insert_rowid()") as cur:
-            row = await cur.fetchone()
-            return int(row[0])
-
-
-async def get_quest(quest_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT quest_id, title, body, bonus, reward_envelopes, image_url, active, message_id, channel_id, created_at, expires_at
-            FROM quests WHERE quest_id = ?
-        """, (int(quest_id),)) as cur:
-            return await cur.fetchone()
-
-
-async def list_active_quests(limit: int = 25):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT quest_id, title, reward_envelopes
-            FROM quests
-            WHERE active = 1
-            ORDER BY quest_id DESC
-            LIMIT ?
-        """, (int(limit),)) as cur:
-            return await cur.fetchall()
-
-
-async def close_quest(quest_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE quests SET active = 0 WHERE quest_id = ?", (int(quest_id),))
-        await db.commit()
+            None,  # closed_at
+        ]
+        q = self.quests[quest_id]
+        self.quests_fts.execute(
+            "INSERT INTO quests_fts(rowid, title, body, bonus, reward, active) VALUES (?, ?, ?, ?, ?, 1)",
+            (quest_id, q[1], q[2], q[3] or "", q[4]),
+        )
+        return quest_id
+
+    async def get_quest(self, quest_id: int):
+        q = self.quests.get(int(quest_id))
+        return tuple(q[:11]) if q else None
+
+    async def list_active_quests(self, limit: int = 25):
+        rows = [(q[0], q[1], q[4]) for q in self.quests.values() if q[6] == 1]
+        rows.sort(key=lambda r: r[0], reverse=True)
+        return rows[:int(limit)]
+
+    async def close_quest(self, quest_id: int, effects=()) -> bool:
+        q = self.quests.get(int(quest_id))
+        if not q or q[6] != 1:
+            return False
+        q[6] = 0
+        q[11] = int(time.time())
+        self.quests_fts.execute("UPDATE quests_fts SET active = 0 WHERE rowid = ?", (int(quest_id),))
+        self._enqueue_effects(effects)
         return True
 
-
-async def get_expired_active_quests(now_ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT quest_id, title, message_id, channel_id, expires_at
-            FROM quests
-            WHERE active = 1
-              AND expires_at IS NOT NULL
-              AND expires_at <= ?
-            ORDER BY expires_at ASC
-        """, (int(now_ts),)) as cur:
-            return await cur.fetchall()
-
-
-# -------- submissions --------
-async def insert_submission(user_id: int, quest_id: int, proof_url: str, note: str | None,
-                            message_id: int, channel_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO submissions(user_id, quest_id, proof_url, note, status, reward_envelopes_awarded, message_id, channel_id, created_at)
-            VALUES (?, ?, ?, ?, 'PENDING', 0, ?, ?, ?)
-        """, (
+    async def get_expired_active_quests(self, now_ts: int):
+        rows = [
+            (q[0], q[1], q[7], q[8], q[10])
+            for q in self.quests.values()
+            if q[6] == 1 and q[10] is not None and q[10] <= int(now_ts)
+        ]
+        rows.sort(key=lambda r: r[4])
+        return rows
+
+    async def search_quests(self, query: str, offset: int, limit: int, active_only: bool = False):
+        match = fts_match_query(query)
+        if not match:
+            return 0, []
+        active_sql = "AND active = 1" if active_only else ""
+        total = int(self.quests_fts.execute(QUESTS_FTS_COUNT.format(active_sql=active_sql), (match,)).fetchone()[0])
+        rows = self.quests_fts.execute(
+            QUESTS_FTS_SEARCH.format(active_sql=active_sql), (match, int(limit), int(offset))
+        ).fetchall()
+        return total, [(int(r[0]), r[1], int(r[2]), int(r[3]), r[4]) for r in rows]
+
+    # -------- submissions --------
+    async def create_submission(self, user_id: int, quest_id: int, proof_url: str,
+                                note: str | None) -> tuple[str, int | None, str | None, int]:
+        q = self.quests.get(int(quest_id))
+        if not q:
+            return "missing", None, None, 0
+        if q[6] != 1:
+            return "closed", None, q[1], q[4]
+        if (int(user_id), int(quest_id)) in self.active_submissions:
+            return "duplicate", None, q[1], q[4]
+
+        submission_id = self._next_submission_id
+        self._next_submission_id += 1
+        self.submissions[submission_id] = [
+            submission_id,
             int(user_id),
             int(quest_id),
             proof_url,
             note,
-            int(message_id) if message_id else None,
-            int(channel_id) if channel_id else None,
+            "PENDING",
+            0,
+            None,
+            None,
             int(time.time()),
-        ))
-        await db.commit()
-        async with db.execute("SELECT last_insert_rowid()") as cur:
-            row = await cur.fetchone()
-            return int(row[0])
+            None,  # leased_by
+            None,  # lease_expires_at
+            None,  # reviewed_at
+        ]
+        self.active_submissions[(int(user_id), int(quest_id))] = submission_id
+        self._bump(submissions_received=1, submissions_pending=1)
+        return "ok", submission_id, q[1], q[4]
+
+    async def update_submission_message(self, submission_id: int, message_id: int, channel_id: int):
+        s = self.submissions.get(int(submission_id))
+        if s:
+            s[7] = int(message_id)
+            s[8] = int(channel_id)
+
+    async def get_submission(self, submission_id: int):
+        s = self.submissions.get(int(submission_id)) or self.archived_submissions.get(int(submission_id))
+        return tuple(s[:9]) if s else None
+
+    def _set_status(self, s: list, status: str):
+        s[5] = status
+        key = (s[1], s[2])
+        if status in ("PENDING", "APPROVED"):
+            self.active_submissions[key] = s[0]
+        elif self.active_submissions.get(key) == s[0]:
+            del self.active_submissions[key]
+
+    async def review_submission(self, submission_id: int, status: str, reward: int, effects=()) -> bool:
+        s = self.submissions.get(int(submission_id))
+        if not s or s[5] != "PENDING":
+            return False
+        self._set_status(s, status)
+        s[6] = int(reward)
+        s[10], s[11], s[12] = None, None, int(time.time())
+        if int(reward) > 0:
+            self._ensure_user(s[1])[0] += int(reward)
+        self._bump(submissions_pending=-1, envelopes_awarded=int(reward), **{f"submissions_{status.lower()}": 1})
+        self._enqueue_effects(effects)
+        return True
 
+    async def revoke_submission(self, submission_id: int, effects=()) -> tuple[str | None, bool]:
+        s = self.submissions.get(int(submission_id))
+        if not s:
+            return None, False
+        status = s[5]
+        if status != "APPROVED":
+            return status, False
+
+        self._set_status(s, "REVOKED")
+        awarded = s[6]
+        removed = True
+        if awarded > 0:
+            u = self.users.get(s[1])
+            removed = bool(u) and u[0] >= awarded
+            if removed:
+                u[0] -= awarded
+        self._bump(submissions_approved=-1, submissions_revoked=1, envelopes_revoked=awarded if removed else 0)
+        self._enqueue_effects(effects)
+        return status, removed
+
+    async def count_user_approved(self, user_id: int) -> int:
+        hot = sum(1 for s in self.submissions.values() if s[1] == int(user_id) and s[5] == "APPROVED")
+        return hot + self.archived_approved.get(int(user_id), 0)
+
+    async def list_pending_submission_ids(self) -> list[int]:
+        return [sid for sid, s in self.submissions.items() if s[5] == "PENDING"]
+
+    async def list_unposted_submissions(self) -> list[tuple]:
+        return [
+            tuple(s[:5]) for sid, s in sorted(self.submissions.items())
+            if s[5] == "PENDING" and s[7] is None
+        ]
+
+    # -------- review queue (leases) --------
+    async def lease_next_submission(self, reviewer_id: int, lease_seconds: int, skip: bool = False):
+        now = int(time.time())
+        pending = sorted((s for s in self.submissions.values() if s[5] == "PENDING"), key=lambda s: (s[9], s[0]))
+        held = next((s for s in pending if s[10] == int(reviewer_id) and (s[11] or 0) > now), None)
+        skipped = None
+        if held and skip:
+            held[10] = held[11] = None
+            skipped = held[0]
+        elif held:
+            held[11] = now + int(lease_seconds)
+            return (held[0], held[1], held[2], held[3], held[4], held[7], held[8], held[9], held[11])
+
+        for s in pending:
+            if (s[11] is None or s[11] <= now) and s[0] != skipped:
+                s[10], s[11] = int(reviewer_id), now + int(lease_seconds)
+                return (s[0], s[1], s[2], s[3], s[4], s[7], s[8], s[9], s[11])
+        return None
+
+    async def review_queue_stats(self, sample: int = 200) -> tuple[int, int, float]:
+        now = int(time.time())
+        pending = [s for s in self.submissions.values() if s[5] == "PENDING"]
+        leased = sum(1 for s in pending if (s[11] or 0) > now)
+        reviewed = sorted((s for s in self.submissions.values() if s[12] is not None), key=lambda s: s[12], reverse=True)
+        waits = [s[12] - s[9] for s in reviewed[:int(sample)]]
+        return len(pending), leased, percentile(waits, 50)
+
+    async def list_user_submissions(self, user_id: int, before_id: int | None, limit: int):
+        rows = []
+        for s in [*self.submissions.values(), *self.archived_submissions.values()]:
+            if s[1] != int(user_id) or (before_id is not None and s[0] >= int(before_id)):
+                continue
+            q = self.quests.get(s[2]) or self.archived_quests.get(s[2])
+            rows.append((s[0], s[2], q[1] if q else "?", s[5], s[6], s[9]))
+        rows.sort(key=lambda r: r[0], reverse=True)
+        return rows[:int(limit)]
+
+    # -------- archive (cold storage) --------
+    async def archive_batch(self, closed_before: int, limit: int) -> tuple[int, int]:
+        by_quest: dict[int, list[int]] = {}
+        pending_quests = set()
+        for sid, s in self.submissions.items():
+            by_quest.setdefault(s[2], []).append(sid)
+            if s[5] == "PENDING":
+                pending_quests.add(s[2])
+
+        quest_ids = sorted(
+            qid for qid, q in self.quests.items()
+            if q[6] == 0 and (q[11] or q[10] or q[9]) <= int(closed_before) and qid not in pending_quests
+        )[:int(limit)]
+        if not quest_ids:
+            return 0, 0
+
+        now = int(time.time())
+        sub_ids = sorted(sid for qid in quest_ids for sid in by_quest.get(qid, []))[:int(limit)]
+        for sid in sub_ids:
+            s = self.submissions.pop(sid)
+            if s[5] == "APPROVED":
+                self.archived_approved[s[1]] = self.archived_approved.get(s[1], 0) + 1
+            self.archived_submissions[sid] = s[:10] + [now]
+
+        moved_subs = set(sub_ids)
+        done_ids = [qid for qid in quest_ids if all(sid in moved_subs for sid in by_quest.get(qid, []))]
+        for qid in done_ids:
+            self.archived_quests[qid] = self.quests.pop(qid) + [now]
+        return len(done_ids), len(sub_ids)
+
+    async def archive_counts(self) -> dict[str, int]:
+        return {
+            "hot_quests": len(self.quests),
+            "hot_submissions": len(self.submissions),
+            "archived_quests": len(self.archived_quests),
+            "archived_submissions": len(self.archived_submissions),
+        }
+
+    # -------- proof index (duplicate screenshots) --------
+    async def record_proof(self, submission_id: int, sha256: str, phash: int | None):
+        sid = int(submission_id)
+        self.proofs[sid] = (sha256, phash)
+        self.proofs_by_sha.setdefault(sha256, []).append(sid)
+        if phash is not None:
+            for band, value in enumerate(phash_bands(phash)):
+                self.proofs_by_band.setdefault((band, value), []).append(sid)
+
+    async def find_proof_matches(self, sha256: str, phash: int | None, max_distance: int):
+        candidates = set(self.proofs_by_sha.get(sha256, []))
+        if phash is not None:
+            for band, value in enumerate(phash_bands(phash)):
+                candidates.update(self.proofs_by_band.get((band, value), []))
+
+        rows = []
+        for sid in sorted(candidates):
+            s = self.submissions.get(sid) or self.archived_submissions.get(sid)
+            if not s:
+                continue
+            p_sha, p_phash = self.proofs[sid]
+            rows.append((sid, s[1], s[2], p_sha, p_phash))
+        return filter_proof_matches(rows, sha256, phash, max_distance)
+
+    # -------- daily claim --------
+    async def can_claim_daily(self, user_id: int) -> tuple[bool, int]:
+        now = int(time.time())
+        last = self.daily_claims.get(int(user_id), 0)
+        if now - last >= DAILY_COOLDOWN_SECONDS:
+            return True, 0
+        return False, int(DAILY_COOLDOWN_SECONDS - (now - last))
 
-async def update_submission_message(submission_id: int, message_id: int, channel_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE submissions SET message_id=?, channel_id=? WHERE submission_id=?",
-            (int(message_id), int(channel_id), int(submission_id)),
-        )
-        await db.commit()
+    async def set_daily_claim(self, user_id: int):
+        self.daily_claims[int(user_id)] = int(time.time())
 
+    # -------- outbox (Discord side effects) --------
+    def _enqueue_effects(self, effects):
+        for kind, channel_id, payload in effects:
+            self.outbox[self._next_outbox_id] = [kind, int(channel_id), json.dumps(payload), 0, 0.0, 0, None]
+            self._next_outbox_id += 1
 
-async def get_submission(submission_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT submission_id, user_id, quest_id, proof_url, note, status, reward_envelopes_awarded, message_id, channel_id
-            FROM submissions WHERE submission_id = ?
-        """, (int(submission_id),)) as cur:
-            return await cur.fetchone()
+    async def enqueue_effects(self, effects):
+        self._enqueue_effects(effects)
 
+    # -------- event counters (/event stats) --------
+    async def get_counters(self) -> dict[str, int]:
+        return {name: value for name, value in self.counters.items() if value}
 
-async def set_submission_status(submission_id: int, status: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE submissions SET status = ? WHERE submission_id = ?", (status, int(submission_id)))
-        await db.commit()
+    # -------- settings (staff-configured, key -> text) --------
+    async def get_setting(self, key: str) -> str | None:
+        return self.settings.get(key)
 
+    async def set_setting(self, key: str, value: str | None):
+        if value is None:
+            self.settings.pop(key, None)
+        else:
+            self.settings[key] = str(value)
 
-async def mark_submission_award(submission_id: int, reward_envelopes_awarded: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE submissions
-            SET reward_envelopes_awarded = ?
-            WHERE submission_id = ?
-        """, (int(reward_envelopes_awarded), int(submission_id)))
-        await db.commit()
+    async def due_effects(self, now: float, limit: int):
+        rows = [
+            (oid, e[0], e[1], e[2], e[3])
+            for oid, e in self.outbox.items()
+            if not e[5] and e[4] <= float(now)
+        ]
+        return rows[:int(limit)]
 
+    async def complete_effect(self, outbox_id: int):
+        self.outbox.pop(int(outbox_id), None)
 
-async def user_has_submission_for_quest(user_id: int, quest_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT COUNT(*)
-            FROM submissions
-            WHERE user_id = ? AND quest_id = ? AND status IN ('PENDING','APPROVED')
-        """, (int(user_id), int(quest_id))) as cur:
-            row = await cur.fetchone()
-            return int(row[0]) > 0
+    async def fail_effect(self, outbox_id: int, error: str, dead: bool, next_attempt_at: float = 0.0):
+        e = self.outbox.get(int(outbox_id))
+        if e:
+            e[3] += 1
+            e[4] = float(next_attempt_at)
+            e[5] = 1 if dead else 0
+            e[6] = error[:500]
 
+    async def count_pending_effects(self) -> int:
+        return sum(1 for e in self.outbox.values() if not e[5])
 
-async def count_user_approved(user_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT COUNT(*)
-            FROM submissions
-            WHERE user_id = ? AND status = 'APPROVED'
-        """, (int(user_id),)) as cur:
-            row = await cur.fetchone()
-            return int(row[0]) if row else 0
 
+def make_storage() -> Storage:
+    if STORAGE_BACKEND == "memory":
+        return MemoryStorage()
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(DB_PATH)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND!r} (use 'sqlite' or 'memory')")
 
-# -------- daily claim --------
-async def can_claim_daily(user_id: int) -> tuple[bool, int]:
-    now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute(
-            "SELECT last_claim_at FROM daily_claims WHERE user_id = ?",
-            (int(user_id),),
-        ) as cur:
-            row = await cur.fetchone()
-            last = int(row[0]) if row else 0
 
-        if now - last >= DAILY_COOLDOWN_SECONDS:
-            return True, 0
-        return False, int(DAILY_COOLDOWN_SECONDS - (now - last))
+storage = make_storage()
+trace_methods(storage, "db")
 
 
-async def set_daily_claim(user_id: int):
-    now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO daily_claims(user_id, last_claim_at)
-            VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET last_claim_at = excluded.last_claim_at
-        """, (int(user_id), now))
-        await db.commit()
+# =========================
+# PROOF STORE
+# =========================
+def perceptual_hash(data: bytes) -> int | None:
+    # 64-bit difference hash (dHash): survives re-encoding, resizing and light edits
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.draft("L", (72, 64))  # cheap JPEG downscale before decoding
+            small = im.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    px = list(small.getdata())
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = (h << 1) | (1 if px[row * 9 + col] > px[row * 9 + col + 1] else 0)
+    return h
+
+
+class ProofStore:
+    # Screenshots are stored once under their SHA-256 (Discord CDN links expire).
+    # Thumbnails are generated on demand into a size-capped, LRU-evicted cache.
+    # Methods here block on disk/image work: call them through asyncio.to_thread.
+    def __init__(self, root: str, thumb_cache_bytes: int):
+        self.root = root
+        self.thumb_dir = os.path.join(root, "thumbs")
+        self.thumb_cache_bytes = int(thumb_cache_bytes)
+        self._thumbs: OrderedDict[str, int] | None = None  # sha256 -> bytes, least recent first
+        self._thumb_total = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def put(self, data: bytes) -> tuple[str, int | None]:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path_for(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return sha256, perceptual_hash(data)
+
+    def _load_thumb_index(self):
+        if self._thumbs is not None:
+            return
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.thumb_dir):
+            st = os.stat(os.path.join(self.thumb_dir, name))
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        entries.sort()
+        self._thumbs = OrderedDict((sha, size) for _, sha, size in entries)
+        self._thumb_total = sum(size for _, _, size in entries)
+
+    def thumbnail(self, sha256: str) -> str | None:
+        tpath = os.path.join(self.thumb_dir, f"{sha256}.jpg")
+        with self._lock:
+            self._load_thumb_index()
+            if sha256 in self._thumbs:
+                self._thumbs.move_to_end(sha256)
+                os.utime(tpath)  # keep LRU order across restarts
+                return tpath
+
+        src = self.path_for(sha256)
+        if not os.path.exists(src):
+            return None
+        try:
+            with Image.open(src) as im:
+                im.thumbnail((PROOF_THUMB_SIZE, PROOF_THUMB_SIZE))
+                im.convert("RGB").save(tpath, "JPEG", quality=80)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+
+        with self._lock:
+            size = os.path.getsize(tpath)
+            self._thumb_total += size - self._thumbs.pop(sha256, 0)
+            self._thumbs[sha256] = size
+            while self._thumb_total > self.thumb_cache_bytes and len(self._thumbs) > 1:
+                old_sha, old_size = self._thumbs.popitem(last=False)
+                self._thumb_total -= old_size
+                try:
+                    os.remove(os.path.join(self.thumb_dir, f"{old_sha}.jpg"))
+                except FileNotFoundError:
+                    pass
+        return tpath
+
+
+proof_store = ProofStore(PROOF_DIR, int(PROOF_THUMB_CACHE_MB * 1024 * 1024))
+
+
+# =========================
+# REST DISPATCHER (priority lanes)
+# =========================
+# Every outbound REST call takes a slot in one lane. When slots free up, waiting lanes are
+# served strictly in priority order, and each lane has its own concurrency cap. A ledger
+# burst can therefore only ever hold its own lane's slots and never queues ahead of a reply.
+REST_LANES = {
+    # name: (priority, max concurrent requests)
+    "interaction": (0, 10),  # interaction callbacks + followups
+    "review": (1, 3),  # staff review embeds / edits
+    "notify": (2, 2),  # player notifications and anything untagged
+    "ledger": (3, 1),  # ledger channel lines
+    "board": (4, 1),  # live leaderboard edits
+}
+REST_MAX_INFLIGHT = 12
+
+current_rest_lane: contextvars.ContextVar[str] = contextvars.ContextVar("current_rest_lane", default="notify")
+
+
+@contextlib.contextmanager
+def rest_lane(name: str):
+    # REST calls made inside this block (same task) go through lane `name`
+    token = current_rest_lane.set(name)
+    try:
+        yield
+    finally:
+        current_rest_lane.reset(token)
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+class RestLane:
+    def __init__(self, name: str, priority: int, limit: int):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.inflight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.served = 0
+        self.waits: deque[float] = deque(maxlen=500)  # recent queue wait times (seconds)
+
+
+class RestDispatcher:
+    def __init__(self, lanes: dict[str, tuple[int, int]], max_inflight: int):
+        self.lanes = {name: RestLane(name, prio, limit) for name, (prio, limit) in lanes.items()}
+        self.by_priority = sorted(self.lanes.values(), key=lambda lane: lane.priority)
+        self.max_inflight = max_inflight
+        self.inflight = 0
+
+    def _can_start(self, lane: RestLane) -> bool:
+        return lane.inflight < lane.limit and self.inflight < self.max_inflight
+
+    def _pump(self):
+        for lane in self.by_priority:
+            while lane.waiters and self._can_start(lane):
+                fut = lane.waiters.popleft()
+                if fut.done():  # waiter was cancelled
+                    continue
+                lane.inflight += 1
+                self.inflight += 1
+                fut.set_result(None)
+
+    def _release(self, lane: RestLane):
+        lane.inflight -= 1
+        self.inflight -= 1
+        self._pump()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane_name: str):
+        lane = self.lanes.get(lane_name) or self.lanes["notify"]
+        t0 = time.monotonic()
+        higher_waiting = any(l.waiters for l in self.by_priority if l.priority < lane.priority)
+        if self._can_start(lane) and not lane.waiters and not higher_waiting:
+            lane.inflight += 1
+            self.inflight += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            lane.waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():  # slot was granted just as we got cancelled
+                    self._release(lane)
+                raise
+        lane.waits.append(time.monotonic() - t0)
+        lane.served += 1
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {
+                "lane": lane.name,
+                "depth": sum(1 for f in lane.waiters if not f.done()),
+                "inflight": lane.inflight,
+                "served": lane.served,
+                "wait_p50": percentile(lane.waits, 50),
+                "wait_p95": percentile(lane.waits, 95),
+            }
+            for lane in self.by_priority
+        ]
+
+
+rest_dispatcher = RestDispatcher(REST_LANES, REST_MAX_INFLIGHT)
+
+
+def install_rest_dispatcher(client: discord.Client):
+    # Bot REST calls: lane comes from the caller's context (rest_lane(...))
+    http_request = client.http.request
+
+    async def request(route, **kwargs):
+        lane = current_rest_lane.get()
+        t0 = time.perf_counter()
+        async with rest_dispatcher.slot(lane):
+            try:
+                with span(f"{route.method} {route.path}", "rest", lane=lane, queued_ms=round((time.perf_counter() - t0) * 1000, 1)):
+                    return await http_request(route, **kwargs)
+            finally:
+                log.debug("rest", extra={"fields": {
+                    "route": f"{route.method} {route.path}", "lane": lane,
+                    "ms": round((time.perf_counter() - t0) * 1000, 1),
+                }})
+
+    client.http.request = request
+
+    # Interaction responses/followups don't use client.http: discord.py sends them through
+    # its webhook adapter, so that's where the "interaction" lane is attached.
+    adapter_cls = discord.webhook.async_.AsyncWebhookAdapter
+    if getattr(adapter_cls.request, "_rest_lane_wrapped", False):
+        return
+    adapter_request = adapter_cls.request
+
+    async def adapter_request_in_lane(self, route, *args, **kwargs):
+        lane = "interaction" if "webhook_token" in route.path else current_rest_lane.get()
+        t0 = time.perf_counter()
+        async with rest_dispatcher.slot(lane):
+            try:
+                with span(f"{route.method} {route.path}", "rest", lane=lane, queued_ms=round((time.perf_counter() - t0) * 1000, 1)):
+                    return await adapter_request(self, route, *args, **kwargs)
+            finally:
+                log.debug("rest", extra={"fields": {
+                    "route": f"{route.method} {route.path}", "lane": lane,
+                    "ms": round((time.perf_counter() - t0) * 1000, 1),
+                }})
+
+    adapter_request_in_lane._rest_lane_wrapped = True
+    adapter_cls.request = adapter_request_in_lane
+
+
+# =========================
+# EVENT LOOP WATCHDOG
+# =========================
+# A task wakes up every LOOP_LAG_INTERVAL and records how late it was (scheduling lag).
+# A separate thread watches that heartbeat: when the loop has been stuck for longer than the
+# threshold, it grabs the loop thread's current stack, i.e. the code that is blocking it.
+LOOP_LAG_INTERVAL = 0.1  # seconds
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: deque[float] = deque(maxlen=3000)  # recent lag samples (seconds)
+        self.max_lag = 0.0
+        self.stalls: deque[tuple[float, float, str]] = deque(maxlen=10)  # (unix time, seconds blocked, stack)
+        self.stall_count = 0
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: int | None = None
+        self._stop = threading.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self.loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                t0 = time.monotonic()
+                self.heartbeat = t0
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.monotonic() - t0 - self.interval)
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        captured_for = None  # heartbeat already reported (one stack per stall)
+        while not self._stop.wait(self.threshold / 4):
+            beat = self.heartbeat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or captured_for == beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            captured_for = beat
+            self.stall_count += 1
+            self.stalls.append((time.time(), blocked, stack))
+            log.warning("Event loop blocked", extra={"fields": {"blocked_ms": round(blocked * 1000), "stack": stack}})
+
+    def snapshot(self) -> dict:
+        lags = list(self.lags)
+        return {
+            "p50": percentile(lags, 50),
+            "p95": percentile(lags, 95),
+            "p99": percentile(lags, 99),
+            "max": self.max_lag,
+            "stalls": self.stall_count,
+        }
+
+
+loop_watchdog = LoopWatchdog(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD_MS / 1000)
+
+
+# =========================
+# USER LOCKS (striped)
+# =========================
+# Each write is atomic in SQL, but a command is a read -> write -> read sequence (check the
+# daily cooldown, then claim; open, then show the new totals). Commands hold their user's lock
+# for that sequence. Users hash onto a fixed number of stripes, so the table is bounded, and a
+# stripe's lock only exists while someone holds or waits for it. Never nest hold() for one user.
+USER_LOCK_STRIPES = 4096
+
+
+class UserLocks:
+    def __init__(self, stripes: int):
+        self.stripes = stripes
+        self.table: dict[int, list] = {}  # stripe -> [asyncio.Lock, holders + waiters]
+        self.acquired = 0
+        self.contended = 0
+
+    def stripe_for(self, user_id: int) -> int:
+        # snowflake low bits are mostly a small counter: mix before taking the modulo
+        return (((int(user_id) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % self.stripes
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id: int):
+        stripe = self.stripe_for(user_id)
+        entry = self.table.get(stripe)
+        if entry is None:
+            entry = self.table[stripe] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        if entry[0].locked():
+            self.contended += 1
+        try:
+            async with entry[0]:
+                self.acquired += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.table[stripe]
+
+
+user_locks = UserLocks(USER_LOCK_STRIPES)
+
+
+# =========================
+# ADMISSION CONTROL (load shedding)
+# =========================
+# Every interaction takes a slot in its class before any work starts. When a class is full, a
+# few more may wait (at most ADMISSION_MAX_WAIT, well inside Discord's 3s to answer); anything
+# beyond that is turned away at once with a friendly reply, instead of piling onto the DB and
+# REST lanes until every interaction times out. Staff have their own slots, so reviews and
+# fixes still get through while players flood /event open.
+ADMISSION_CLASSES = {
+    # class: (max running, max waiting)
+    "read": (32, 64),  # balance, rank, leaderboard, quests, mysubmissions, page buttons
+    "write": (16, 32),  # ADMISSION_WRITE_COMMANDS
+    "staff": (4, 8),  # every "(Staff)" command + review buttons
+}
+ADMISSION_WRITE_COMMANDS = {"open", "daily", "submit"}
+ADMISSION_MAX_WAIT = 1.5  # seconds
+BUSY_MESSAGE = "🐉 The dragon is busy right now, try again in a few seconds!"
+
+
+def admission_class(interaction: discord.Interaction) -> str:
+    command = interaction.command
+    if command is None:  # component click
+        custom_id = (interaction.data or {}).get("custom_id", "")
+        return "staff" if custom_id.startswith("review:") else "read"
+    if command.description.startswith("(Staff)"):
+        return "staff"
+    return "write" if command.name in ADMISSION_WRITE_COMMANDS else "read"
+
+
+class AdmissionClass:
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.running = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.peak_depth = 0
+        self.admitted = 0
+        self.rejected = 0  # queue was full
+        self.timed_out = 0  # waited ADMISSION_MAX_WAIT without getting a slot
+        self.waits: deque[float] = deque(maxlen=500)  # recent queue wait times (seconds)
+
+
+class AdmissionController:
+    def __init__(self, classes: dict[str, tuple[int, int]], max_wait: float, enabled: bool = True):
+        self.classes = {name: AdmissionClass(name, limit, size) for name, (limit, size) in classes.items()}
+        self.max_wait = max_wait
+        self.enabled = enabled
+
+    def _release(self, cls: AdmissionClass):
+        # hand the slot straight to the oldest waiter, if any
+        while cls.waiters:
+            fut = cls.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        cls.running -= 1
+
+    async def acquire(self, name: str) -> bool:
+        cls = self.classes[name]
+        t0 = time.monotonic()
+        if cls.running < cls.limit and not cls.waiters:
+            cls.running += 1
+        elif len(cls.waiters) >= cls.queue_size:
+            cls.rejected += 1
+            return False
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            cls.waiters.append(fut)
+            cls.peak_depth = max(cls.peak_depth, len(cls.waiters))
+            try:
+                await asyncio.wait_for(fut, self.max_wait)
+            except asyncio.TimeoutError:
+                with contextlib.suppress(ValueError):
+                    cls.waiters.remove(fut)
+                cls.timed_out += 1
+                return False
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():  # slot was granted just as we got cancelled
+                    self._release(cls)
+                else:
+                    with contextlib.suppress(ValueError):
+                        cls.waiters.remove(fut)
+                raise
+        cls.waits.append(time.monotonic() - t0)
+        cls.admitted += 1
+        return True
+
+    async def admit(self, interaction: discord.Interaction) -> bool:
+        # called from interaction_check: the slot is held until the interaction's task finishes
+        if not self.enabled:
+            return True
+        name = admission_class(interaction)
+        if not await self.acquire(name):
+            log.debug("Interaction turned away", extra={"fields": {"class": name}})
+            try:
+                await interaction.response.send_message(BUSY_MESSAGE, ephemeral=True)
+            except discord.HTTPException as e:
+                swallowed.warn("admission.busy_reply", "Busy reply failed", e)
+            return False
+        cls = self.classes[name]
+        task = asyncio.current_task()
+        if task is None:
+            self._release(cls)
+        else:
+            task.add_done_callback(lambda _t: self._release(cls))
+        return True
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {
+                "class": cls.name,
+                "running": cls.running,
+                "limit": cls.limit,
+                "depth": sum(1 for f in cls.waiters if not f.done()),
+                "queue_size": cls.queue_size,
+                "peak_depth": cls.peak_depth,
+                "admitted": cls.admitted,
+                "rejected": cls.rejected,
+                "timed_out": cls.timed_out,
+                "wait_p95": percentile(cls.waits, 95),
+            }
+            for cls in self.classes.values()
+        ]
+
+
+admission = AdmissionController(ADMISSION_CLASSES, ADMISSION_MAX_WAIT, ADMISSION_CONTROL)
 
 
 # =========================
@@ -528,15 +3034,18 @@ def msg_link(guild_id: int, channel_id: int, message_id: int) -> str:
 
 
 async def log_ledger(guild: discord.Guild | None, text: str):
+    # handlers run this through spawn_background: the ledger lane is the slowest one, and an
+    # interaction reply must never wait behind it
     if LEDGER_CHANNEL_ID == 0 or guild is None:
         return
     ch = guild.get_channel(LEDGER_CHANNEL_ID)
     if not ch:
         return
     try:
-        await ch.send(text)
-    except (discord.Forbidden, discord.HTTPException):
-        return
+        with rest_lane("ledger"):
+            await ch.send(text)
+    except (discord.Forbidden, discord.HTTPException) as e:
+        swallowed.warn("ledger.send", "Ledger message not sent", e, channel=LEDGER_CHANNEL_ID)
 
 
 def tier_thumbnail_for_key(key: str) -> str:
@@ -552,93 +3061,298 @@ def tier_thumbnail_for_key(key: str) -> str:
     return OPEN_THUMBNAIL_URL  # fallback (maybe empty)
 
 
-async def safe_send(channel: discord.abc.Messageable | None, content: str = "", embed: discord.Embed | None = None):
-    if not channel:
+background_tasks: set[asyncio.Task] = set()  # strong refs so fire-and-forget tasks aren't GC'd mid-flight
+
+
+def spawn_background(coro, name: str | None = None) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    task.add_done_callback(log_background_failure)  # runs in the spawner's context: same correlation ID
+    return task
+
+
+def log_background_failure(task: asyncio.Task):
+    if task.cancelled() or task.exception() is None:
         return
-    try:
-        await channel.send(content=content, embed=embed)
-    except Exception:
-        pass
+    log.error("Background task failed", exc_info=task.exception(), extra={"fields": {"task": task.get_name()}})
 
 
 async def auto_close_loop(bot: commands.Bot):
     await bot.wait_until_ready()
+    correlation_id.set("auto-close")
     while not bot.is_closed():
         try:
             now_ts = int(time.time())
-            expired = await get_expired_active_quests(now_ts)
+            expired = await storage.get_expired_active_quests(now_ts)
 
             for (quest_id, title, message_id, channel_id, expires_at) in expired:
-                await close_quest(int(quest_id))
-
-                # Try to edit the original quest message to show CLOSED (best-effort)
-                try:
-                    for g in bot.guilds:
-                        ch = g.get_channel(int(channel_id)) if channel_id else None
-                        if not ch:
-                            continue
-                        msg = await ch.fetch_message(int(message_id)) if message_id else None
-                        if not msg or not msg.embeds:
-                            continue
-
-                        emb = msg.embeds[0]
-                        emb.title = f"🔒 (CLOSED) {emb.title}"
-                        # move status info to a field (footer must be alone)
-                        emb.add_field(name="Status", value="Auto-closed (time expired).", inline=False)
-                        emb.set_footer(text=FOOTER_DEV)
-                        await msg.edit(embed=emb)
-                        break
-                except Exception:
-                    pass
+                # the CLOSED edit is queued in the same commit, so it survives crashes/429s
+                effects = [effect_quest_closed(channel_id, message_id)] if channel_id and message_id else []
+                if not await storage.close_quest(int(quest_id), effects=effects):
+                    continue
+                outbox_worker.wake()
 
                 await log_ledger(
                     bot.guilds[0] if bot.guilds else None,
                     f"⏳ AUTO-CLOSED • Quest#{quest_id} • “{title}”"
                 )
 
-        except Exception:
-            pass
+        except Exception as e:
+            swallowed.warn("auto_close", "Auto-close pass failed", e)
 
         await asyncio.sleep(60)
 
 
+ARCHIVE_BATCH_SIZE = 200  # rows per archive transaction
+ARCHIVE_BATCH_PAUSE = 0.05  # seconds between batches, lets queued writes through
+
+archive_lock = asyncio.Lock()
+
+
+async def run_archive(older_than_hours: float = ARCHIVE_AFTER_HOURS) -> tuple[int, int]:
+    # Small batches until nothing is left; -> (quests archived, submissions archived)
+    closed_before = int(time.time() - older_than_hours * 3600)
+    total_q = total_s = 0
+    async with archive_lock:
+        while True:
+            moved_q, moved_s = await storage.archive_batch(closed_before, ARCHIVE_BATCH_SIZE)
+            total_q += moved_q
+            total_s += moved_s
+            if moved_q == 0 and moved_s == 0:
+                return total_q, total_s
+            await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+
+
+async def archive_loop(bot: commands.Bot):
+    await bot.wait_until_ready()
+    correlation_id.set("archive")
+    while not bot.is_closed():
+        try:
+            quests, submissions = await run_archive()
+            if quests or submissions:
+                log.info("archived", extra={"fields": {"quests": quests, "submissions": submissions}})
+        except Exception as e:
+            swallowed.warn("archive", "Archive job failed", e)
+
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+snapshot_lock = asyncio.Lock()
+
+
+def rotate_snapshots(snapshot_dir: str, keep: int):
+    # keep the newest `keep` snapshots; ones taken right before a reset are never deleted
+    labels = sorted({name.split(".", 1)[0] for name in os.listdir(snapshot_dir) if name.endswith(".db")})
+    rotating = [label for label in labels if not label.endswith("-reset")]
+    for label in rotating[:max(0, len(rotating) - keep)]:
+        for suffix in (".db", ".archive.db"):
+            try:
+                os.remove(os.path.join(snapshot_dir, f"{label}{suffix}"))
+            except FileNotFoundError:
+                pass
+
+
+async def take_snapshot(reason: str) -> list[str]:
+    label = time.strftime("%Y%m%d-%H%M%S", time.gmtime()) + f"-{reason}"
+    async with snapshot_lock:
+        paths = await storage.snapshot(SNAPSHOT_DIR, label)
+        if paths:
+            await asyncio.to_thread(rotate_snapshots, SNAPSHOT_DIR, SNAPSHOT_KEEP)
+    return paths
+
+
+async def snapshot_loop(bot: commands.Bot):
+    if SNAPSHOT_INTERVAL_HOURS <= 0:
+        return
+    await bot.wait_until_ready()
+    correlation_id.set("snapshot")
+    while not bot.is_closed():
+        await asyncio.sleep(SNAPSHOT_INTERVAL_HOURS * 3600)
+        try:
+            paths = await take_snapshot("scheduled")
+            if paths:
+                log.info("snapshot saved", extra={"fields": {"paths": paths}})
+        except Exception as e:
+            swallowed.warn("snapshot", "Snapshot failed", e)
+
+
 # =========================
-# APPROVAL VIEW (PERSISTENT)
+# OUTBOX (durable Discord side effects)
 # =========================
-class ReviewView(discord.ui.View):
-    def __init__(self, submission_id: int):
-        super().__init__(timeout=None)
-        self.submission_id = int(submission_id)
+# Edits/notifications that follow a state change are stored as outbox rows in the same
+# commit as that change, then delivered by OutboxWorker. Delivery is at-least-once: a row
+# is deleted only after Discord accepted the call, so edits are written to be idempotent.
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_BATCH = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_BACKOFF = 2.0  # seconds, doubled per failed attempt
+OUTBOX_MAX_BACKOFF = 300.0
+OUTBOX_CHANNEL_INTERVAL = 1.0  # min seconds between two deliveries in the same channel
 
-        self.approve.custom_id = f"review:approve:{self.submission_id}"
-        self.reject.custom_id = f"review:reject:{self.submission_id}"
 
-    async def finalize_message(self, interaction: discord.Interaction, status: str, status_text: str):
-        # Disable buttons
-        for item in self.children:
-            item.disabled = True
+def effect_send(channel_id: int, content: str):
+    return ("send", int(channel_id), {"content": content})
 
-        embed = interaction.message.embeds[0] if interaction.message.embeds else discord.Embed(color=COLOR_RED)
 
-        # Put final status in a field (footer must remain alone)
-        embed.add_field(name="Review Result", value=status_text, inline=False)
-        embed.set_footer(text=FOOTER_DEV)
+def effect_quest_closed(channel_id: int, message_id: int):
+    return ("quest_closed", int(channel_id), {"message_id": int(message_id)})
+
+
+def effect_review_result(channel_id: int, message_id: int, submission_id: int, status_text: str):
+    return ("review_result", int(channel_id), {
+        "message_id": int(message_id),
+        "submission_id": int(submission_id),
+        "status_text": status_text,
+    })
+
+
+def effect_submission_revoked(channel_id: int, message_id: int, status_text: str):
+    return ("submission_revoked", int(channel_id), {"message_id": int(message_id), "status_text": status_text})
+
+
+def notify_user_effects(user_id: int, text: str) -> list:
+    # Public notification in the ORIGINAL submit channel
+    if SUBMISSIONS_CHANNEL_ID == 0:
+        return []
+    return [effect_send(SUBMISSIONS_CHANNEL_ID, f"<@{user_id}> {text}")]
 
-        await interaction.message.edit(embed=embed, view=self)
-        await set_submission_status(self.submission_id, status)
 
-    async def notify_user_in_submit_channel(self, guild: discord.Guild | None, user_id: int, text: str):
-        if not guild or SUBMISSIONS_CHANNEL_ID == 0:
+async def deliver_effect(bot: commands.Bot, kind: str, channel_id: int, payload: dict):
+    ch = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+    if kind == "send":
+        await ch.send(content=payload["content"])
+        return
+
+    msg = await ch.fetch_message(int(payload["message_id"]))
+    if not msg.embeds:
+        return
+    emb = msg.embeds[0]
+
+    if kind == "quest_closed":
+        if emb.title and emb.title.startswith("🔒 (CLOSED)"):
+            return  # already applied by an earlier attempt
+        emb.title = f"🔒 (CLOSED) {emb.title}"
+        # move status info to a field (footer must be alone)
+        emb.add_field(name="Status", value="Auto-closed (time expired).", inline=False)
+        emb.set_footer(text=FOOTER_DEV)
+        await msg.edit(embed=emb)
+
+    elif kind == "review_result":
+        if any(f.name == "Review Result" for f in emb.fields):
+            return
+        view = ReviewView(submission_id=int(payload["submission_id"]))
+        for item in view.children:
+            item.disabled = True
+        # Put final status in a field (footer must remain alone)
+        emb.add_field(name="Review Result", value=payload["status_text"], inline=False)
+        emb.set_footer(text=FOOTER_DEV)
+        await msg.edit(embed=emb, view=view)
+
+    elif kind == "submission_revoked":
+        if any(f.name == "Status" and "REVOKED" in (f.value or "") for f in emb.fields):
             return
-        submit_ch = guild.get_channel(SUBMISSIONS_CHANNEL_ID)
-        await safe_send(submit_ch, content=f"<@{user_id}> {text}")
+        emb.add_field(name="Status", value=payload["status_text"], inline=False)
+        emb.set_footer(text=FOOTER_DEV)
+        await msg.edit(embed=emb, view=None)
+
+    else:
+        raise ValueError(f"Unknown outbox effect kind: {kind}")
+
+
+class OutboxWorker:
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.wakeup = asyncio.Event()
+        self.inflight: set[int] = set()
+        self.channel_locks: dict[int, asyncio.Lock] = {}
+        self.channel_free_at: dict[int, float] = {}  # channel_id -> monotonic time of next allowed delivery
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    def wake(self):
+        self.wakeup.set()
+
+    async def run(self):
+        # rows left over from before a restart are simply "due" and go out on the first pass
+        await self.bot.wait_until_ready()
+        correlation_id.set("outbox")
+        while not self.bot.is_closed():
+            self.wakeup.clear()
+            try:
+                due = await storage.due_effects(time.time(), OUTBOX_BATCH + len(self.inflight))
+                for (outbox_id, kind, channel_id, payload, attempts) in due:
+                    if outbox_id in self.inflight:
+                        continue
+                    self.inflight.add(outbox_id)
+                    spawn_background(self._deliver(outbox_id, kind, int(channel_id), payload, int(attempts)))
+            except Exception as e:
+                swallowed.warn("outbox.poll", "Outbox poll failed", e)
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, outbox_id: int, kind: str, channel_id: int, payload: str, attempts: int):
+        correlation_id.set(f"outbox-{outbox_id}")
+        try:
+            # one delivery at a time per channel, spaced out to stay under per-route limits
+            lock = self.channel_locks.setdefault(channel_id, asyncio.Lock())
+            async with lock:
+                wait = self.channel_free_at.get(channel_id, 0.0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    with rest_lane("notify" if kind == "send" else "review"):
+                        await deliver_effect(self.bot, kind, channel_id, json.loads(payload))
+                except (discord.NotFound, discord.Forbidden) as e:
+                    # channel/message gone or no access: retrying cannot succeed
+                    self.dead += 1
+                    swallowed.warn(f"outbox.{kind}.dead", "Outbox effect dropped", e, channel=channel_id)
+                    await storage.fail_effect(outbox_id, repr(e), dead=True)
+                    return
+                except Exception as e:
+                    attempts += 1
+                    delay = min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * 2 ** (attempts - 1))
+                    delay *= random.uniform(0.8, 1.2)  # jitter so a 429 storm doesn't retry in lockstep
+                    dead = attempts >= OUTBOX_MAX_ATTEMPTS
+                    if dead:
+                        self.dead += 1
+                        log.error("Outbox effect gave up", exc_info=True, extra={"fields": {"kind": kind, "attempts": attempts}})
+                    else:
+                        self.retried += 1
+                        swallowed.warn(f"outbox.{kind}.retry", "Outbox delivery failed, will retry", e, delay=round(delay, 1))
+                    await storage.fail_effect(outbox_id, repr(e), dead=dead, next_attempt_at=time.time() + delay)
+                    return
+                finally:
+                    self.channel_free_at[channel_id] = time.monotonic() + OUTBOX_CHANNEL_INTERVAL
+
+                await storage.complete_effect(outbox_id)
+                self.delivered += 1
+        finally:
+            self.inflight.discard(outbox_id)
+
+
+# =========================
+# APPROVAL VIEW (PERSISTENT)
+# =========================
+class ReviewView(CorrelatedView):
+    def __init__(self, submission_id: int):
+        super().__init__(timeout=None)
+        self.submission_id = int(submission_id)
+
+        self.approve.custom_id = f"review:approve:{self.submission_id}"
+        self.reject.custom_id = f"review:reject:{self.submission_id}"
 
     @discord.ui.button(label="Approve ✅", style=discord.ButtonStyle.success)
     async def approve(self, interaction: discord.Interaction, button: discord.ui.Button):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        sub = await get_submission(self.submission_id)
+        sub = await storage.get_submission(self.submission_id)
         if not sub:
             return await interaction.response.send_message("Submission not found.", ephemeral=True)
 
@@ -646,21 +3360,34 @@ class ReviewView(discord.ui.View):
         if status != "PENDING":
             return await interaction.response.send_message("Already reviewed.", ephemeral=True)
 
-        quest = await get_quest(int(quest_id))
+        quest = await storage.get_quest(int(quest_id))
         if not quest:
             return await interaction.response.send_message("Quest not found (it may have been deleted).", ephemeral=True)
 
         _, q_title, _, _, q_reward, _, _, _, _, _, _ = quest
         reward = int(q_reward)
 
-        await add_envelopes(int(user_id), reward)
-        await mark_submission_award(self.submission_id, reward)
-
-        await self.finalize_message(
-            interaction,
-            "APPROVED",
-            f"✅ Approved by {interaction.user.mention} • +{reward} 🧧"
+        # Status, envelopes, the staff-embed edit and the user notification commit together.
+        # No staff post (it never went out): nothing to edit. Clicks from /event nextreview come
+        # from an ephemeral copy, which the outbox can't fetch.
+        effects = []
+        if channel_id and message_id:
+            effects.append(effect_review_result(
+                channel_id, message_id, submission_id, f"✅ Approved by {interaction.user.mention} • +{reward} 🧧"
+            ))
+        effects += notify_user_effects(
+            int(user_id),
+            f"✅ **Your submission #{submission_id}** for **Quest #{quest_id} — {q_title}** was **APPROVED**. "
+            f"You received **+{reward} 🧧**. 🐉"
         )
+        async with user_locks.hold(int(user_id)):
+            ok = await storage.review_submission(self.submission_id, "APPROVED", reward, effects=effects)
+        if not ok:
+            return await interaction.response.send_message("Already reviewed.", ephemeral=True)
+        outbox_worker.wake()
+        live_board.mark_dirty()
+
+        await interaction.response.defer(ephemeral=True)
 
         # Ledger link points to PRIVATE staff review message (the one with the buttons)
         if interaction.guild and channel_id and message_id:
@@ -668,27 +3395,17 @@ class ReviewView(discord.ui.View):
         else:
             link = "(link unavailable)"
 
-        await log_ledger(
+        spawn_background(log_ledger(
             interaction.guild,
             f"✅ APPROVED • Sub#{submission_id} • Quest#{quest_id} • +{reward}🧧 → <@{user_id}> • by {interaction.user.mention} • {link}"
-        )
-
-        # Notify user in ORIGINAL submit channel (public)
-        await self.notify_user_in_submit_channel(
-            interaction.guild,
-            int(user_id),
-            f"✅ **Your submission #{submission_id}** for **Quest #{quest_id} — {q_title}** was **APPROVED**. "
-            f"You received **+{reward} 🧧**. 🐉"
-        )
-
-        await interaction.response.defer(ephemeral=True)
+        ), name="ledger")
 
     @discord.ui.button(label="Reject ❌", style=discord.ButtonStyle.danger)
     async def reject(self, interaction: discord.Interaction, button: discord.ui.Button):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        sub = await get_submission(self.submission_id)
+        sub = await storage.get_submission(self.submission_id)
         if not sub:
             return await interaction.response.send_message("Submission not found.", ephemeral=True)
 
@@ -696,40 +3413,40 @@ class ReviewView(discord.ui.View):
         if status != "PENDING":
             return await interaction.response.send_message("Already reviewed.", ephemeral=True)
 
-        quest = await get_quest(int(quest_id))
+        quest = await storage.get_quest(int(quest_id))
         q_title = quest[1] if quest else "Unknown Quest"
 
-        await self.finalize_message(
-            interaction,
-            "REJECTED",
-            f"❌ Rejected by {interaction.user.mention}"
+        effects = []
+        if channel_id and message_id:  # see approve: never the interaction's (maybe ephemeral) message
+            effects.append(effect_review_result(channel_id, message_id, submission_id, f"❌ Rejected by {interaction.user.mention}"))
+        # Notify user in ORIGINAL submit channel (public) + encourage retry
+        effects += notify_user_effects(
+            int(user_id),
+            f"❌ **Your submission #{submission_id}** for **Quest #{quest_id} — {q_title}** was **Rejected**. "
+            f"You can **try again** by making a new submission, contact mods for assistance. "
         )
+        ok = await storage.review_submission(self.submission_id, "REJECTED", 0, effects=effects)
+        if not ok:
+            return await interaction.response.send_message("Already reviewed.", ephemeral=True)
+        outbox_worker.wake()
+
+        await interaction.response.defer(ephemeral=True)
 
         if interaction.guild and channel_id and message_id:
             link = msg_link(interaction.guild.id, int(channel_id), int(message_id))
         else:
             link = "(link unavailable)"
 
-        await log_ledger(
+        spawn_background(log_ledger(
             interaction.guild,
             f"❌ REJECTED • Sub#{submission_id} • Quest#{quest_id} → <@{user_id}> • by {interaction.user.mention} • {link}"
-        )
-
-        # Notify user in ORIGINAL submit channel (public) + encourage retry
-        await self.notify_user_in_submit_channel(
-            interaction.guild,
-            int(user_id),
-            f"❌ **Your submission #{submission_id}** for **Quest #{quest_id} — {q_title}** was **Rejected**. "
-            f"You can **try again** by making a new submission, contact mods for assistance. "
-        )
-
-        await interaction.response.defer(ephemeral=True)
+        ), name="ledger")
 
 
 # =========================
 # LEADERBOARD VIEW (PAGED)
 # =========================
-class LeaderboardView(discord.ui.View):
+class LeaderboardView(CorrelatedView):
     def __init__(self, page: int, per_page: int, max_pages: int, limit_total: int):
         super().__init__(timeout=120)
         self.page = int(page)
@@ -742,7 +3459,7 @@ class LeaderboardView(discord.ui.View):
 
     async def build_embed(self) -> discord.Embed:
         offset = (self.page - 1) * self.per_page
-        rows = await top_leaderboard_page(offset=offset, limit=self.per_page)
+        rows = await storage.top_leaderboard_page(offset=offset, limit=self.per_page)
 
         start_rank = offset + 1
         lines = []
@@ -751,54 +3468,428 @@ class LeaderboardView(discord.ui.View):
             lines.append(f"**{rank}.** <@{user_id}> — **{points} pts** • 🧧{envelopes} • 🐉{dragon}")
 
         if not lines:
-            lines = ["No data yet."]
+            lines = ["No data yet."]
+
+        embed = discord.Embed(
+            title="🏆 Fortune Leaderboard",
+            description="\n".join(lines),
+            color=COLOR_RED
+        )
+        embed.add_field(name="Page", value=f"{self.page}/{self.max_pages}", inline=True)
+        embed.add_field(name="Scope", value=f"Top {self.limit_total}", inline=True)
+        embed.set_footer(text=FOOTER_DEV)
+        return embed
+
+    @discord.ui.button(label="⬅ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(1, self.page - 1)
+        self.prev_button.disabled = self.page <= 1
+        self.next_button.disabled = self.page >= self.max_pages
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Next ➡", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.max_pages, self.page + 1)
+        self.prev_button.disabled = self.page <= 1
+        self.next_button.disabled = self.page >= self.max_pages
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+
+# =========================
+# LIVE LEADERBOARD (pinned message, edited in place)
+# =========================
+LIVE_LEADERBOARD_SETTING = "live_leaderboard"  # "channel_id:message_id"
+
+
+class LiveLeaderboard:
+    # Score changes only mark it dirty; the loop re-renders at most once per
+    # LIVE_LEADERBOARD_INTERVAL, so a burst of opens costs a single edit.
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.channel_id: int | None = None
+        self.message_id: int | None = None
+        self.dirty = asyncio.Event()
+        self.next_render_at = 0.0  # monotonic
+        self.marked = 0
+        self.renders = 0
+
+    def mark_dirty(self):
+        if self.message_id:
+            self.marked += 1
+            self.dirty.set()
+
+    async def load(self):
+        value = await storage.get_setting(LIVE_LEADERBOARD_SETTING)
+        if value:
+            channel_id, message_id = value.split(":")
+            self.channel_id, self.message_id = int(channel_id), int(message_id)
+            self.dirty.set()
+
+    async def attach(self, channel_id: int, message_id: int):
+        await storage.set_setting(LIVE_LEADERBOARD_SETTING, f"{int(channel_id)}:{int(message_id)}")
+        self.channel_id, self.message_id = int(channel_id), int(message_id)
+        self.next_render_at = 0.0
+        self.mark_dirty()
+
+    async def detach(self):
+        await storage.set_setting(LIVE_LEADERBOARD_SETTING, None)
+        self.channel_id = self.message_id = None
+
+    async def build_embed(self) -> discord.Embed:
+        view = LeaderboardView(page=1, per_page=LIVE_LEADERBOARD_SIZE, max_pages=1, limit_total=LIVE_LEADERBOARD_SIZE)
+        embed = await view.build_embed()
+        view.stop()
+        embed.title = "🏆 Fortune Leaderboard (Live)"
+        embed.add_field(name="Updated", value=f"<t:{int(time.time())}:R>", inline=True)
+        return embed
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        correlation_id.set("live-board")
+        try:
+            await self.load()
+        except Exception as e:
+            log.error("Live leaderboard setting could not be loaded", exc_info=e)
+
+        while not self.bot.is_closed():
+            await self.dirty.wait()
+            wait = self.next_render_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # changes landing while we render set it again -> picked up next round
+            self.dirty.clear()
+            if not self.message_id:
+                continue
+
+            try:
+                embed = await self.build_embed()
+                with rest_lane("board"):
+                    message = self.bot.get_partial_messageable(self.channel_id).get_partial_message(self.message_id)
+                    await message.edit(embed=embed)
+                self.renders += 1
+            except (discord.NotFound, discord.Forbidden):
+                log.warning("Live leaderboard message is gone or not editable; live updates stopped.")
+                await self.detach()
+            except Exception as e:
+                swallowed.warn("live_board.edit", "Live leaderboard update failed", e)
+            self.next_render_at = time.monotonic() + LIVE_LEADERBOARD_INTERVAL
+
+
+# =========================
+# QUEST SEARCH VIEW (PAGED)
+# =========================
+class QuestSearchView(CorrelatedView):
+    def __init__(self, query: str, page: int, per_page: int):
+        super().__init__(timeout=180)
+        self.query = query
+        self.page = int(page)
+        self.per_page = int(per_page)
+        self.max_pages = 1
+
+    def _update_buttons(self):
+        self.prev_button.disabled = self.page <= 1
+        self.next_button.disabled = self.page >= self.max_pages
+
+    async def build_embed(self) -> discord.Embed:
+        offset = (self.page - 1) * self.per_page
+        total, rows = await storage.search_quests(self.query, offset=offset, limit=self.per_page)
+        self.max_pages = max(1, math.ceil(total / self.per_page))
+        self._update_buttons()
+
+        lines = []
+        for qid, title, reward, active, snippet in rows:
+            status = "🟢 open" if active else "🔒 closed"
+            lines.append(f"**#{qid} • {title}** — +{reward}🧧 • {status}\n> {snippet.replace(chr(10), ' ')}")
+        if not lines:
+            lines = ["No quests match that search."]
 
         embed = discord.Embed(
-            title="🏆 Fortune Leaderboard",
-            description="\n".join(lines),
+            title=f"🔎 Quests matching “{self.query[:80]}”",
+            description="\n\n".join(lines)[:4000],
             color=COLOR_RED
         )
         embed.add_field(name="Page", value=f"{self.page}/{self.max_pages}", inline=True)
-        embed.add_field(name="Scope", value=f"Top {self.limit_total}", inline=True)
+        embed.add_field(name="Results", value=str(total), inline=True)
         embed.set_footer(text=FOOTER_DEV)
         return embed
 
     @discord.ui.button(label="⬅ Prev", style=discord.ButtonStyle.secondary)
     async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page = max(1, self.page - 1)
-        self.prev_button.disabled = self.page <= 1
-        self.next_button.disabled = self.page >= self.max_pages
         embed = await self.build_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     @discord.ui.button(label="Next ➡", style=discord.ButtonStyle.secondary)
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.page = min(self.max_pages, self.page + 1)
-        self.prev_button.disabled = self.page <= 1
-        self.next_button.disabled = self.page >= self.max_pages
         embed = await self.build_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
 
+# =========================
+# MY SUBMISSIONS VIEW (KEYSET PAGES)
+# =========================
+SUBMISSION_STATUS_ICONS = {"PENDING": "⏳", "APPROVED": "✅", "REJECTED": "❌", "REVOKED": "⚠️"}
+
+
+class MySubmissionsView(CorrelatedView):
+    def __init__(self, user_id: int, per_page: int):
+        super().__init__(timeout=180)
+        self.user_id = int(user_id)
+        self.per_page = int(per_page)
+        self.cursors: list[int | None] = [None]  # before_id of every page so far (for going back)
+        self.next_cursor: int | None = None
+
+    async def build_embed(self) -> discord.Embed:
+        rows = await storage.list_user_submissions(self.user_id, before_id=self.cursors[-1], limit=self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        self.next_cursor = int(rows[-1][0]) if has_more else None
+        self.newer_button.disabled = len(self.cursors) <= 1
+        self.older_button.disabled = self.next_cursor is None
+
+        lines = []
+        for sid, qid, title, status, awarded, created_at in rows:
+            icon = SUBMISSION_STATUS_ICONS.get(status, "•")
+            reward = f" • +{awarded}🧧" if status == "APPROVED" and awarded else ""
+            lines.append(f"{icon} **#{sid}** • Quest #{qid} — {title} • **{status}**{reward} • <t:{int(created_at)}:R>")
+        if not lines:
+            lines = ["No submissions yet. Use `/event submit` to send proof for a quest!"]
+
+        embed = discord.Embed(title="📮 My Submissions", description="\n".join(lines)[:4000], color=COLOR_RED)
+        embed.add_field(name="Page", value=str(len(self.cursors)), inline=True)
+        embed.set_footer(text=FOOTER_DEV)
+        return embed
+
+    @discord.ui.button(label="⬅ Newer", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Older ➡", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+
+# =========================
+# PROFILER (on demand)
+# =========================
+# cProfile only hooks the thread that enables it, which is the event loop thread where every
+# handler runs. Nothing is installed until /event profile starts a capture, so it costs nothing
+# in between. Work done inside aiosqlite's threads is not seen: DB helper times are loop-side.
+PROFILE_TOP_N = 30
+
+profile_lock = asyncio.Lock()
+
+
+def profile_groups() -> dict[tuple[str, int], tuple[str, str]]:
+    # (filename, first line) of every handler / DB helper (+ nested closures) -> (group, label)
+    targets = [
+        ("Handlers", EventCommands), ("Handlers", ReviewView), ("Handlers", LeaderboardView),
+        ("Handlers", QuestSearchView), ("Handlers", MySubmissionsView),
+        ("DB helpers", type(storage)), ("DB helpers", GroupCommitWriter),
+    ]
+    groups = {}
+    for group, cls in targets:
+        for name, attr in vars(cls).items():
+            code = getattr(getattr(attr, "callback", attr), "__code__", None)
+            stack = [code] if code else []
+            while stack:
+                c = stack.pop()
+                groups[(c.co_filename, c.co_firstlineno)] = (group, f"{cls.__name__}.{name}")
+                stack.extend(k for k in c.co_consts if isinstance(k, types.CodeType))
+    for fn in (post_submission_for_review, quest_id_autocomplete):
+        groups[(fn.__code__.co_filename, fn.__code__.co_firstlineno)] = ("Handlers", fn.__name__)
+    return groups
+
+
+def format_profile_report(prof: cProfile.Profile, seconds: int) -> str:
+    stats = pstats.Stats(prof)
+    groups = profile_groups()
+
+    totals: dict[tuple[str, str], list] = {}  # (group, label) -> [calls, own s, cumulative s]
+    for (filename, lineno, _), (_, calls, own, cumulative, _) in stats.stats.items():
+        key = groups.get((filename, lineno))
+        if key is None:
+            continue
+        t = totals.setdefault(key, [0, 0.0, 0.0])
+        t[0] += calls
+        t[1] += own
+        t[2] += cumulative
+
+    # the selector wait is the loop sitting idle, not work
+    idle = sum(
+        own for (filename, _, name), (_, _, own, _, _) in stats.stats.items()
+        if filename == "~" and any(w in name for w in ("epoll", "kqueue", "select.select"))
+    )
+
+    out = io.StringIO()
+    out.write(f"Profile capture: {seconds}s wall, loop thread busy {stats.total_tt - idle:.3f}s / idle {idle:.3f}s\n")
+    out.write("Coroutines count one call per resume. Time spent inside aiosqlite threads is not included.\n")
+    for group in ("Handlers", "DB helpers"):
+        rows = sorted(((label, *t) for (g, label), t in totals.items() if g == group), key=lambda r: -r[3])
+        out.write(f"\n== {group} (by cumulative time) ==\n")
+        out.write(f"{'cumulative':>11} {'own':>9} {'calls':>8}  name\n")
+        for label, calls, own, cumulative in rows:
+            out.write(f"{cumulative:>10.4f}s {own:>8.4f}s {calls:>8}  {label}\n")
+        if not rows:
+            out.write("(nothing ran)\n")
+
+    out.write(f"\n== Top {PROFILE_TOP_N} functions by own time ==\n")
+    stats.stream = out
+    stats.strip_dirs().sort_stats("tottime").print_stats(PROFILE_TOP_N)
+    return out.getvalue()
+
+
 # =========================
 # COMMANDS
 # =========================
 async def quest_id_autocomplete(interaction: discord.Interaction, current: str):
-    rows = await list_active_quests(limit=25)
+    text = current.strip()
+    if text and not text.lstrip("#").isdigit():
+        # words: ranked full-text search over every active quest, not just the newest 25
+        _, hits = await storage.search_quests(text, offset=0, limit=25, active_only=True)
+        rows = [(qid, title, reward) for qid, title, reward, _, _ in hits]
+    else:
+        rows = await storage.list_active_quests(limit=25)
     choices = []
     for qid, title, reward in rows:
         label = f"#{qid} • +{reward}🧧 • {title}"
-        if current.strip():
-            if current.strip().lower() not in label.lower():
-                continue
+        if text.lstrip("#").isdigit() and text.lstrip("#") not in str(qid):
+            continue
         choices.append(app_commands.Choice(name=label[:100], value=int(qid)))
     return choices[:25]
 
 
+async def post_submission_for_review(
+    guild: discord.Guild,
+    user_id: int,
+    submission_id: int,
+    quest_id: int,
+    q_title: str,
+    q_reward: int,
+    proof_url: str,
+    note: str | None,
+    proof: discord.Attachment | None = None
+):
+    # Read the screenshot once: keep our own copy (CDN links expire) and check for reuse.
+    # Re-posts after a restart have no attachment any more, so they skip this.
+    proof_sha, proof_phash, matches, proof_bytes = None, None, [], None
+    if proof is not None:
+        try:
+            with span("proof.read", "rest", bytes=proof.size):
+                proof_bytes = await proof.read()
+        except (discord.HTTPException, discord.NotFound) as e:
+            swallowed.warn("proof.read", "Could not download proof; duplicate check skipped", e, submission=submission_id)
+    if proof_bytes:
+        with span("proof_store.put", "cpu"):
+            proof_sha, proof_phash = await asyncio.to_thread(proof_store.put, proof_bytes)
+        matches = await storage.find_proof_matches(proof_sha, proof_phash, PROOF_NEAR_DUP_DISTANCE)
+        await storage.record_proof(submission_id, proof_sha, proof_phash)
+
+    # Build STAFF-ONLY embed
+    embed = discord.Embed(
+        title="🧧 Quest Submission (Staff Review)",
+        description=(
+            f"**Quest:** #{quest_id} — **{q_title}**\n"
+            f"**Clasher:** <@{user_id}>\n"
+            f"**User ID:** `{user_id}`\n"
+            f"**Reward (on approval):** +{int(q_reward)} 🧧"
+        ),
+        color=COLOR_RED
+    )
+    embed.add_field(name="Note", value=note if note else "—", inline=False)
+    embed.add_field(name="Status", value="PENDING", inline=False)
+    if proof is None:
+        embed.add_field(name="Re-posted", value="Original post never went out; duplicate-proof check not run.", inline=False)
+    embed.set_image(url=proof_url)
+    embed.set_footer(text=FOOTER_DEV)
+
+    send_kwargs = {}
+    if matches:
+        lines = []
+        for (m_sid, m_uid, m_qid, distance, m_sha) in matches[:5]:
+            kind = "Identical file" if m_sha == proof_sha else f"Near-duplicate ({distance} bit diff)"
+            who = "same player" if m_uid == user_id else f"<@{m_uid}>"
+            lines.append(f"{kind} • Sub#{m_sid} • Quest#{m_qid} • {who}")
+        if len(matches) > 5:
+            lines.append(f"…and {len(matches) - 5} more")
+        embed.add_field(name="⚠️ Proof Already Used", value="\n".join(lines), inline=False)
+
+        # Show the earlier proof next to the new one so staff can compare at a glance
+        thumb_path = await asyncio.to_thread(proof_store.thumbnail, matches[0][4])
+        if thumb_path:
+            send_kwargs["file"] = discord.File(thumb_path, filename="earlier_proof.jpg")
+            embed.set_thumbnail(url="attachment://earlier_proof.jpg")
+
+    view = ReviewView(submission_id=submission_id)
+
+    # Send the submission to the PRIVATE staff channel
+    private_ch = guild.get_channel(PRIVATE_SUBMISSIONS_CHANNEL_ID)
+    if not private_ch:
+        # the submission is already saved (PENDING); staff just can't see the embed until this is fixed
+        await log_ledger(
+            guild,
+            f"⚠️ WARNING: Private submissions channel not found or not accessible (Sub#{submission_id} not posted)."
+        )
+        return
+
+    with rest_lane("review"):
+        msg = await private_ch.send(embed=embed, view=view, **send_kwargs)
+    await storage.update_submission_message(submission_id, msg.id, msg.channel.id)
+
+    link = msg_link(guild.id, msg.channel.id, msg.id)
+    await log_ledger(
+        guild,
+        f"📮 SUBMITTED • Sub#{submission_id} • Quest#{quest_id} • <@{user_id}> • {link}"
+    )
+
+
+async def repost_unposted_submissions(bot: commands.Bot):
+    # startup only: nothing else can be posting these yet
+    correlation_id.set("repost")
+    unposted = await storage.list_unposted_submissions()
+    if not unposted:
+        return
+    private_ch = bot.get_channel(PRIVATE_SUBMISSIONS_CHANNEL_ID)
+    if private_ch is None:
+        log.warning("Private submissions channel not found; unposted submissions stay hidden", extra={"fields": {"count": len(unposted)}})
+        return
+    posted = 0
+    for submission_id, user_id, quest_id, proof_url, note in unposted:
+        quest = await storage.get_quest(int(quest_id))
+        q_title, q_reward = (quest[1], int(quest[4])) if quest else ("Unknown Quest", 0)
+        try:
+            await post_submission_for_review(
+                private_ch.guild, int(user_id), int(submission_id), int(quest_id), q_title, q_reward, proof_url, note
+            )
+            posted += 1
+        except discord.HTTPException as e:
+            swallowed.warn("submission.repost", "Could not re-post submission for review", e, submission=int(submission_id))
+    log.info("Re-posted submissions for review", extra={"fields": {"posted": posted, "unposted": len(unposted)}})
+
+
 class EventCommands(app_commands.Group):
     def __init__(self):
         super().__init__(name="event", description="Fortune of the Red Dragon (CNY Missions)")
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        bind_interaction(interaction)
+        return await admission.admit(interaction)
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            return  # turned away by admission control, already answered
+        name = interaction.command.qualified_name if interaction.command else "?"
+        log.error("Command failed", exc_info=error, extra={"fields": {"command": name}})
+
     # -------- PLAYER: submit --------
     @app_commands.command(name="submit", description="Submit proof for a quest (screenshot required).")
     @app_commands.describe(
@@ -821,71 +3912,33 @@ class EventCommands(app_commands.Group):
         if not interaction.guild:
             return await interaction.response.send_message("This command must be used in a server.", ephemeral=True)
 
-        quest = await get_quest(int(quest_id))
-        if not quest:
-            return await interaction.response.send_message("That quest ID does not exist.", ephemeral=True)
-
-        _, q_title, _, _, q_reward, _, active, _, _, _, _ = quest
-        if int(active) != 1:
-            return await interaction.response.send_message("That quest is closed.", ephemeral=True)
-
         if proof.content_type and not proof.content_type.startswith("image/"):
             return await interaction.response.send_message("Please upload an image screenshot.", ephemeral=True)
 
-        already = await user_has_submission_for_quest(interaction.user.id, int(quest_id))
-        if already:
-            return await interaction.response.send_message(
-                "You already submitted for that quest (pending/approved).",
-                ephemeral=True
-            )
-
         await interaction.response.defer(ephemeral=True)
 
-        # Build STAFF-ONLY embed
-        embed = discord.Embed(
-            title="🧧 Quest Submission (Staff Review)",
-            description=(
-                f"**Quest:** #{quest_id} — **{q_title}**\n"
-                f"**Clasher:** {interaction.user.mention}\n"
-                f"**User ID:** `{interaction.user.id}`\n"
-                f"**Reward (on approval):** +{int(q_reward)} 🧧"
-            ),
-            color=COLOR_RED
-        )
-        embed.add_field(name="Note", value=note if note else "—", inline=False)
-        embed.add_field(name="Status", value="PENDING", inline=False)
-        embed.set_image(url=proof.url)
-        embed.set_footer(text=FOOTER_DEV)
-
-        submission_id = await insert_submission(
+        # Active-quest check + dedupe + insert in ONE transaction (unique index closes the double-submit race)
+        result, submission_id, q_title, q_reward = await storage.create_submission(
             user_id=interaction.user.id,
             quest_id=int(quest_id),
             proof_url=proof.url,
             note=note,
-            message_id=0,
-            channel_id=0,
         )
-
-        view = ReviewView(submission_id=submission_id)
-
-        # Send the submission to the PRIVATE staff channel
-        private_ch = interaction.guild.get_channel(PRIVATE_SUBMISSIONS_CHANNEL_ID)
-        if not private_ch:
-            # fallback: if private channel is not accessible, don't lose the submission
-            await log_ledger(interaction.guild, "⚠️ WARNING: Private submissions channel not found or not accessible.")
+        if result == "missing":
+            return await interaction.followup.send("That quest ID does not exist.", ephemeral=True)
+        if result == "closed":
+            return await interaction.followup.send("That quest is closed.", ephemeral=True)
+        if result == "duplicate":
             return await interaction.followup.send(
-                "⚠️ I couldn't access the staff review channel. Please contact staff/admin to fix permissions.",
+                "You already submitted for that quest (pending/approved).",
                 ephemeral=True
             )
 
-        msg = await private_ch.send(embed=embed, view=view)
-        await update_submission_message(submission_id, msg.id, msg.channel.id)
-
-        link = msg_link(interaction.guild.id, msg.channel.id, msg.id)
-        await log_ledger(
-            interaction.guild,
-            f"📮 SUBMITTED • Sub#{submission_id} • Quest#{quest_id} • {interaction.user.mention} • {link}"
-        )
+        # Staff post, proof copy and ledger happen off the user's critical path
+        # (a post that never goes out is retried on the next startup: repost_unposted_submissions)
+        spawn_background(post_submission_for_review(
+            interaction.guild, interaction.user.id, submission_id, int(quest_id), q_title, q_reward, proof.url, note, proof
+        ), name=f"review-post:{submission_id}")
 
         # Keep the receipt PRIVATE to the user (in the channel they submitted from)
         await interaction.followup.send(
@@ -906,27 +3959,29 @@ class EventCommands(app_commands.Group):
             return await interaction.response.send_message(f"⏳ Slow down—try again in {wait}s.", ephemeral=True)
         open_cooldowns[interaction.user.id] = now
 
-        envelopes, points, dragon = await get_user_stats(interaction.user.id)
-        if envelopes <= 0:
-            msg = "You have no Red Envelopes 🧧. Complete quests to earn more!"
-            if QUESTS_CHANNEL_ID:
-                msg += f" Check <#{QUESTS_CHANNEL_ID}>."
-            return await interaction.response.send_message(msg, ephemeral=True)
+        async with user_locks.hold(interaction.user.id):
+            envelopes, points, dragon = await storage.get_user_stats(interaction.user.id)
+            if envelopes <= 0:
+                msg = "You have no Red Envelopes 🧧. Complete quests to earn more!"
+                if QUESTS_CHANNEL_ID:
+                    msg += f" Check <#{QUESTS_CHANNEL_ID}>."
+                return await interaction.response.send_message(msg, ephemeral=True)
 
-        weights = [t[1] for t in TIERS]
-        tier_name, _, tier_points = random.choices(TIERS, weights=weights, k=1)[0]
-        is_dragon = tier_name.startswith("🟡")
+            weights = [t[1] for t in TIERS]
+            tier_name, _, tier_points = random.choices(TIERS, weights=weights, k=1)[0]
+            is_dragon = tier_name.startswith("🟡")
 
-        ok = await consume_envelope_and_award(interaction.user.id, tier_points, is_dragon)
-        if not ok:
-            return await interaction.response.send_message("You have no envelopes.", ephemeral=True)
+            ok = await storage.consume_envelope_and_award(interaction.user.id, tier_points, is_dragon, tier=tier_name)
+            if not ok:
+                return await interaction.response.send_message("You have no envelopes.", ephemeral=True)
 
-        envelopes2, points2, dragon2 = await get_user_stats(interaction.user.id)
+            envelopes2, points2, dragon2 = await storage.get_user_stats(interaction.user.id)
+        live_board.mark_dirty()
 
         key = tier_name.split()[0]  # 🟢 / 🔵 / 🟣 / 🟡
         text = random.choice(FLAVOR.get(key, ["Fortune smiles upon you."]))
 
-        completed = await count_user_approved(interaction.user.id)
+        completed = await storage.count_user_approved(interaction.user.id)
         progress = f"{min(completed, PARTICIPATION_GOAL)}/{PARTICIPATION_GOAL}"
 
         embed_color = COLOR_GOLD if is_dragon else COLOR_RED
@@ -959,25 +4014,28 @@ class EventCommands(app_commands.Group):
 
         embed.set_footer(text=FOOTER_DEV)
 
-        await log_ledger(
+        spawn_background(log_ledger(
             interaction.guild,
             f"🎁 OPENED • {interaction.user.mention} → {tier_name} (+{tier_points} pts) • envelopes now {envelopes2}"
-        )
+        ), name="ledger")
         await interaction.response.send_message(embed=embed)
 
     # -------- PLAYER: daily --------
     @app_commands.command(name="daily", description="Claim a free envelope (6h cooldown).")
     async def daily(self, interaction: discord.Interaction):
-        can, remaining = await can_claim_daily(interaction.user.id)
-        if not can:
-            mins = max(1, remaining // 60)
-            return await interaction.response.send_message(f"⏳ Daily not ready. Try again in ~{mins} min.", ephemeral=True)
-
-        await set_daily_claim(interaction.user.id)
-        await add_envelopes(interaction.user.id, DAILY_ENVELOPES_AWARD)
-
-        envelopes, points, dragon = await get_user_stats(interaction.user.id)
-        await log_ledger(interaction.guild, f"🧧 DAILY • {interaction.user.mention} claimed +{DAILY_ENVELOPES_AWARD}🧧")
+        # check + claim under the user's lock, or two quick /daily calls could both pass the check
+        async with user_locks.hold(interaction.user.id):
+            can, remaining = await storage.can_claim_daily(interaction.user.id)
+            if not can:
+                mins = max(1, remaining // 60)
+                return await interaction.response.send_message(f"⏳ Daily not ready. Try again in ~{mins} min.", ephemeral=True)
+
+            await storage.set_daily_claim(interaction.user.id)
+            await storage.add_envelopes(interaction.user.id, DAILY_ENVELOPES_AWARD)
+
+            envelopes, points, dragon = await storage.get_user_stats(interaction.user.id)
+        live_board.mark_dirty()
+        spawn_background(log_ledger(interaction.guild, f"🧧 DAILY • {interaction.user.mention} claimed +{DAILY_ENVELOPES_AWARD}🧧"), name="ledger")
         await interaction.response.send_message(
             f"✅ You claimed **+{DAILY_ENVELOPES_AWARD} 🧧**.\nNow: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**",
             ephemeral=True
@@ -986,8 +4044,8 @@ class EventCommands(app_commands.Group):
     # -------- PLAYER: balance --------
     @app_commands.command(name="balance", description="Check your envelopes, points, and progress.")
     async def balance(self, interaction: discord.Interaction):
-        envelopes, points, dragon = await get_user_stats(interaction.user.id)
-        completed = await count_user_approved(interaction.user.id)
+        envelopes, points, dragon = await storage.get_user_stats(interaction.user.id)
+        completed = await storage.count_user_approved(interaction.user.id)
         embed = discord.Embed(title="🧧 Your Fortune", color=COLOR_RED)
         embed.add_field(name="Red Envelopes", value=str(envelopes), inline=True)
         embed.add_field(name="Fortune Points", value=str(points), inline=True)
@@ -1003,7 +4061,7 @@ class EventCommands(app_commands.Group):
     # -------- PLAYER: leaderboard (paged to 100) --------
     @app_commands.command(name="leaderboard", description="Top Fortune Points (paged).")
     async def leaderboard(self, interaction: discord.Interaction):
-        total = await count_users()
+        total = await storage.count_users()
         if total <= 0:
             return await interaction.response.send_message("No data yet.", ephemeral=True)
 
@@ -1021,11 +4079,11 @@ class EventCommands(app_commands.Group):
     async def rank(self, interaction: discord.Interaction, user: discord.Member | None = None):
         target = user or interaction.user
 
-        r = await get_rank_row(int(target.id))
+        r = await storage.get_rank_row(int(target.id))
         if not r:
             return await interaction.response.send_message("No rank data yet.", ephemeral=True)
 
-        ctx = await get_rank_context(r["rank"], around=2)
+        ctx = await storage.get_rank_context(r["rank"], around=2)
 
         lines = []
         for (rk, uid, pts, env, drg) in ctx:
@@ -1051,6 +4109,24 @@ class EventCommands(app_commands.Group):
         embed.set_footer(text=FOOTER_DEV)
         await interaction.response.send_message(embed=embed, ephemeral=False)
 
+    # -------- PLAYER: my submissions --------
+    @app_commands.command(name="mysubmissions", description="See your submissions and their review status.")
+    async def mysubmissions(self, interaction: discord.Interaction):
+        view = MySubmissionsView(user_id=interaction.user.id, per_page=10)
+        embed = await view.build_embed()
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
+    # -------- PLAYER: quest search --------
+    @app_commands.command(name="quests", description="Search all quests (open and closed) by title, text or bonus.")
+    @app_commands.describe(search="Words to look for, e.g. dragon gate")
+    async def quests(self, interaction: discord.Interaction, search: app_commands.Range[str, 1, 100]):
+        if not fts_match_query(search):
+            return await interaction.response.send_message("Type at least one word to search for.", ephemeral=True)
+
+        view = QuestSearchView(query=search, page=1, per_page=5)
+        embed = await view.build_embed()
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
     # -------- STAFF: postquest (with optional duration) --------
     @app_commands.command(name="postquest", description="(Staff) Post a quest (mission) to the quests channel.")
     @app_commands.describe(
@@ -1148,7 +4224,7 @@ class EventCommands(app_commands.Group):
             except discord.Forbidden:
                 pass
 
-        quest_id = await create_quest(
+        quest_id = await storage.create_quest(
             title=title,
             body=quest,
             bonus=bonus,
@@ -1168,7 +4244,7 @@ class EventCommands(app_commands.Group):
         await msg.edit(embed=embed)
 
         link = msg_link(interaction.guild.id, msg.channel.id, msg.id)
-        await log_ledger(interaction.guild, f"📌 QUEST POSTED • Quest#{quest_id} • +{reward_envelopes}🧧 • by {interaction.user.mention} • {link}")
+        spawn_background(log_ledger(interaction.guild, f"📌 QUEST POSTED • Quest#{quest_id} • +{reward_envelopes}🧧 • by {interaction.user.mention} • {link}"), name="ledger")
         await interaction.followup.send(f"✅ Posted Quest **#{quest_id}** in {ch.mention}.", ephemeral=True)
 
     # -------- STAFF: closequest --------
@@ -1178,14 +4254,64 @@ class EventCommands(app_commands.Group):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        q = await get_quest(int(quest_id))
+        q = await storage.get_quest(int(quest_id))
         if not q:
             return await interaction.response.send_message("Quest not found.", ephemeral=True)
 
-        await close_quest(int(quest_id))
-        await log_ledger(interaction.guild, f"🔒 QUEST CLOSED • Quest#{quest_id} by {interaction.user.mention}")
+        await storage.close_quest(int(quest_id))
+        spawn_background(log_ledger(interaction.guild, f"🔒 QUEST CLOSED • Quest#{quest_id} by {interaction.user.mention}"), name="ledger")
         await interaction.response.send_message(f"✅ Quest #{quest_id} closed.", ephemeral=True)
 
+    # -------- STAFF: nextreview --------
+    @app_commands.command(name="nextreview", description="(Staff) Reserve the oldest pending submission for you to review.")
+    @app_commands.describe(skip="Hand your current submission back to the queue and take the next one")
+    async def nextreview(self, interaction: discord.Interaction, skip: bool = False):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        lease = await storage.lease_next_submission(interaction.user.id, REVIEW_LEASE_SECONDS, skip=skip)
+        depth, leased, median_wait = await storage.review_queue_stats()
+        if median_wait >= 3600:
+            wait_text = f"{median_wait / 3600:.1f}h"
+        elif median_wait >= 60:
+            wait_text = f"{median_wait / 60:.0f}m"
+        else:
+            wait_text = f"{median_wait:.0f}s"
+        queue_text = f"Queue: **{depth}** pending • **{leased}** reserved • median time-to-review **{wait_text}**"
+
+        if not lease:
+            return await interaction.response.send_message(
+                f"🎉 Nothing left to review right now.\n{queue_text}", ephemeral=True
+            )
+
+        submission_id, user_id, quest_id, proof_url, note, message_id, channel_id, created_at, expires_at = lease
+        quest = await storage.get_quest(int(quest_id))
+        q_title = quest[1] if quest else "Unknown Quest"
+        q_reward = int(quest[4]) if quest else 0
+
+        embed = discord.Embed(
+            title=f"🧧 Review Queue • Submission #{submission_id}",
+            description=(
+                f"**Quest:** #{quest_id} — **{q_title}**\n"
+                f"**Clasher:** <@{user_id}>\n"
+                f"**Submitted:** <t:{int(created_at)}:R>\n"
+                f"**Reward (on approval):** +{q_reward} 🧧"
+            ),
+            color=COLOR_RED
+        )
+        embed.add_field(name="Note", value=note if note else "—", inline=False)
+        if interaction.guild and channel_id and message_id:
+            embed.add_field(
+                name="Staff Message", value=msg_link(interaction.guild.id, int(channel_id), int(message_id)), inline=False
+            )
+        embed.add_field(name="Reserved For You", value=f"until <t:{int(expires_at)}:R>", inline=False)
+        embed.add_field(name="Queue", value=queue_text, inline=False)
+        if proof_url:
+            embed.set_image(url=proof_url)
+        embed.set_footer(text=FOOTER_DEV)
+
+        await interaction.response.send_message(embed=embed, view=ReviewView(int(submission_id)), ephemeral=True)
+
     # -------- STAFF: revoke --------
     @app_commands.command(name="revoke", description="(Staff) Revoke an approved submission (removes awarded envelopes if possible).")
     @app_commands.describe(submission_id="Submission ID number (e.g. 12)")
@@ -1193,7 +4319,7 @@ class EventCommands(app_commands.Group):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        sub = await get_submission(int(submission_id))
+        sub = await storage.get_submission(int(submission_id))
         if not sub:
             return await interaction.response.send_message("Submission not found.", ephemeral=True)
 
@@ -1205,25 +4331,26 @@ class EventCommands(app_commands.Group):
         if status != "APPROVED":
             return await interaction.response.send_message(f"Only APPROVED submissions can be revoked. Current: {status}", ephemeral=True)
 
-        await set_submission_status(int(submission_id), "REVOKED")
+        effects = []
+        if channel_id and message_id:
+            effects.append(effect_submission_revoked(channel_id, message_id, f"⚠️ REVOKED by {interaction.user.mention}"))
+
+        # status change, envelope removal and the staff-embed edit commit together
+        async with user_locks.hold(int(user_id)):
+            before, removed = await storage.revoke_submission(int(submission_id), effects=effects)
+            if before is None:
+                return await interaction.response.send_message(
+                    f"Submission #{submission_id} is archived (its quest closed a while ago), and archived results are "
+                    f"final. Use the adjust commands to correct <@{user_id}>'s balance.",
+                    ephemeral=True
+                )
+            if before != "APPROVED":
+                return await interaction.response.send_message("This submission was changed meanwhile, try again.", ephemeral=True)
+            envelopes, points, dragon = await storage.get_user_stats(int(user_id))
+        outbox_worker.wake()
+        live_board.mark_dirty()
 
         remove_amount = int(awarded)
-        removed = await try_remove_envelopes(int(user_id), remove_amount)
-
-        try:
-            if interaction.guild and channel_id and message_id:
-                ch = interaction.guild.get_channel(int(channel_id))
-                if ch:
-                    msg = await ch.fetch_message(int(message_id))
-                    if msg and msg.embeds:
-                        emb = msg.embeds[0]
-                        emb.add_field(name="Status", value=f"⚠️ REVOKED by {interaction.user.mention}", inline=False)
-                        emb.set_footer(text=FOOTER_DEV)
-                        await msg.edit(embed=emb, view=None)
-        except Exception:
-            pass
-
-        envelopes, points, dragon = await get_user_stats(int(user_id))
 
         link = "(link unavailable)"
         if interaction.guild and channel_id and message_id:
@@ -1235,7 +4362,7 @@ class EventCommands(app_commands.Group):
                 f"➖ Removed **{remove_amount} envelope(s)** from <@{user_id}>.\n"
                 f"Now: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**"
             )
-            await log_ledger(interaction.guild, f"🧹 REVOKED • Sub#{sid} • -{remove_amount}🧧 → <@{user_id}> • by {interaction.user.mention} • {link}")
+            spawn_background(log_ledger(interaction.guild, f"🧹 REVOKED • Sub#{sid} • -{remove_amount}🧧 → <@{user_id}> • by {interaction.user.mention} • {link}"), name="ledger")
         else:
             text = (
                 f"✅ Revoked submission **#{submission_id}**.\n"
@@ -1243,7 +4370,7 @@ class EventCommands(app_commands.Group):
                 f"Please use adjust commands if needed.\n"
                 f"Now: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**"
             )
-            await log_ledger(interaction.guild, f"🧹 REVOKED • Sub#{sid} • envelopes NOT removed → <@{user_id}> • by {interaction.user.mention} • {link}")
+            spawn_background(log_ledger(interaction.guild, f"🧹 REVOKED • Sub#{sid} • envelopes NOT removed → <@{user_id}> • by {interaction.user.mention} • {link}"), name="ledger")
 
         await interaction.response.send_message(text, ephemeral=True)
 
@@ -1254,10 +4381,12 @@ class EventCommands(app_commands.Group):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        before, after = await adjust_user_field(user.id, "points", amount)
-        envelopes, points, dragon = await get_user_stats(user.id)
+        async with user_locks.hold(user.id):
+            before, after = await storage.adjust_user_field(user.id, "points", amount)
+            envelopes, points, dragon = await storage.get_user_stats(user.id)
+        live_board.mark_dirty()
 
-        await log_ledger(interaction.guild, f"🛠️ ADJUST • points {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}")
+        spawn_background(log_ledger(interaction.guild, f"🛠️ ADJUST • points {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}"), name="ledger")
         await interaction.response.send_message(
             f"✅ Points updated for {user.mention}: **{before} → {after}**\nNow: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**",
             ephemeral=True
@@ -1269,30 +4398,315 @@ class EventCommands(app_commands.Group):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        before, after = await adjust_user_field(user.id, "envelopes", amount)
-        envelopes, points, dragon = await get_user_stats(user.id)
+        async with user_locks.hold(user.id):
+            before, after = await storage.adjust_user_field(user.id, "envelopes", amount)
+            envelopes, points, dragon = await storage.get_user_stats(user.id)
+        live_board.mark_dirty()
 
-        await log_ledger(interaction.guild, f"🛠️ ADJUST • envelopes {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}")
+        spawn_background(log_ledger(interaction.guild, f"🛠️ ADJUST • envelopes {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}"), name="ledger")
         await interaction.response.send_message(
             f"✅ Envelopes updated for {user.mention}: **{before} → {after}**\nNow: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**",
             ephemeral=True
         )
 
+    # -------- STAFF: grant (whole role at once) --------
+    @app_commands.command(name="grant", description="(Staff) Give envelopes to every member of a role.")
+    @app_commands.describe(role="Everyone with this role gets the envelopes", amount="Envelopes per member")
+    async def grant(self, interaction: discord.Interaction, role: discord.Role, amount: app_commands.Range[int, 1, 1000]):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+        if not bot.intents.members:
+            return await interaction.response.send_message(
+                "❌ Granting to a role needs the Server Members intent. Set `MEMBERS_INTENT=1` "
+                "(and enable it in the Developer Portal), then restart the bot.",
+                ephemeral=True
+            )
+
+        await interaction.response.defer(ephemeral=True)
+        guild = interaction.guild
+
+        t0 = time.perf_counter()
+        if guild.chunked:
+            members = guild.members if role.is_default() else role.members
+            member_ids = [m.id for m in members if not m.bot]
+        else:
+            # no member cache (lowmem profile): page through the member list, 1000 per request
+            member_ids = []
+            async for m in guild.fetch_members(limit=None):
+                if not m.bot and (role.is_default() or m.get_role(role.id)):
+                    member_ids.append(m.id)
+        t1 = time.perf_counter()
+
+        # one upsert for everyone; no per-user locks needed, it's a plain increment
+        credited = await storage.grant_envelopes(member_ids, amount)
+        t2 = time.perf_counter()
+        if credited:
+            live_board.mark_dirty()
+
+        timing = f"members {t1 - t0:.2f}s • database {t2 - t1:.2f}s"
+        spawn_background(log_ledger(
+            guild,
+            f"🎁 GRANT • +{amount}🧧 × {credited} members of @{role.name} (`{role.id}`) (total {amount * credited}🧧) "
+            f"• by {interaction.user.mention}"
+        ), name="ledger")
+        await interaction.followup.send(
+            f"✅ Credited **+{amount} 🧧** to **{credited}** member(s) of {role.mention}.\n{timing}",
+            ephemeral=True
+        )
+
     @app_commands.command(name="adjustdragon", description="(Staff) Adjust a user's Dragon Marks (+/-). Clamped at 0.")
     @app_commands.describe(user="Target user", amount="Use negative to subtract (e.g., -1)")
     async def adjustdragon(self, interaction: discord.Interaction, user: discord.Member, amount: int):
         if not is_staff(interaction.user):
             return await interaction.response.send_message("Staff only.", ephemeral=True)
 
-        before, after = await adjust_user_field(user.id, "dragon", amount)
-        envelopes, points, dragon = await get_user_stats(user.id)
+        async with user_locks.hold(user.id):
+            before, after = await storage.adjust_user_field(user.id, "dragon", amount)
+            envelopes, points, dragon = await storage.get_user_stats(user.id)
+        live_board.mark_dirty()
 
-        await log_ledger(interaction.guild, f"🛠️ ADJUST • dragon {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}")
+        spawn_background(log_ledger(interaction.guild, f"🛠️ ADJUST • dragon {before}->{after} (Δ{amount}) • {user.mention} by {interaction.user.mention}"), name="ledger")
         await interaction.response.send_message(
             f"✅ Dragon Marks updated for {user.mention}: **{before} → {after}**\nNow: 🧧 **{envelopes}** | ⭐ **{points}** | 🐉 **{dragon}**",
             ephemeral=True
         )
 
+    # -------- STAFF: profile --------
+    @app_commands.command(name="profile", description="(Staff) Profile the running bot for N seconds and attach the report.")
+    @app_commands.describe(seconds="Capture window in seconds (1-120)")
+    async def profile(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 1, 120] = 15):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+        if profile_lock.locked():
+            return await interaction.response.send_message("A profile capture is already running.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        async with profile_lock:
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                prof.disable()
+
+        report = await asyncio.to_thread(format_profile_report, prof, seconds)
+        prof.create_stats()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        files = [
+            discord.File(io.BytesIO(report.encode("utf-8")), filename=f"profile-{stamp}.txt"),
+            # raw stats for snakeviz / pstats
+            discord.File(io.BytesIO(marshal.dumps(prof.stats)), filename=f"profile-{stamp}.pstats"),
+        ]
+        await interaction.followup.send(f"🔬 Profile of the last {seconds}s attached.", files=files, ephemeral=True)
+
+    # -------- STAFF: stats --------
+    @app_commands.command(name="stats", description="(Staff) Event totals: envelopes, tiers, dragon marks, submissions.")
+    async def stats(self, interaction: discord.Interaction):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        c = await storage.get_counters()
+        opened = c.get("envelopes_opened", 0)
+        total_weight = sum(t[1] for t in TIERS)
+
+        tier_lines = []
+        for tier_name, weight, tier_points in TIERS:
+            n = c.get(f"tier:{tier_name}", 0)
+            actual = (n / opened * 100) if opened else 0.0
+            tier_lines.append(f"{tier_name} — **{n}** ({actual:.1f}% • expected {weight / total_weight * 100:.1f}%)")
+
+        embed = discord.Embed(title="📊 Event Stats", color=COLOR_RED)
+        embed.add_field(
+            name="🎁 Envelopes Opened",
+            value=f"**{opened}** • +{c.get('points_awarded', 0)} Fortune Points handed out",
+            inline=False
+        )
+        embed.add_field(name="Tier Distribution", value="\n".join(tier_lines), inline=False)
+        embed.add_field(name="🐉 Dragon Marks", value=f"**{c.get('dragon_marks', 0)}** in circulation", inline=False)
+        embed.add_field(
+            name="🧧 Envelopes",
+            value=(
+                f"granted {c.get('envelopes_granted', 0)} • awarded {c.get('envelopes_awarded', 0)} • "
+                f"revoked {c.get('envelopes_revoked', 0)} • staff adjusted {c.get('envelopes_adjusted', 0):+d}"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="📮 Submissions",
+            value=(
+                f"waiting **{c.get('submissions_pending', 0)}** • approved {c.get('submissions_approved', 0)} • "
+                f"rejected {c.get('submissions_rejected', 0)} • revoked {c.get('submissions_revoked', 0)} • "
+                f"received {c.get('submissions_received', 0)}"
+            ),
+            inline=False
+        )
+        embed.set_footer(text=FOOTER_DEV)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    # -------- STAFF: metrics --------
+    @app_commands.command(name="metrics", description="(Staff) Live bot metrics: event loop, REST lanes, admission and outbox.")
+    async def metrics(self, interaction: discord.Interaction):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        lines = []
+        for lane in rest_dispatcher.snapshot():
+            lines.append(
+                f"**{lane['lane']}** • queued {lane['depth']} • in flight {lane['inflight']} • "
+                f"wait p50 {lane['wait_p50'] * 1000:.0f}ms / p95 {lane['wait_p95'] * 1000:.0f}ms • "
+                f"served {lane['served']}"
+            )
+
+        pending = await storage.count_pending_effects()
+        lag = loop_watchdog.snapshot()
+        loop_text = (
+            f"lag p50 {lag['p50'] * 1000:.1f}ms • p95 {lag['p95'] * 1000:.1f}ms • "
+            f"p99 {lag['p99'] * 1000:.1f}ms • max {lag['max'] * 1000:.0f}ms\n"
+            f"stalls over {LOOP_LAG_THRESHOLD_MS:.0f}ms: {lag['stalls']}\n"
+            f"user locks: {len(user_locks.table)} active • {user_locks.contended}/{user_locks.acquired} contended"
+        )
+        loop_text += f"\ntraces: {trace_writer.kept} kept of {trace_writer.started} interactions (`{TRACE_DIR}/`)"
+        cache = getattr(storage, "user_cache", None)
+        if cache is not None:
+            looked_up = cache.hits + cache.misses
+            loop_text += (
+                f"\nuser cache: {len(cache.rows)}/{cache.capacity} rows • "
+                f"hit rate {cache.hits / looked_up * 100 if looked_up else 0:.1f}%"
+            )
+
+        files = []
+        if loop_watchdog.stalls:
+            when, blocked, stack = loop_watchdog.stalls[-1]
+            where = stack.strip().splitlines()[-2].strip() if stack.strip() else "?"
+            loop_text += f"\nlast: {blocked * 1000:.0f}ms <t:{int(when)}:R> at `{where[:150]}`"
+            dump = "\n\n".join(
+                f"=== {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(w))} UTC • blocked {b * 1000:.0f}ms+ ===\n{st}"
+                for w, b, st in loop_watchdog.stalls
+            )
+            files.append(discord.File(io.BytesIO(dump.encode("utf-8")), filename="loop-stalls.txt"))
+
+        embed = discord.Embed(title="📈 Bot Metrics", color=COLOR_RED)
+        embed.add_field(name="Event Loop", value=loop_text, inline=False)
+        embed.add_field(name="REST Lanes (priority order)", value="\n".join(lines), inline=False)
+        embed.add_field(
+            name="Admission" + ("" if admission.enabled else " (off)"),
+            value="\n".join(
+                f"**{c['class']}** • running {c['running']}/{c['limit']} • "
+                f"queued {c['depth']}/{c['queue_size']} (peak {c['peak_depth']}) • "
+                f"wait p95 {c['wait_p95'] * 1000:.0f}ms • admitted {c['admitted']} • "
+                f"busy {c['rejected']} full / {c['timed_out']} timed out"
+                for c in admission.snapshot()
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="Outbox",
+            value=(
+                f"pending {pending} • delivered {outbox_worker.delivered} • "
+                f"retried {outbox_worker.retried} • dead {outbox_worker.dead}"
+            ),
+            inline=False
+        )
+        if swallowed.totals:
+            embed.add_field(
+                name="Handled Errors (see logs)",
+                value="\n".join(f"`{kind}` × {n}" for kind, n in swallowed.totals.most_common(8)),
+                inline=False
+            )
+        if live_board.message_id:
+            embed.add_field(
+                name="Live Leaderboard",
+                value=f"{live_board.marked} score changes → {live_board.renders} edits",
+                inline=False
+            )
+        embed.set_footer(text=FOOTER_DEV)
+        await interaction.response.send_message(embed=embed, files=files, ephemeral=True)
+
+    # -------- STAFF: archive --------
+    @app_commands.command(name="archive", description="(Staff) Move closed quests and settled submissions to the archive.")
+    @app_commands.describe(older_than_hours=f"Only quests closed at least this many hours ago (default {ARCHIVE_AFTER_HOURS:g})")
+    async def archive(self, interaction: discord.Interaction, older_than_hours: app_commands.Range[float, 0, None] = ARCHIVE_AFTER_HOURS):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        t0 = time.perf_counter()
+        quests, submissions = await run_archive(older_than_hours)
+        elapsed = time.perf_counter() - t0
+        counts = await storage.archive_counts()
+
+        if quests or submissions:
+            spawn_background(log_ledger(
+                interaction.guild,
+                f"🗄️ ARCHIVED • {quests} quest(s) • {submissions} submission(s) • by {interaction.user.mention}"
+            ), name="ledger")
+        await interaction.followup.send(
+            f"🗄️ Archived **{quests}** quest(s) and **{submissions}** submission(s) in {elapsed:.2f}s.\n"
+            f"Hot: {counts['hot_quests']} quests • {counts['hot_submissions']} submissions\n"
+            f"Archive: {counts['archived_quests']} quests • {counts['archived_submissions']} submissions",
+            ephemeral=True
+        )
+
+    # -------- STAFF: liveboard --------
+    @app_commands.command(name="liveboard", description="(Staff) Post a live leaderboard that keeps itself up to date.")
+    @app_commands.describe(
+        channel="Where to post it (default: this channel)",
+        stop="Stop updating the current live leaderboard",
+    )
+    async def liveboard(self, interaction: discord.Interaction, channel: discord.TextChannel | None = None, stop: bool = False):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        if stop:
+            if not live_board.message_id:
+                return await interaction.response.send_message("No live leaderboard is running.", ephemeral=True)
+            await live_board.detach()
+            spawn_background(log_ledger(interaction.guild, f"🏆 LIVE LEADERBOARD STOPPED • by {interaction.user.mention}"), name="ledger")
+            return await interaction.response.send_message("✅ Live leaderboard stopped (the message stays as it is).", ephemeral=True)
+
+        target = channel or interaction.channel
+        if not isinstance(target, discord.TextChannel):
+            return await interaction.response.send_message("Pick a text channel.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            message = await target.send(embed=await live_board.build_embed())
+        except discord.Forbidden:
+            return await interaction.followup.send(f"❌ I can't post in {target.mention}.", ephemeral=True)
+        try:
+            await message.pin()
+        except discord.HTTPException as e:
+            # no Manage Messages / pin limit: still works, just not pinned
+            swallowed.warn("live_board.pin", "Live leaderboard not pinned", e)
+
+        await live_board.attach(target.id, message.id)
+        spawn_background(log_ledger(interaction.guild, f"🏆 LIVE LEADERBOARD • {message.jump_url} • by {interaction.user.mention}"), name="ledger")
+        await interaction.followup.send(
+            f"✅ Live leaderboard posted in {target.mention}. It updates at most every {LIVE_LEADERBOARD_INTERVAL:g}s.",
+            ephemeral=True
+        )
+
+    # -------- STAFF: snapshot --------
+    @app_commands.command(name="snapshot", description="(Staff) Save a backup copy of the event database now.")
+    async def snapshot(self, interaction: discord.Interaction):
+        if not is_staff(interaction.user):
+            return await interaction.response.send_message("Staff only.", ephemeral=True)
+
+        await interaction.response.defer(ephemeral=True)
+        t0 = time.perf_counter()
+        try:
+            paths = await take_snapshot("manual")
+        except (OSError, sqlite3.Error) as e:
+            return await interaction.followup.send(f"❌ Snapshot failed: {e}", ephemeral=True)
+        elapsed = time.perf_counter() - t0
+
+        if not paths:
+            return await interaction.followup.send("Nothing to snapshot (dry-run storage).", ephemeral=True)
+
+        files = "\n".join(f"`{p}` ({os.path.getsize(p) / 1024:.0f} KB)" for p in paths)
+        spawn_background(log_ledger(interaction.guild, f"💾 SNAPSHOT • {os.path.basename(paths[0])} • by {interaction.user.mention}"), name="ledger")
+        await interaction.followup.send(f"💾 Snapshot saved in {elapsed:.2f}s:\n{files}", ephemeral=True)
+
     # -------- STAFF: reset (for testing) --------
     @app_commands.command(name="reset", description="(Staff) Reset ALL event data (DANGEROUS).")
     @app_commands.describe(confirm="Type: CONFIRM")
@@ -1302,39 +4716,124 @@ class EventCommands(app_commands.Group):
         if confirm != "CONFIRM":
             return await interaction.response.send_message("Type **CONFIRM** to reset.", ephemeral=True)
 
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("DELETE FROM submissions")
-            await db.execute("DELETE FROM quests")
-            await db.execute("DELETE FROM users")
-            await db.execute("DELETE FROM daily_claims")
-            await db.commit()
+        await interaction.response.defer(ephemeral=True)
+
+        # never wipe without a copy: no snapshot, no reset
+        try:
+            paths = await take_snapshot("reset")
+        except (OSError, sqlite3.Error) as e:
+            return await interaction.followup.send(f"❌ Snapshot before reset failed, nothing was wiped: {e}", ephemeral=True)
+
+        await storage.reset_all()
+        if live_board.message_id:  # the live board is configuration, not event data
+            await live_board.attach(live_board.channel_id, live_board.message_id)
+
+        saved = f" Previous data saved to `{paths[0]}`." if paths else ""
+        spawn_background(log_ledger(interaction.guild, f"🧨 RESET • Event data wiped by {interaction.user.mention}"), name="ledger")
+        await interaction.followup.send(f"✅ Event data reset complete.{saved}", ephemeral=True)
 
-        await log_ledger(interaction.guild, f"🧨 RESET • Event data wiped by {interaction.user.mention}")
-        await interaction.response.send_message("✅ Event data reset complete.", ephemeral=True)
+
+# =========================
+# COMMAND SYNC (skip when unchanged)
+# =========================
+def command_tree_hash(tree: app_commands.CommandTree, guild: discord.abc.Snowflake | None) -> str:
+    payload = [cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_command_sync_state() -> dict:
+    try:
+        with open(COMMAND_SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_command_sync_state(state: dict):
+    tmp = f"{COMMAND_SYNC_STATE_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, COMMAND_SYNC_STATE_PATH)
 
 
 # =========================
 # BOT CLASS
 # =========================
 class FortuneBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        install_rest_dispatcher(self)
+        self.startup_phases: dict[str, float] = {}  # phase -> seconds
+        self._setup_done_at = 0.0
+
     async def setup_hook(self):
+        phases = self.startup_phases
+
+        # first thing, so slow startup steps are caught too
+        self._watchdog_task = asyncio.create_task(loop_watchdog.run())
+
+        t = time.perf_counter()
+        await storage.init()
+        phases["db_init"] = time.perf_counter() - t
+
+        # Re-register persistent views for pending submissions (buttons survive restarts)
+        t = time.perf_counter()
+        pending = await storage.list_pending_submission_ids()
+        for submission_id in pending:
+            self.add_view(ReviewView(submission_id=int(submission_id)))
+        phases["view_registration"] = time.perf_counter() - t
+
         if not any(cmd.name == "event" for cmd in self.tree.get_commands()):
             self.tree.add_command(EventCommands())
 
+        t = time.perf_counter()
+        await self.sync_commands_if_changed()
+        phases["command_sync"] = time.perf_counter() - t
+
+        self._setup_done_at = time.perf_counter()
+
+    async def sync_commands_if_changed(self):
+        # tree.sync is a rate-limited REST call: skip it when the tree is identical to the last sync
+        guild = discord.Object(id=GUILD_ID) if GUILD_ID and GUILD_ID != 0 else None
+        if guild:
+            self.tree.copy_global_to(guild=guild)
+
+        scope = f"{self.application_id}:{GUILD_ID if guild else 'global'}"
+        tree_hash = command_tree_hash(self.tree, guild)
+        state = load_command_sync_state()
+        if not FORCE_COMMAND_SYNC and state.get(scope) == tree_hash:
+            log.info("Command tree unchanged, skipping sync", extra={"fields": {"hash": tree_hash[:12]}})
+            return
+
         try:
-            if GUILD_ID and GUILD_ID != 0:
-                guild = discord.Object(id=GUILD_ID)
-                self.tree.copy_global_to(guild=guild)
+            if guild:
                 synced = await self.tree.sync(guild=guild)
-                print(f"✅ Synced {len(synced)} commands to guild {GUILD_ID}")
+                log.info("Synced commands to guild", extra={"fields": {"count": len(synced), "guild": GUILD_ID}})
             else:
                 synced = await self.tree.sync()
-                print(f"✅ Synced {len(synced)} GLOBAL commands (may take time to appear)")
+                log.info("Synced global commands (may take time to appear)", extra={"fields": {"count": len(synced)}})
         except Exception as e:
-            print("Command sync failed:", e)
+            log.error("Command sync failed", exc_info=e)
+            return
+
+        state[scope] = tree_hash
+        try:
+            save_command_sync_state(state)
+        except OSError as e:
+            log.warning("Could not save command sync state", exc_info=e)
+
+    async def close(self):
+        await storage.close()
+        await super().close()
+
+
+bot = FortuneBot(command_prefix="!", **client_options(CLIENT_PROFILE))
 
 
-bot = FortuneBot(command_prefix="!", intents=intents)
+outbox_worker = OutboxWorker(bot)
+live_board = LiveLeaderboard(bot)
 
 
 # =========================
@@ -1342,22 +4841,42 @@ bot = FortuneBot(command_prefix="!", intents=intents)
 # =========================
 @bot.event
 async def on_ready():
-    await init_db()
-
-    # Re-register persistent views for pending submissions (buttons survive restarts)
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT submission_id FROM submissions WHERE status='PENDING'") as cur:
-            pending = await cur.fetchall()
-
-    for (submission_id,) in pending:
-        bot.add_view(ReviewView(submission_id=int(submission_id)))
+    if "gateway_ready" not in bot.startup_phases:
+        bot.startup_phases["gateway_ready"] = time.perf_counter() - bot._setup_done_at
+        log.info("startup timings", extra={"fields": {f"{k}_ms": round(v * 1000) for k, v in bot.startup_phases.items()}})
 
     # Start auto-close loop once
     if not hasattr(bot, "_auto_close_task"):
         bot._auto_close_task = bot.loop.create_task(auto_close_loop(bot))
 
-    print("Local tree commands:", [c.name for c in bot.tree.get_commands()])
-    print(f"Logged in as {bot.user} ✅")
+    # Start archive job once
+    if not hasattr(bot, "_archive_task"):
+        bot._archive_task = bot.loop.create_task(archive_loop(bot))
+
+    # Start scheduled snapshots once
+    if not hasattr(bot, "_snapshot_task"):
+        bot._snapshot_task = bot.loop.create_task(snapshot_loop(bot))
+
+    # Start live leaderboard updates once (picks up the message configured before a restart)
+    if not hasattr(bot, "_live_board_task"):
+        bot._live_board_task = bot.loop.create_task(live_board.run())
 
+    # Start outbox delivery once (also flushes anything left pending before a restart)
+    if not hasattr(bot, "_outbox_task"):
+        bot._outbox_task = bot.loop.create_task(outbox_worker.run())
 
-bot.run(BOT_TOKEN)
+    # Staff posts that never went out before the last shutdown (once)
+    if not hasattr(bot, "_repost_task"):
+        bot._repost_task = spawn_background(repost_unposted_submissions(bot), name="repost-submissions")
+
+    log.info("Logged in", extra={"fields": {"user": str(bot.user), "commands": [c.name for c in bot.tree.get_commands()]}})
+
+
+if __name__ == "__main__":
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is missing. Put it in your .env file.")
+    log_listener = setup_logging()
+    try:
+        bot.run(BOT_TOKEN, log_handler=None)  # discord.py logs go through our JSON handler
+    finally:
+        log_listener.stop()
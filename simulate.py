@@ -0,0 +1,179 @@
+# Offline economy simulator: how do TIERS, daily envelopes and quest rewards play out over an
+# event? Models N players in activity profiles, draws every envelope from the real TIERS table
+# (vectorised, one multinomial per player) and reports points / Dragon Mark distributions and
+# leaderboard cutoffs + ties under the bot's own sort key. Needs NumPy (requirements-dev.txt).
+#
+#   python simulate.py --players 1000000 --days 14
+#   python simulate.py --weights 60 28 10 2 --daily-award 2 --quest-reward 1 3
+#   python simulate.py --profile casual:0.7:1:0.1 --profile grinder:0.3:4:1.5
+#
+import argparse
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("simulate.py needs NumPy: pip install -r requirements-dev.txt")
+
+import bot
+
+# name: (share of players, daily claims per day, approved quests per day)
+DEFAULT_PROFILES = {
+    "casual": (0.60, 1.0, 0.15),
+    "regular": (0.30, 2.5, 0.5),
+    "grinder": (0.10, 4.0, 1.2),
+}
+CUTOFF_RANKS = (1, 10, 50, 100, 1000)
+
+
+def parse_profile(text: str) -> tuple[str, tuple[float, float, float]]:
+    try:
+        name, share, claims, quests = text.split(":")
+        return name, (float(share), float(claims), float(quests))
+    except ValueError:
+        raise argparse.ArgumentTypeError("profile must look like name:share:claims_per_day:quests_per_day")
+
+
+# =========================
+# ONE EVENT
+# =========================
+def simulate_event(rng: np.random.Generator, args, profiles: dict, weights: np.ndarray):
+    n = args.players
+    windows = args.days * 86400 // args.cooldown  # daily claims possible over the event
+
+    # players -> profile, then per-player activity drawn around the profile's mean
+    names = list(profiles)
+    shares = np.array([profiles[p][0] for p in names], dtype=float)
+    profile_idx = rng.choice(len(names), size=n, p=shares / shares.sum())
+    claims_rate = np.array([profiles[p][1] for p in names])[profile_idx]
+    quests_rate = np.array([profiles[p][2] for p in names])[profile_idx]
+
+    claim_p = np.clip(claims_rate * args.cooldown / 86400, 0, 1)
+    claims = rng.binomial(windows, claim_p)
+    approved = np.minimum(rng.poisson(quests_rate * args.days), args.quests)  # one approval per quest
+
+    rewards = np.asarray(args.quest_reward, dtype=float)
+    quest_envelopes = approved * rewards.mean()
+    if len(rewards) > 1:
+        # sum of `approved` draws from the reward mix, normal approximation
+        quest_envelopes += rng.standard_normal(n) * np.sqrt(approved) * rewards.std()
+    envelopes = claims * args.daily_award + np.rint(quest_envelopes).clip(min=0).astype(np.int64)
+
+    opened = rng.binomial(envelopes, args.open_rate)
+    counts = rng.multinomial(opened, weights / weights.sum())  # (n, tiers): every envelope at once
+
+    tier_points = np.array([t[2] for t in bot.TIERS], dtype=np.int64)
+    dragon_tiers = np.array([t[0].startswith("🟡") for t in bot.TIERS])
+    points = counts @ tier_points
+    dragon = counts[:, dragon_tiers].sum(axis=1)
+    left = envelopes - opened
+    return {
+        "profile": profile_idx, "claims": claims, "approved": approved, "envelopes_earned": envelopes,
+        "opened": opened, "points": points, "dragon": dragon, "left": left,
+    }
+
+
+def leaderboard(result: dict):
+    # same order as leaderboard_sort_key: points DESC, dragon DESC, envelopes DESC, user_id ASC
+    n = len(result["points"])
+    user_id = np.arange(n)
+    order = np.lexsort((user_id, -result["left"], -result["dragon"], -result["points"]))
+    key = np.stack([result["points"][order], result["dragon"][order], result["left"][order]], axis=1)
+
+    # ties: players whose (points, dragon, envelopes) is identical, i.e. only user_id separates them
+    boundaries = np.any(key[1:] != key[:-1], axis=1)
+    group_start = np.concatenate(([0], np.flatnonzero(boundaries) + 1))
+    group_size = np.diff(np.concatenate((group_start, [n])))
+    group_of = np.repeat(np.arange(len(group_start)), group_size)
+
+    cutoffs = {}
+    for rank in CUTOFF_RANKS:
+        if rank > n:
+            continue
+        i = rank - 1
+        cutoffs[rank] = (int(key[i, 0]), int(key[i, 1]), int(key[i, 2]), int(group_size[group_of[i]]))
+    top100 = group_size[np.unique(group_of[:min(100, n)])]
+    return cutoffs, int((top100 > 1).sum()), int(top100[top100 > 1].sum())
+
+
+# =========================
+# REPORT
+# =========================
+def pct_row(label: str, values: np.ndarray) -> str:
+    p = np.percentile(values, [50, 90, 99, 99.9])
+    return f"{label:<18} {values.mean():>8.1f} {p[0]:>7.0f} {p[1]:>7.0f} {p[2]:>7.0f} {p[3]:>7.0f} {values.max():>7.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fortune event economy simulator (NumPy)")
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=14, help="event length")
+    parser.add_argument("--runs", type=int, default=5, help="repeat the event to average the cutoffs")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--weights", type=float, nargs="+", help=f"TIERS weights (default {[t[1] for t in bot.TIERS]})")
+    parser.add_argument("--daily-award", type=int, default=bot.DAILY_ENVELOPES_AWARD)
+    parser.add_argument("--cooldown-hours", type=float, default=bot.DAILY_COOLDOWN_SECONDS / 3600)
+    parser.add_argument("--quest-reward", type=int, nargs="+", default=[2], help="envelopes per approved quest (several = mix)")
+    parser.add_argument("--quests", type=int, default=20, help="quests posted over the event (max approvals per player)")
+    parser.add_argument("--open-rate", type=float, default=0.95, help="share of earned envelopes that get opened")
+    parser.add_argument("--profile", type=parse_profile, action="append",
+                        help="name:share:claims_per_day:quests_per_day (repeatable; replaces the defaults)")
+    args = parser.parse_args()
+    args.cooldown = int(args.cooldown_hours * 3600)
+
+    weights = np.array(args.weights or [t[1] for t in bot.TIERS], dtype=float)
+    if len(weights) != len(bot.TIERS):
+        parser.error(f"--weights needs {len(bot.TIERS)} values, one per tier")
+    profiles = dict(args.profile) if args.profile else DEFAULT_PROFILES
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{args.players:,} players • {args.days} days • {args.runs} run(s) • weights {weights.tolist()} • "
+          f"daily +{args.daily_award} every {args.cooldown_hours:g}h • quest reward {args.quest_reward}")
+
+    cutoffs_runs, ties_runs = [], []
+    result = None
+    t0 = time.perf_counter()
+    for _ in range(args.runs):
+        result = simulate_event(rng, args, profiles, weights)
+        cutoffs, tied_groups, tied_players = leaderboard(result)
+        cutoffs_runs.append(cutoffs)
+        ties_runs.append((tied_groups, tied_players))
+    elapsed = time.perf_counter() - t0
+    opens = int(result["opened"].sum())
+    print(f"simulated in {elapsed:.2f}s ({elapsed / args.runs:.2f}s per event, {opens:,} envelopes opened in the last one)\n")
+
+    print("Last run, per player:")
+    print(f"{'':<18} {'mean':>8} {'p50':>7} {'p90':>7} {'p99':>7} {'p99.9':>7} {'max':>7}")
+    for label, key in (("envelopes earned", "envelopes_earned"), ("envelopes opened", "opened"),
+                       ("points", "points"), ("dragon marks", "dragon"), ("quests approved", "approved")):
+        print(pct_row(label, result[key]))
+
+    dragon = result["dragon"]
+    buckets = [int((dragon == k).sum()) for k in range(5)] + [int((dragon >= 5).sum())]
+    print("\nDragon Marks: " + " • ".join(
+        f"{k if k < 5 else '5+'}: {c / len(dragon) * 100:.1f}%" for k, c in enumerate(buckets)
+    ))
+    reached = (result["approved"] >= bot.PARTICIPATION_GOAL).mean() * 100
+    print(f"Participation goal ({bot.PARTICIPATION_GOAL} approved): {reached:.1f}% of players")
+    for i, name in enumerate(profiles):
+        mask = result["profile"] == i
+        if mask.any():
+            print(f"  {name:<10} {mask.mean() * 100:>5.1f}% of players • median points {np.median(result['points'][mask]):.0f}")
+
+    print(f"\nLeaderboard cutoffs (mean over {args.runs} run(s); points / dragon / envelopes left, players tied there):")
+    for rank in CUTOFF_RANKS:
+        rows = [c[rank] for c in cutoffs_runs if rank in c]
+        if not rows:
+            continue
+        arr = np.array(rows, dtype=float)
+        spread = f" ± {arr[:, 0].std():.1f}" if len(rows) > 1 else ""
+        print(f"  rank {rank:>5}: {arr[:, 0].mean():>7.1f} pts{spread} • 🐉 {arr[:, 1].mean():.1f} • "
+              f"🧧 {arr[:, 2].mean():.1f} • tie group of {arr[:, 3].mean():.0f}")
+    groups = np.mean([t[0] for t in ties_runs])
+    players = np.mean([t[1] for t in ties_runs])
+    print(f"Top 100: {groups:.1f} tie group(s) covering {players:.1f} players that only user_id separates")
+
+
+if __name__ == "__main__":
+    main()
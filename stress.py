@@ -0,0 +1,338 @@
+# Concurrency stress run for the envelope economy. Fires thousands of concurrent
+# /event open, daily, approve, reject, revoke and adjust calls through the real command
+# handlers against a throwaway SQLite file, then checks the books.
+#
+#   python stress.py --users 200 --rounds 5
+#   python stress.py --users 50 --rounds 20 --window-ms 0   (per-call commits)
+#   python stress.py --admission   (keep admission control on: overflow gets the "busy" reply)
+#
+# Submissions are created straight through storage (the /event submit path needs real
+# attachments); everything that moves envelopes goes through the handlers.
+import argparse
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict
+
+STAFF_ROLE = 1
+ENVELOPES_CHANNEL = 2
+REVIEW_CHANNEL = 3
+QUEST_REWARD = 2
+
+_tmp = tempfile.TemporaryDirectory(prefix="fortune-stress-")
+os.environ.update({
+    "DB_PATH": os.path.join(_tmp.name, "stress.db"),
+    "ARCHIVE_DB_PATH": os.path.join(_tmp.name, "stress_archive.db"),
+    "SNAPSHOT_DIR": os.path.join(_tmp.name, "snapshots"),
+    "PROOF_DIR": os.path.join(_tmp.name, "proofs"),
+    "COMMAND_SYNC_STATE_PATH": os.path.join(_tmp.name, "command_sync.json"),
+    "TRACE_DIR": os.path.join(_tmp.name, "traces"),
+    "STORAGE_BACKEND": "sqlite",
+    "STAFF_ROLE_ID": str(STAFF_ROLE),
+    "ENVELOPES_CHANNEL_ID": str(ENVELOPES_CHANNEL),
+    "LEDGER_CHANNEL_ID": "0",
+})
+
+import discord  # noqa: E402
+
+import bot  # noqa: E402
+
+
+# =========================
+# FAKE INTERACTIONS
+# =========================
+class FakeMember(discord.Member):
+    # is_staff() wants a real Member; only the bits the handlers read are filled in
+    def __init__(self, user_id: int, staff: bool = False):
+        self._fake_id = int(user_id)
+        self._fake_roles = [types.SimpleNamespace(id=STAFF_ROLE)] if staff else []
+
+    id = property(lambda self: self._fake_id)
+    mention = property(lambda self: f"<@{self._fake_id}>")
+    roles = property(lambda self: self._fake_roles)
+    bot = False
+
+
+class FakeResponse:
+    def __init__(self):
+        self.content = None
+        self.embed = None
+        self.deferred = False
+
+    def is_done(self) -> bool:
+        return self.deferred or self.content is not None or self.embed is not None
+
+    async def send_message(self, content=None, *, embed=None, **kwargs):
+        self.content, self.embed = content, embed
+
+    async def edit_message(self, *, content=None, embed=None, **kwargs):
+        self.content, self.embed = content, embed
+
+    async def defer(self, **kwargs):
+        self.deferred = True
+
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        return None
+
+
+class FakeInteraction:
+    _next_id = 10**18
+
+    def __init__(self, user: FakeMember, channel_id: int, message_id: int | None = None):
+        FakeInteraction._next_id += 1
+        self.id = FakeInteraction._next_id
+        self.command = None
+        self.data = {}
+        self.user = user
+        self.guild = None
+        self.channel_id = channel_id
+        self.message = types.SimpleNamespace(id=message_id) if message_id else None
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+# =========================
+# WORKLOAD
+# =========================
+class Books:
+    # what the handlers *said* happened, per user; checked against the database afterwards
+    def __init__(self):
+        self.envelopes = defaultdict(int)
+        self.daily = defaultdict(int)
+        self.opens = defaultdict(int)
+        self.approvals = defaultdict(int)  # submission_id -> successful approve clicks
+        self.rejections = defaultdict(int)
+        self.timings = defaultdict(list)  # op -> seconds
+        self.errors: list[str] = []
+
+
+class Runner:
+    def __init__(self, users: int, seed: int):
+        self.group = bot.EventCommands()
+        self.players = [FakeMember(10_000 + i) for i in range(users)]
+        self.staff = [FakeMember(1 + i, staff=True) for i in range(3)]
+        self.rng = random.Random(seed)
+        self.books = Books()
+
+    async def _call(self, op: str, coro_fn, interaction: FakeInteraction):
+        t0 = time.perf_counter()
+        interaction.command = self.group.get_command(op)  # picks the admission class; None for buttons
+        interaction.data = interaction.data or {"custom_id": op}  # names the log line / trace row
+        try:
+            if await self.group.interaction_check(interaction):
+                await coro_fn(interaction)
+        except Exception as e:
+            self.books.errors.append(f"{op}: {type(e).__name__}: {e}")
+        self.books.timings[op].append(time.perf_counter() - t0)
+        return interaction.response
+
+    def _command(self, name: str):
+        cmd = self.group.get_command(name)
+        return lambda interaction, *args: cmd.callback(self.group, interaction, *args)
+
+    async def open(self, player: FakeMember):
+        r = await self._call("open", self._command("open"), FakeInteraction(player, ENVELOPES_CHANNEL))
+        if r.embed is not None and "Opened" in (r.embed.title or ""):
+            self.books.opens[player.id] += 1
+            self.books.envelopes[player.id] -= 1
+
+    async def daily(self, player: FakeMember):
+        r = await self._call("daily", self._command("daily"), FakeInteraction(player, ENVELOPES_CHANNEL))
+        if r.content and "You claimed" in r.content:
+            self.books.daily[player.id] += 1
+            self.books.envelopes[player.id] += bot.DAILY_ENVELOPES_AWARD
+
+    async def adjust(self, player: FakeMember):
+        field = self.rng.choice(("envelopes", "points"))
+        amount = self.rng.randint(-3, 5)
+        cmd = self._command(f"adjust{field}")
+        r = await self._call(f"adjust{field}", lambda i: cmd(i, player, amount), FakeInteraction(self.rng.choice(self.staff), 0))
+        m = re.search(r"\*\*(\d+) → (\d+)\*\*", r.content or "")
+        if field == "envelopes" and m:
+            self.books.envelopes[player.id] += int(m.group(2)) - int(m.group(1))
+
+    async def review(self, submission_id: int, user_id: int, message_id: int, approve: bool):
+        view = bot.ReviewView(submission_id)
+        button = view.approve if approve else view.reject
+        interaction = FakeInteraction(self.rng.choice(self.staff), REVIEW_CHANNEL, message_id)
+        interaction.data = {"custom_id": button.custom_id}
+        r = await self._call("approve" if approve else "reject", button.callback, interaction)
+        view.stop()
+        if r.deferred and r.content is None:  # success path defers; refusals reply
+            if approve:
+                self.books.approvals[submission_id] += 1
+                self.books.envelopes[user_id] += QUEST_REWARD
+            else:
+                self.books.rejections[submission_id] += 1
+
+    async def revoke(self, submission_id: int, user_id: int):
+        cmd = self._command("revoke")
+        r = await self._call("revoke", lambda i: cmd(i, submission_id), FakeInteraction(self.rng.choice(self.staff), 0))
+        m = re.search(r"Removed \*\*(\d+) envelope", r.content or "")
+        if m:
+            self.books.envelopes[user_id] -= int(m.group(1))
+
+    async def round(self, quest_id: int, ops: int):
+        # fresh submissions for this round's quest, "posted" to the staff channel
+        subs = []
+        for player in self.rng.sample(self.players, k=max(1, len(self.players) // 2)):
+            _, sid, _, _ = await bot.storage.create_submission(player.id, quest_id, "https://example.invalid/proof.png", None)
+            if sid:
+                await bot.storage.update_submission_message(sid, 900_000 + sid, REVIEW_CHANNEL)
+                subs.append((sid, player.id))
+
+        tasks = []
+        for _ in range(ops):
+            player = self.rng.choice(self.players)
+            kind = self.rng.random()
+            if kind < 0.45:
+                tasks.append(self.open(player))
+            elif kind < 0.60:
+                tasks.append(self.daily(player))
+            elif kind < 0.75:
+                tasks.append(self.adjust(player))
+        # every submission gets two or three racing clicks: approve vs approve vs reject
+        for sid, uid in subs:
+            for _ in range(self.rng.randint(2, 3)):
+                tasks.append(self.review(sid, uid, 900_000 + sid, approve=self.rng.random() < 0.7))
+        self.rng.shuffle(tasks)
+        await asyncio.gather(*tasks)
+
+        # then revoke a third of what got approved, twice each, racing the players' opens
+        approved = [(sid, uid) for sid, uid in subs if self.books.approvals[sid]]
+        tasks = []
+        for sid, uid in self.rng.sample(approved, k=len(approved) // 3):
+            tasks += [self.revoke(sid, uid), self.revoke(sid, uid)]
+        tasks += [self.open(self.rng.choice(self.players)) for _ in range(len(tasks))]
+        self.rng.shuffle(tasks)
+        await asyncio.gather(*tasks)
+
+
+# =========================
+# INVARIANTS
+# =========================
+def check_invariants(db_path: str, books: Books) -> list[str]:
+    failures = []
+    db = sqlite3.connect(db_path)
+    users = {uid: (env, pts, drg) for uid, env, pts, drg in db.execute("SELECT user_id, envelopes, points, dragon FROM users")}
+
+    negative = [uid for uid, row in users.items() if min(row) < 0]
+    if negative:
+        failures.append(f"negative balances: {negative[:10]}")
+
+    wrong = [
+        (uid, expected, users.get(uid, (0,))[0])
+        for uid, expected in books.envelopes.items()
+        if users.get(uid, (0,))[0] != expected
+    ]
+    if wrong:
+        failures.append(f"{len(wrong)} users' envelopes don't match the handlers' replies, e.g. (user, expected, db) {wrong[:5]}")
+
+    double_daily = [uid for uid, n in books.daily.items() if n > 1]
+    if double_daily:
+        failures.append(f"daily claimed twice inside the cooldown: {double_daily[:10]}")
+
+    subs = {sid: (status, awarded) for sid, status, awarded in db.execute(
+        "SELECT submission_id, status, reward_envelopes_awarded FROM submissions"
+    )}
+    for sid, (status, awarded) in subs.items():
+        approvals, rejections = books.approvals[sid], books.rejections[sid]
+        if approvals + rejections > 1:
+            failures.append(f"submission #{sid} reviewed {approvals + rejections} times ({approvals} approve, {rejections} reject)")
+        if status in ("APPROVED", "REVOKED") and (approvals != 1 or awarded != QUEST_REWARD):
+            failures.append(f"submission #{sid} is {status} with {approvals} approve click(s) and {awarded} awarded")
+        if status == "REJECTED" and (rejections != 1 or awarded != 0):
+            failures.append(f"submission #{sid} is REJECTED with {rejections} reject click(s) and {awarded} awarded")
+        if status == "PENDING" and (approvals or rejections):
+            failures.append(f"submission #{sid} still PENDING after a successful review")
+
+    counters = dict(db.execute("SELECT name, value FROM event_counters"))
+    opens = sum(books.opens.values())
+    if counters.get("envelopes_opened", 0) != opens:
+        failures.append(f"envelopes_opened counter {counters.get('envelopes_opened', 0)} != {opens} successful opens")
+    awarded = sum(books.approvals.values()) * QUEST_REWARD
+    if counters.get("envelopes_awarded", 0) != awarded:
+        failures.append(f"envelopes_awarded counter {counters.get('envelopes_awarded', 0)} != {awarded} from approvals")
+    points = sum(row[1] for row in users.values())
+    if points != counters.get("points_awarded", 0) + counters.get("points_adjusted", 0):
+        failures.append(f"sum(points) {points} != points_awarded + points_adjusted counters")
+
+    stale = [
+        uid for uid, row in bot.storage.user_cache.rows.items()
+        if (row.envelopes, row.points, row.dragon) != users.get(uid)
+    ]
+    if stale:
+        failures.append(f"user cache disagrees with the database for {len(stale)} users, e.g. {stale[:5]}")
+
+    db.close()
+    return failures
+
+
+# =========================
+# MAIN
+# =========================
+async def main(args) -> int:
+    bot.OPEN_COOLDOWN_SECONDS = 0  # let the same player's opens race each other
+    bot.admission.enabled = args.admission  # off by default: every call should reach the handlers
+    if args.window_ms is not None:
+        bot.storage = bot.SQLiteStorage(os.environ["DB_PATH"], batch_window_ms=args.window_ms)
+    await bot.storage.init()
+
+    runner = Runner(args.users, args.seed)
+    t0 = time.perf_counter()
+    for r in range(args.rounds):
+        quest_id = await bot.storage.create_quest(f"Stress quest {r + 1}", "—", None, QUEST_REWARD, None, 0, 0)
+        await runner.round(quest_id, args.ops)
+    elapsed = time.perf_counter() - t0
+    await bot.storage.close()
+
+    books = runner.books
+    total = sum(len(t) for t in books.timings.values())
+    print(f"{total} handler calls in {elapsed:.2f}s • {total / elapsed:.0f} calls/s • {bot.storage.commits} commits")
+    print(f"{'op':<16} {'calls':>7} {'p50':>8} {'p95':>8} {'max':>8}")
+    for op, times in sorted(books.timings.items()):
+        print(
+            f"{op:<16} {len(times):>7} {bot.percentile(times, 50) * 1000:>6.1f}ms "
+            f"{bot.percentile(times, 95) * 1000:>6.1f}ms {max(times) * 1000:>6.1f}ms"
+        )
+    print(
+        f"opens {sum(books.opens.values())} • daily {sum(books.daily.values())} • "
+        f"approved {sum(books.approvals.values())} • rejected {sum(books.rejections.values())}"
+    )
+    if args.admission:
+        for c in bot.admission.snapshot():
+            print(
+                f"admission {c['class']:<6} admitted {c['admitted']} • busy {c['rejected']} full / "
+                f"{c['timed_out']} timed out • peak queue {c['peak_depth']}/{c['queue_size']} • "
+                f"wait p95 {c['wait_p95'] * 1000:.0f}ms"
+            )
+
+    failures = [f"handler error: {e}" for e in books.errors[:10]] + check_invariants(os.environ["DB_PATH"], books)
+    if failures:
+        print(f"\n❌ {len(failures)} invariant failure(s):")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    print("\n✅ invariants hold: no negative balances, envelopes match every reply, one award per approval")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fortune bot concurrency stress run (real SQLite, fake interactions)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--ops", type=int, default=2000, help="player/staff commands per round (besides reviews)")
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--window-ms", type=float, default=None, help="group-commit window (default: WRITE_BATCH_WINDOW_MS)")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on (shed calls count as refusals)")
+    code = asyncio.run(main(parser.parse_args()))
+    _tmp.cleanup()
+    sys.exit(code)
@@ -0,0 +1,68 @@
+# Storage conformance suite: every test runs once against SQLiteStorage (temp files) and once
+# against MemoryStorage, and both must give the same answers.
+#
+#   python -m pytest -q
+#
+import asyncio
+import inspect
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory(prefix="fortune-tests-")
+os.environ.update({
+    "DB_PATH": os.path.join(_tmp.name, "event.db"),
+    "ARCHIVE_DB_PATH": os.path.join(_tmp.name, "event_archive.db"),
+    "SNAPSHOT_DIR": os.path.join(_tmp.name, "snapshots"),
+    "PROOF_DIR": os.path.join(_tmp.name, "proofs"),
+    "COMMAND_SYNC_STATE_PATH": os.path.join(_tmp.name, "command_sync.json"),
+    "TRACE_DIR": os.path.join(_tmp.name, "traces"),
+    "TRACE_SAMPLE_RATE": "0",
+    "TRACE_SLOW_MS": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        return bot.SQLiteStorage(str(tmp_path / "event.db"), archive_path=str(tmp_path / "archive.db"))
+    return bot.MemoryStorage()
+
+
+@pytest.fixture
+def app(storage, monkeypatch):
+    # for tests that call command handlers / buttons: they use the module-level storage.
+    # Fake members and interactions come from stress.py.
+    from stress import STAFF_ROLE
+    monkeypatch.setattr(bot, "storage", storage)
+    monkeypatch.setattr(bot, "STAFF_ROLE_ID", STAFF_ROLE)
+    monkeypatch.setattr(bot, "SUBMISSIONS_CHANNEL_ID", 0)
+    monkeypatch.setattr(bot, "LEDGER_CHANNEL_ID", 0)
+    monkeypatch.setattr(bot, "open_cooldowns", {})
+    return storage
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # async tests run in a fresh loop; `storage` is initialised and closed inside that loop
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+
+    async def run():
+        storage = pyfuncitem.funcargs.get("storage")  # also when only a fixture built on it is used
+        if storage is not None:
+            await storage.init()
+        try:
+            await pyfuncitem.obj(**kwargs)
+        finally:
+            if storage is not None:
+                await storage.close()
+
+    asyncio.run(run())
+    return True
@@ -0,0 +1,92 @@
+import asyncio
+
+import bot
+from stress import FakeInteraction, FakeMember
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _interaction(command_name=None, custom_id=None):
+    interaction = FakeInteraction(FakeMember(7), 0)
+    interaction.command = bot.EventCommands().get_command(command_name) if command_name else None
+    interaction.data = {"custom_id": custom_id} if custom_id else {}
+    return interaction
+
+
+def test_admission_classes():
+    assert bot.admission_class(_interaction("open")) == "write"
+    assert bot.admission_class(_interaction("daily")) == "write"
+    assert bot.admission_class(_interaction("balance")) == "read"
+    assert bot.admission_class(_interaction("adjustpoints")) == "staff"
+    assert bot.admission_class(_interaction(custom_id="review:approve:5")) == "staff"
+    assert bot.admission_class(_interaction(custom_id="leaderboard:next")) == "read"
+
+
+async def test_full_class_queues_then_turns_away():
+    controller = bot.AdmissionController({"write": (2, 1)}, max_wait=5)
+    assert await controller.acquire("write")
+    assert await controller.acquire("write")
+    waiting = asyncio.ensure_future(controller.acquire("write"))
+    await _settle()
+    assert not await controller.acquire("write")  # queue of 1 is full
+
+    controller._release(controller.classes["write"])
+    assert await waiting  # the freed slot went straight to the waiter
+    [stats] = controller.snapshot()
+    assert (stats["running"], stats["depth"], stats["admitted"], stats["rejected"], stats["peak_depth"]) == (2, 0, 3, 1, 1)
+
+
+async def test_waiter_gives_up_after_max_wait():
+    controller = bot.AdmissionController({"read": (1, 5)}, max_wait=0.05)
+    assert await controller.acquire("read")
+    assert not await controller.acquire("read")
+    cls = controller.classes["read"]
+    assert (cls.timed_out, len(cls.waiters), cls.running) == (1, 0, 1)
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    controller = bot.AdmissionController({"read": (1, 5)}, max_wait=5)
+    assert await controller.acquire("read")
+    waiter = asyncio.ensure_future(controller.acquire("read"))
+    await _settle()
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    cls = controller.classes["read"]
+    assert not cls.waiters
+    controller._release(cls)
+    assert cls.running == 0
+
+
+async def test_admit_replies_busy_and_frees_slots_when_the_task_ends():
+    controller = bot.AdmissionController({"read": (1, 0), "write": (1, 0), "staff": (1, 0)}, max_wait=1)
+    release = asyncio.Event()
+
+    async def handle(interaction):
+        if await controller.admit(interaction):
+            await release.wait()
+            return True
+        return False
+
+    first = asyncio.ensure_future(handle(_interaction("open")))
+    await _settle()
+    turned_away = _interaction("open")
+    assert not await handle(turned_away)
+    assert turned_away.response.content == bot.BUSY_MESSAGE
+
+    # other classes have their own slots
+    staff = asyncio.ensure_future(handle(_interaction("adjustpoints")))
+    await _settle()
+    assert controller.classes["staff"].running == 1
+
+    release.set()
+    assert await first and await staff
+    await _settle()
+    assert [c.running for c in controller.classes.values()] == [0, 0, 0]
+
+
+async def test_disabled_controller_admits_everything():
+    controller = bot.AdmissionController({"write": (0, 0)}, max_wait=1, enabled=False)
+    assert await controller.admit(_interaction("open"))
@@ -0,0 +1,78 @@
+import discord
+from discord import app_commands
+
+import bot
+
+
+def make_tree(*commands) -> app_commands.CommandTree:
+    tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+    for cmd in commands:
+        tree.add_command(cmd)
+    return tree
+
+
+def ping_command(description="Ping."):
+    @app_commands.command(name="ping", description=description)
+    async def ping(interaction: discord.Interaction):
+        pass
+    return ping
+
+
+def test_hash_is_stable_and_ignores_registration_order():
+    first = bot.command_tree_hash(make_tree(bot.EventCommands(), ping_command()), None)
+    again = bot.command_tree_hash(make_tree(ping_command(), bot.EventCommands()), None)
+    assert first == again
+    assert len(first) == 64
+
+
+def test_hash_changes_with_the_commands():
+    base = bot.command_tree_hash(make_tree(bot.EventCommands(), ping_command()), None)
+    assert bot.command_tree_hash(make_tree(bot.EventCommands(), ping_command("Pong.")), None) != base
+    assert bot.command_tree_hash(make_tree(bot.EventCommands()), None) != base
+
+
+def test_hash_is_per_scope():
+    tree = make_tree(ping_command())
+    guild = discord.Object(id=1234)
+    assert bot.command_tree_hash(tree, guild) == bot.command_tree_hash(make_tree(), guild)  # nothing in the guild yet
+    tree.copy_global_to(guild=guild)
+    assert bot.command_tree_hash(tree, guild) == bot.command_tree_hash(tree, None)
+
+
+async def test_sync_is_skipped_when_the_tree_is_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "COMMAND_SYNC_STATE_PATH", str(tmp_path / "sync.json"))
+    monkeypatch.setattr(bot, "FORCE_COMMAND_SYNC", False)
+    monkeypatch.setattr(bot, "GUILD_ID", 0)
+    client = bot.bot
+    if not any(cmd.name == "event" for cmd in client.tree.get_commands()):
+        client.tree.add_command(bot.EventCommands())
+
+    synced = []
+
+    async def fake_sync(guild=None):
+        synced.append(guild)
+        return []
+
+    monkeypatch.setattr(client.tree, "sync", fake_sync)
+    await client.sync_commands_if_changed()
+    await client.sync_commands_if_changed()
+    assert synced == [None]
+    assert list(bot.load_command_sync_state().values()) == [bot.command_tree_hash(client.tree, None)]
+
+    monkeypatch.setattr(bot, "FORCE_COMMAND_SYNC", True)
+    await client.sync_commands_if_changed()
+    assert synced == [None, None]
+
+
+async def test_failed_sync_is_retried_next_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "COMMAND_SYNC_STATE_PATH", str(tmp_path / "sync.json"))
+    monkeypatch.setattr(bot, "FORCE_COMMAND_SYNC", False)
+    monkeypatch.setattr(bot, "GUILD_ID", 0)
+    client = bot.bot
+
+    async def failing_sync(guild=None):
+        raise discord.HTTPException(type("Response", (), {"status": 500, "reason": "boom"})(), "boom")
+
+    monkeypatch.setattr(client.tree, "sync", failing_sync)
+    await client.sync_commands_if_changed()
+    assert bot.load_command_sync_state() == {}
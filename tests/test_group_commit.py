@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+import bot
+
+
+async def _writer(tmp_path, window=0.02, max_batch=64):
+    path = str(tmp_path / "w.db")
+    storage = bot.SQLiteStorage(path, batch_window_ms=0, archive_path=str(tmp_path / "a.db"))
+    await storage.init()
+    writer = bot.GroupCommitWriter(path, window, max_batch)
+    return storage, writer
+
+
+def insert_daily(user_id, fail=False):
+    async def op(db):
+        await db.execute("INSERT INTO daily_claims(user_id, last_claim_at) VALUES (?, ?)", (user_id, int(time.time())))
+        if fail:
+            raise RuntimeError("op failed")
+        return user_id
+    return op
+
+
+async def _claimed(storage):
+    return {uid for uid in range(100) if not (await storage.can_claim_daily(uid))[0]}
+
+
+async def test_ops_in_one_window_share_a_commit(tmp_path):
+    storage, writer = await _writer(tmp_path)
+    results = await asyncio.gather(*(writer.submit(insert_daily(uid)) for uid in range(10)))
+    assert results == list(range(10))
+    assert (writer.commits, writer.ops) == (1, 10)
+    await writer.close()
+    assert await _claimed(storage) == set(range(10))
+
+
+async def test_max_batch_splits_commits(tmp_path):
+    storage, writer = await _writer(tmp_path, max_batch=4)
+    await asyncio.gather(*(writer.submit(insert_daily(uid)) for uid in range(10)))
+    assert writer.commits == 3
+    await writer.close()
+
+
+async def test_failing_op_rolls_back_only_itself(tmp_path):
+    storage, writer = await _writer(tmp_path)
+    ran = []
+
+    def op_with_hook(uid, fail):
+        async def op(db):
+            bot.after_commit(lambda: ran.append(uid))
+            return await insert_daily(uid, fail)(db)
+        return op
+
+    results = await asyncio.gather(
+        writer.submit(op_with_hook(1, False)),
+        writer.submit(op_with_hook(2, True)),
+        writer.submit(op_with_hook(3, False)),
+        return_exceptions=True,
+    )
+    assert results[0] == 1 and results[2] == 3
+    assert isinstance(results[1], RuntimeError)
+    assert writer.commits == 1
+    assert ran == [1, 3]  # the rolled-back op's callback never runs
+    await writer.close()
+    assert await _claimed(storage) == {1, 3}
+
+
+async def test_failed_commit_fails_every_caller_and_runs_no_hooks(tmp_path):
+    storage, writer = await _writer(tmp_path)
+    ran = []
+
+    async def op(db):
+        bot.after_commit(lambda: ran.append("hook"))
+        await db.execute("INSERT INTO daily_claims(user_id, last_claim_at) VALUES (1, 1)")
+
+    async def breaks_transaction(db):
+        await db.execute("COMMIT")  # ends the batch transaction early, so the batch COMMIT fails
+
+    results = await asyncio.gather(writer.submit(op), writer.submit(breaks_transaction), return_exceptions=True)
+    assert all(isinstance(r, Exception) for r in results)
+    assert ran == []
+    await writer.close()
+
+
+async def test_close_finishes_queued_writes(tmp_path):
+    storage, writer = await _writer(tmp_path, window=0.05)
+    pending = [asyncio.ensure_future(writer.submit(insert_daily(uid))) for uid in range(5)]
+    await asyncio.sleep(0)
+    await writer.close()
+    assert [p.result() for p in pending] == list(range(5))
+    assert await _claimed(storage) == set(range(5))
+
+
+async def test_cancelled_writer_fails_waiting_callers(tmp_path):
+    storage, writer = await _writer(tmp_path)
+    started = asyncio.Event()
+
+    async def slow(db):
+        started.set()
+        await asyncio.sleep(10)
+
+    first = asyncio.ensure_future(writer.submit(slow))
+    await started.wait()
+    second = asyncio.ensure_future(writer.submit(insert_daily(1)))
+    await asyncio.sleep(0)
+    writer.task.cancel()
+    for fut in (first, second):
+        with pytest.raises(RuntimeError, match="writer closed"):
+            await asyncio.wait_for(fut, 2)
+    await writer.close()
+    assert await _claimed(storage) == set()
+
+
+@pytest.mark.parametrize("window_ms", [0, 5])
+async def test_user_cache_changes_only_after_commit(tmp_path, window_ms):
+    storage = bot.SQLiteStorage(str(tmp_path / "c.db"), batch_window_ms=window_ms, archive_path=str(tmp_path / "a.db"))
+    await storage.init()
+    await storage.add_envelopes(1, 3)
+    assert storage.user_cache.get(1).envelopes == 3
+
+    seen = []
+
+    async def op(db):
+        await storage._cache_user(db, 1, "UPDATE users SET envelopes = 99 WHERE user_id = 1 RETURNING envelopes, points, dragon", ())
+        seen.append(storage.user_cache.get(1).envelopes)  # not committed yet
+        raise RuntimeError("op failed")
+
+    with pytest.raises(RuntimeError):
+        await storage._write(op)
+    assert seen == [3]
+    assert storage.user_cache.get(1).envelopes == 3
+    assert await storage.grant_envelopes([1, 2], 2) == 2
+    assert storage.user_cache.get(1).envelopes == 5
+    assert 2 not in storage.user_cache
+    await storage.close()
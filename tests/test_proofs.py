@@ -0,0 +1,129 @@
+import io
+import os
+
+from PIL import Image, ImageDraw
+
+import bot
+
+
+def screenshot(seed: int, size=(800, 600), fmt="PNG", quality=90) -> bytes:
+    # a fake screenshot: gradient background plus a few blocks that depend on `seed`
+    im = Image.new("RGB", size)
+    draw = ImageDraw.Draw(im)
+    w, h = size
+    for x in range(0, w, 8):
+        draw.rectangle([x, 0, x + 8, h], fill=((x * 255) // w, 40 + seed * 30 % 200, 120))
+    for i in range(4):
+        x0 = (seed * 97 + i * 173) % (w - 200)
+        y0 = (seed * 61 + i * 89) % (h - 150)
+        draw.rectangle([x0, y0, x0 + 200, y0 + 150], fill=((seed * 50 + i * 60) % 256, 255 - i * 50, (seed * 20) % 256))
+    out = io.BytesIO()
+    im.save(out, fmt, **({"quality": quality} if fmt == "JPEG" else {}))
+    return out.getvalue()
+
+
+def resized(data: bytes, size) -> bytes:
+    out = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as im:
+        im.resize(size).save(out, "JPEG", quality=75)
+    return out.getvalue()
+
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# =========================
+# PERCEPTUAL HASH
+# =========================
+def test_phash_survives_reencoding_and_resizing():
+    original = bot.perceptual_hash(screenshot(1))
+    for copy in (screenshot(1, fmt="JPEG", quality=60), resized(screenshot(1), (400, 300))):
+        assert distance(original, bot.perceptual_hash(copy)) <= bot.PROOF_NEAR_DUP_DISTANCE
+
+
+def test_phash_tells_different_screenshots_apart():
+    hashes = [bot.perceptual_hash(screenshot(seed)) for seed in range(1, 6)]
+    for i, a in enumerate(hashes):
+        for b in hashes[i + 1:]:
+            assert distance(a, b) > bot.PROOF_NEAR_DUP_DISTANCE
+
+
+def test_phash_of_non_image_is_none():
+    assert bot.perceptual_hash(b"not an image") is None
+
+
+def test_phash_fits_sqlite_and_bands():
+    phash = 0xFFFF_0000_1234_ABCD
+    stored = bot.to_sqlite_int64(phash)
+    assert -(2 ** 63) <= stored < 2 ** 63
+    assert stored & 0xFFFFFFFFFFFFFFFF == phash
+    assert bot.phash_bands(phash) == [0xABCD, 0x1234, 0x0000, 0xFFFF]
+    assert bot.to_sqlite_int64(None) is None
+
+
+def test_filter_proof_matches():
+    phash = 0x0F0F0F0F0F0F0F0F
+    rows = [
+        (1, 10, 100, "x" * 64, bot.to_sqlite_int64(phash ^ 0xFF)),  # 8 bits off, same file
+        (2, 11, 100, "y" * 64, bot.to_sqlite_int64(phash ^ 0b11)),  # 2 bits off
+        (3, 12, 100, "z" * 64, bot.to_sqlite_int64(phash ^ 0xFFFF)),  # 16 bits off
+        (4, 13, 100, "w" * 64, None),
+    ]
+    assert bot.filter_proof_matches(rows, "x" * 64, phash, 3) == [(1, 10, 100, 0, "x" * 64), (2, 11, 100, 2, "y" * 64)]
+    assert bot.filter_proof_matches(rows, "q" * 64, None, 3) == []
+
+
+# =========================
+# PROOF STORE
+# =========================
+def test_put_stores_each_file_once(tmp_path):
+    store = bot.ProofStore(str(tmp_path), 1024 * 1024)
+    data = screenshot(1)
+    sha, phash = store.put(data)
+    assert store.put(data) == (sha, phash)
+    assert open(store.path_for(sha), "rb").read() == data
+    assert os.listdir(tmp_path / sha[:2]) == [sha]
+
+
+def test_thumbnails_are_cached_and_capped(tmp_path):
+    store = bot.ProofStore(str(tmp_path), 1)  # room for one thumbnail only
+    first, _ = store.put(screenshot(1))
+    second, _ = store.put(screenshot(2))
+
+    path = store.thumbnail(first)
+    with Image.open(path) as im:
+        assert max(im.size) == bot.PROOF_THUMB_SIZE
+    assert store.thumbnail(first) == path
+
+    store.thumbnail(second)
+    assert os.listdir(tmp_path / "thumbs") == [f"{second}.jpg"]  # least recently used went first
+    assert store.thumbnail("0" * 64) is None
+
+
+def test_thumbnail_index_survives_restart(tmp_path):
+    store = bot.ProofStore(str(tmp_path), 1024 * 1024)
+    sha, _ = store.put(screenshot(1))
+    store.thumbnail(sha)
+    again = bot.ProofStore(str(tmp_path), 1024 * 1024)
+    assert again.thumbnail(sha) == store.thumbnail(sha)
+    assert list(again._thumbs) == [sha]
+
+
+# =========================
+# DEDUP (store + proof index, both backends)
+# =========================
+async def test_reencoded_proof_is_flagged_as_duplicate(storage, tmp_path):
+    store = bot.ProofStore(str(tmp_path / "proofs"), 1024 * 1024)
+    qid = await storage.create_quest("Q", "b", None, 1, None, 0, 0)
+    first = (await storage.create_submission(1, qid, "u", None))[1]
+    sha, phash = store.put(screenshot(3))
+    await storage.record_proof(first, sha, phash)
+
+    copy_sha, copy_phash = store.put(screenshot(3, fmt="JPEG", quality=70))
+    assert copy_sha != sha
+    matches = await storage.find_proof_matches(copy_sha, copy_phash, bot.PROOF_NEAR_DUP_DISTANCE)
+    assert [(m[0], m[1]) for m in matches] == [(first, 1)]
+
+    other_sha, other_phash = store.put(screenshot(4))
+    assert await storage.find_proof_matches(other_sha, other_phash, bot.PROOF_NEAR_DUP_DISTANCE) == []
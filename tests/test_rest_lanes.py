@@ -0,0 +1,124 @@
+import asyncio
+import types
+
+import bot
+from stress import FakeInteraction, FakeMember
+
+LANES = {"interaction": (0, 2), "notify": (2, 2), "ledger": (3, 1)}
+
+
+async def _request(dispatcher, lane, order, release=None):
+    async with dispatcher.slot(lane):
+        order.append(lane)
+        if release is not None:
+            await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_freed_slots_go_to_the_highest_priority_lane():
+    dispatcher = bot.RestDispatcher(LANES, max_inflight=1)
+    order, release = [], asyncio.Event()
+    busy = asyncio.ensure_future(_request(dispatcher, "notify", order, release))
+    await _settle()
+
+    # queued lowest priority first
+    waiting = [asyncio.ensure_future(_request(dispatcher, lane, order)) for lane in ("ledger", "notify", "interaction")]
+    await _settle()
+    assert [s["depth"] for s in dispatcher.snapshot()] == [1, 1, 1]
+
+    release.set()
+    await asyncio.gather(busy, *waiting)
+    assert order == ["notify", "interaction", "notify", "ledger"]
+    assert dispatcher.inflight == 0
+
+
+async def test_lane_cap_only_holds_back_its_own_lane():
+    dispatcher = bot.RestDispatcher(LANES, max_inflight=10)
+    order, release = [], asyncio.Event()
+    ledger = [asyncio.ensure_future(_request(dispatcher, "ledger", order, release)) for _ in range(5)]
+    await _settle()
+    assert order == ["ledger"]  # cap 1
+
+    reply = asyncio.ensure_future(_request(dispatcher, "interaction", order))
+    await asyncio.wait_for(reply, 1)  # a ledger burst never delays a reply
+    assert order == ["ledger", "interaction"]
+
+    release.set()
+    await asyncio.gather(*ledger)
+    assert dispatcher.lanes["ledger"].served == 5
+
+
+async def test_new_low_priority_request_does_not_jump_the_queue():
+    dispatcher = bot.RestDispatcher(LANES, max_inflight=1)
+    order, release = [], asyncio.Event()
+    busy = asyncio.ensure_future(_request(dispatcher, "notify", order, release))
+    await _settle()
+    reply = asyncio.ensure_future(_request(dispatcher, "interaction", order))
+    await _settle()
+    release.set()
+    late = asyncio.ensure_future(_request(dispatcher, "ledger", order))  # arrives as the slot frees up
+    await asyncio.gather(busy, reply, late)
+    assert order == ["notify", "interaction", "ledger"]
+
+
+async def test_cancelled_waiter_gives_its_slot_back():
+    dispatcher = bot.RestDispatcher(LANES, max_inflight=1)
+    order, release = [], asyncio.Event()
+    busy = asyncio.ensure_future(_request(dispatcher, "notify", order, release))
+    await _settle()
+    gone = asyncio.ensure_future(_request(dispatcher, "interaction", order))
+    after = asyncio.ensure_future(_request(dispatcher, "ledger", order))
+    await _settle()
+    gone.cancel()
+    release.set()
+    await asyncio.gather(busy, after)
+    assert order == ["notify", "ledger"]
+    assert dispatcher.inflight == 0
+
+
+async def test_unknown_lane_uses_notify():
+    dispatcher = bot.RestDispatcher(LANES, max_inflight=1)
+    await _request(dispatcher, "nope", [])
+    assert dispatcher.lanes["notify"].served == 1
+
+
+# =========================
+# HANDLERS DON'T WAIT ON THE LEDGER
+# =========================
+class StuckChannel:
+    # a ledger channel whose sends hang, like a ledger lane that is backed up
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+
+    async def send(self, text):
+        await self.release.wait()
+        self.sent.append(text)
+
+
+async def test_commands_reply_while_the_ledger_is_backed_up(app, monkeypatch):
+    ledger = StuckChannel()
+    monkeypatch.setattr(bot, "LEDGER_CHANNEL_ID", 42)
+    guild = types.SimpleNamespace(id=1, get_channel=lambda cid: ledger if cid == 42 else None)
+    group = bot.EventCommands()
+    player, staff = FakeMember(7), FakeMember(1, staff=True)
+
+    calls = [
+        (group.get_command("daily"), FakeInteraction(player, 0), ()),
+        (group.get_command("open"), FakeInteraction(player, 0), ()),
+        (group.get_command("adjustpoints"), FakeInteraction(staff, 0), (player, 5)),
+        (group.get_command("adjustenvelopes"), FakeInteraction(staff, 0), (player, 1)),
+        (group.get_command("adjustdragon"), FakeInteraction(staff, 0), (player, 1)),
+    ]
+    for cmd, interaction, args in calls:
+        interaction.guild = guild
+        await asyncio.wait_for(cmd.callback(group, interaction, *args), 1)
+        assert interaction.response.is_done(), cmd.name
+
+    ledger.release.set()
+    await _settle()
+    assert len(ledger.sent) == len(calls)
@@ -0,0 +1,60 @@
+import json
+import time
+
+import pytest
+
+import bot
+from stress import FakeInteraction, FakeMember
+
+
+async def _pending(storage) -> int:
+    qid = await storage.create_quest("Q", "b", None, 2, None, 0, 0)
+    return (await storage.create_submission(7, qid, "https://x/p.png", None))[1]
+
+
+async def _click(submission_id: int, approve: bool, message_id: int):
+    view = bot.ReviewView(submission_id)
+    interaction = FakeInteraction(FakeMember(1, staff=True), 999, message_id)
+    await (view.approve if approve else view.reject).callback(interaction)
+    view.stop()
+    return interaction.response
+
+
+async def _effects(storage):
+    return [(kind, channel, json.loads(payload)) for _, kind, channel, payload, _ in await storage.due_effects(time.time(), 50)]
+
+
+@pytest.mark.parametrize("approve", [True, False])
+async def test_review_edits_the_staff_post(app, approve):
+    sid = await _pending(app)
+    await app.update_submission_message(sid, 55, 66)
+    response = await _click(sid, approve, message_id=55)
+    assert response.deferred and response.content is None
+    [(kind, channel, payload)] = await _effects(app)
+    assert (kind, channel, payload["message_id"], payload["submission_id"]) == ("review_result", 66, 55, sid)
+
+
+@pytest.mark.parametrize("approve", [True, False])
+async def test_review_without_staff_post_skips_the_edit(app, approve):
+    # reviewed from the ephemeral /event nextreview message: that message can't be edited later
+    sid = await _pending(app)
+    response = await _click(sid, approve, message_id=12345)
+    assert response.deferred and response.content is None
+    assert await _effects(app) == []
+    assert (await app.get_submission(sid))[5] == ("APPROVED" if approve else "REJECTED")
+    assert await app.get_user_stats(7) == ((2, 0, 0) if approve else (0, 0, 0))
+
+
+async def test_revoke_refuses_archived_submissions(app):
+    sid = await _pending(app)
+    qid = (await app.get_submission(sid))[2]
+    await app.review_submission(sid, "APPROVED", 2)
+    await app.close_quest(qid)
+    assert (await app.archive_batch(int(time.time()) + 1, 100))[1] == 1
+
+    group = bot.EventCommands()
+    interaction = FakeInteraction(FakeMember(1, staff=True), 0)
+    await group.get_command("revoke").callback(group, interaction, sid)
+    assert "archived" in interaction.response.content
+    assert (await app.get_submission(sid))[5] == "APPROVED"
+    assert await app.get_user_stats(7) == (2, 0, 0)
@@ -0,0 +1,387 @@
+import json
+import time
+
+import pytest
+
+import bot
+
+
+def same_rows(rows):
+    return [tuple(r) for r in rows]
+
+
+# =========================
+# USERS
+# =========================
+async def test_new_user_has_nothing(storage):
+    assert await storage.get_user_stats(1) == (0, 0, 0)
+    assert await storage.count_users() == 0
+    assert await storage.get_rank_row(1) == {"user_id": 1, "points": 0, "envelopes": 0, "dragon": 0, "rank": 1, "total": 1}
+
+
+async def test_add_and_consume_envelopes(storage):
+    await storage.add_envelopes(1, 2)
+    assert await storage.consume_envelope_and_award(1, 8, True, bot.TIERS[3][0])
+    assert await storage.consume_envelope_and_award(1, 1, False, bot.TIERS[0][0])
+    assert not await storage.consume_envelope_and_award(1, 1, False, bot.TIERS[0][0])
+    assert not await storage.consume_envelope_and_award(2, 1, False)  # no row, nothing to spend
+    assert await storage.get_user_stats(1) == (0, 9, 1)
+    assert await storage.get_user_stats(2) == (0, 0, 0)
+
+
+async def test_grant_envelopes_dedupes(storage):
+    await storage.add_envelopes(1, 1)
+    await storage.get_user_stats(1)  # cached on SQLite
+    assert await storage.grant_envelopes([1, 2, 2, 3], 5) == 3
+    assert [await storage.get_user_stats(u) for u in (1, 2, 3)] == [(6, 0, 0), (5, 0, 0), (5, 0, 0)]
+    assert await storage.grant_envelopes([], 5) == 0
+    assert (await storage.get_counters())["envelopes_granted"] == 16  # add_envelopes counts too
+
+
+@pytest.mark.parametrize("field, delta, expected", [
+    ("envelopes", 5, (3, 8)),
+    ("points", -50, (0, 0)),
+    ("dragon", 2, (0, 2)),
+])
+async def test_adjust_user_field_clamps_at_zero(storage, field, delta, expected):
+    await storage.add_envelopes(1, 3)
+    assert await storage.adjust_user_field(1, field, delta) == expected
+
+
+async def test_adjust_user_field_rejects_other_columns(storage):
+    with pytest.raises(ValueError):
+        await storage.adjust_user_field(1, "user_id", 1)
+
+
+async def test_leaderboard_order_and_rank(storage):
+    # points DESC, dragon DESC, envelopes DESC, user_id ASC
+    for uid, (envelopes, points, dragon) in {
+        1: (0, 5, 0), 2: (3, 5, 0), 3: (0, 5, 1), 4: (0, 9, 0), 5: (3, 5, 0),
+    }.items():
+        await storage.adjust_user_field(uid, "envelopes", envelopes)
+        await storage.adjust_user_field(uid, "points", points)
+        await storage.adjust_user_field(uid, "dragon", dragon)
+
+    assert await storage.count_users() == 5
+    assert same_rows(await storage.top_leaderboard_page(0, 10)) == [
+        (4, 9, 0, 0), (3, 5, 0, 1), (2, 5, 3, 0), (5, 5, 3, 0), (1, 5, 0, 0),
+    ]
+    assert same_rows(await storage.top_leaderboard_page(3, 10)) == [(5, 5, 3, 0), (1, 5, 0, 0)]
+    assert (await storage.get_rank_row(5))["rank"] == 4
+    assert same_rows(await storage.get_rank_context(2, around=1)) == [
+        (1, 4, 9, 0, 0), (2, 3, 5, 0, 1), (3, 2, 5, 3, 0),
+    ]
+
+
+# =========================
+# QUESTS
+# =========================
+async def test_create_and_close_quest(storage):
+    qid = await storage.create_quest("  Lantern hunt ", " Find it ", None, 2, None, 11, 22)
+    quest = await storage.get_quest(qid)
+    assert quest[:9] == (qid, "Lantern hunt", "Find it", None, 2, None, 1, 11, 22)
+    assert same_rows(await storage.list_active_quests()) == [(qid, "Lantern hunt", 2)]
+
+    assert await storage.close_quest(qid, effects=[bot.effect_quest_closed(22, 11)])
+    assert not await storage.close_quest(qid)
+    assert not await storage.close_quest(999)
+    assert (await storage.get_quest(qid))[6] == 0
+    assert await storage.list_active_quests() == []
+    assert await storage.get_quest(999) is None
+
+
+async def test_expired_active_quests(storage):
+    now = int(time.time())
+    old = await storage.create_quest("old", "b", None, 1, None, 1, 2, now - 10)
+    await storage.create_quest("future", "b", None, 1, None, 0, 0, now + 3600)
+    await storage.create_quest("forever", "b", None, 1, None, 0, 0)
+    closed = await storage.create_quest("closed", "b", None, 1, None, 0, 0, now - 5)
+    await storage.close_quest(closed)
+    assert same_rows(await storage.get_expired_active_quests(now)) == [(old, "old", 1, 2, now - 10)]
+
+
+# -------- search --------
+async def _search_fixture(storage) -> dict[str, int]:
+    ids = {}
+    ids["dragon"] = await storage.create_quest(
+        "Dragon gate", "Defeat the red dragon at the gate. Bring a lantern 🧧 for luck.", "Dragón bonus", 2, None, 0, 0
+    )
+    ids["lantern"] = await storage.create_quest("Lantern festival", "Light a lantern in your city.", None, 1, None, 0, 0)
+    ids["play"] = await storage.create_quest("Play time", "Player versus player: play three matches.", "layer cake", 3, None, 0, 0)
+    ids["closed"] = await storage.create_quest("Dragon boat", "Race the dragon boats.", None, 1, None, 0, 0)
+    await storage.close_quest(ids["closed"])
+    return ids
+
+
+async def test_search_matches_word_prefixes(storage):
+    ids = await _search_fixture(storage)
+    total, rows = await storage.search_quests("drag", 0, 10)
+    assert total == 2
+    assert {r[0] for r in rows} == {ids["dragon"], ids["closed"]}
+    assert (await storage.search_quests("lay", 0, 10))[0] == 1  # "layer", not "play"/"player"
+    assert (await storage.search_quests("dragon lantern", 0, 10))[1][0][0] == ids["dragon"]  # every word must match
+    assert (await storage.search_quests("dragon lantern", 0, 10))[0] == 1
+    assert (await storage.search_quests("dragon", 0, 10))[1][0][0] in (ids["dragon"], ids["closed"])
+    assert (await storage.search_quests("  ", 0, 10)) == (0, [])
+    assert (await storage.search_quests("dragon", 0, 10, active_only=True))[0] == 1
+
+
+async def test_search_ignores_accents_and_case(storage):
+    ids = await _search_fixture(storage)
+    total, rows = await storage.search_quests("DRAGON BONUS", 0, 10)
+    assert (total, rows[0][0]) == (1, ids["dragon"])
+
+
+async def test_search_ranking_paging_and_snippets(storage):
+    ids = await _search_fixture(storage)
+    total, rows = await storage.search_quests("lantern", 0, 10)
+    # title hits (weight 10) rank above body-only hits
+    assert total == 2
+    assert [r[0] for r in rows] == [ids["lantern"], ids["dragon"]]
+    assert rows[0] == (ids["lantern"], "Lantern festival", 1, 1, "Light a **lantern** in your city.")
+    assert "**lantern**" in rows[1][4]
+    assert same_rows((await storage.search_quests("lantern", 1, 1))[1]) == [tuple(rows[1])]
+
+
+async def test_search_results_are_identical_across_backends(tmp_path):
+    sqlite_storage = bot.SQLiteStorage(str(tmp_path / "a.db"), archive_path=str(tmp_path / "b.db"))
+    memory = bot.MemoryStorage()
+    results = []
+    for st in (sqlite_storage, memory):
+        await st.init()
+        await _search_fixture(st)
+        results.append([await st.search_quests(q, 0, 10) for q in ("dragon", "lantern", "pla", "d l", "🧧", "luck gate")])
+        await st.close()
+    assert results[0] == results[1]
+
+
+# =========================
+# SUBMISSIONS
+# =========================
+async def test_create_submission_results(storage):
+    qid = await storage.create_quest("Q", "b", None, 3, None, 0, 0)
+    closed = await storage.create_quest("C", "b", None, 1, None, 0, 0)
+    await storage.close_quest(closed)
+
+    assert await storage.create_submission(1, 999, "u", None) == ("missing", None, None, 0)
+    assert await storage.create_submission(1, closed, "u", None) == ("closed", None, "C", 1)
+    result, sid, title, reward = await storage.create_submission(1, qid, "https://x/p.png", "note")
+    assert (result, title, reward) == ("ok", "Q", 3)
+    assert await storage.create_submission(1, qid, "u", None) == ("duplicate", None, "Q", 3)
+
+    assert tuple(await storage.get_submission(sid)) == (sid, 1, qid, "https://x/p.png", "note", "PENDING", 0, None, None)
+    assert await storage.list_pending_submission_ids() == [sid]
+    assert same_rows(await storage.list_unposted_submissions()) == [(sid, 1, qid, "https://x/p.png", "note")]
+    await storage.update_submission_message(sid, 55, 66)
+    assert (await storage.get_submission(sid))[7:] == (55, 66)
+    assert await storage.list_unposted_submissions() == []
+
+
+async def test_review_approve_then_revoke(storage):
+    qid = await storage.create_quest("Q", "b", None, 3, None, 0, 0)
+    _, sid, _, _ = await storage.create_submission(1, qid, "u", None)
+
+    assert await storage.review_submission(sid, "APPROVED", 3, effects=[bot.effect_send(9, "yay")])
+    assert not await storage.review_submission(sid, "REJECTED", 0)
+    assert await storage.get_user_stats(1) == (3, 0, 0)
+    assert await storage.count_user_approved(1) == 1
+    assert (await storage.get_submission(sid))[5:7] == ("APPROVED", 3)
+    assert await storage.create_submission(1, qid, "u", None) == ("duplicate", None, "Q", 3)
+
+    assert await storage.revoke_submission(sid) == ("APPROVED", True)
+    assert await storage.revoke_submission(sid) == ("REVOKED", False)
+    assert await storage.revoke_submission(999) == (None, False)
+    assert await storage.get_user_stats(1) == (0, 0, 0)
+    assert await storage.count_user_approved(1) == 0
+    assert (await storage.create_submission(1, qid, "u", None))[0] == "ok"  # revoked frees the slot
+
+
+async def test_revoke_keeps_spent_envelopes(storage):
+    qid = await storage.create_quest("Q", "b", None, 2, None, 0, 0)
+    _, sid, _, _ = await storage.create_submission(1, qid, "u", None)
+    await storage.review_submission(sid, "APPROVED", 2)
+    await storage.consume_envelope_and_award(1, 1, False)
+    assert await storage.revoke_submission(sid) == ("APPROVED", False)
+    assert await storage.get_user_stats(1) == (1, 1, 0)
+
+
+async def test_rejected_submission_can_be_resubmitted(storage):
+    qid = await storage.create_quest("Q", "b", None, 2, None, 0, 0)
+    _, sid, _, _ = await storage.create_submission(1, qid, "u", None)
+    assert await storage.review_submission(sid, "REJECTED", 0)
+    assert await storage.get_user_stats(1) == (0, 0, 0)
+    assert (await storage.create_submission(1, qid, "u", None))[0] == "ok"
+
+
+async def test_list_user_submissions_pages_newest_first(storage):
+    quests = [await storage.create_quest(f"Q{i}", "b", None, 1, None, 0, 0) for i in range(5)]
+    sids = [(await storage.create_submission(7, q, "u", None))[1] for q in quests]
+    await storage.create_submission(8, quests[0], "u", None)
+
+    first = same_rows(await storage.list_user_submissions(7, None, 2))
+    assert [r[:4] for r in first] == [(sids[4], quests[4], "Q4", "PENDING"), (sids[3], quests[3], "Q3", "PENDING")]
+    rest = await storage.list_user_submissions(7, first[-1][0], 10)
+    assert [r[0] for r in rest] == [sids[2], sids[1], sids[0]]
+
+
+async def test_review_queue_leases(storage):
+    qid = await storage.create_quest("Q", "b", None, 1, None, 0, 0)
+    a = (await storage.create_submission(1, qid, "u", None))[1]
+    b = (await storage.create_submission(2, qid, "u", None))[1]
+
+    assert (await storage.lease_next_submission(100, 60))[0] == a
+    assert (await storage.lease_next_submission(100, 60))[0] == a  # same reviewer gets their lease back
+    assert (await storage.lease_next_submission(200, 60))[0] == b
+    assert await storage.lease_next_submission(300, 60) is None
+    assert (await storage.review_queue_stats())[:2] == (2, 2)
+
+    assert await storage.lease_next_submission(100, 60, skip=True) is None  # skipped, nothing else free
+    assert (await storage.lease_next_submission(300, 60))[0] == a
+    await storage.review_submission(b, "APPROVED", 1)
+    depth, leased, median = await storage.review_queue_stats()
+    assert depth == 1 and median >= 0
+
+
+# =========================
+# DAILY CLAIMS
+# =========================
+async def test_daily_claim_cooldown(storage):
+    assert await storage.can_claim_daily(1) == (True, 0)
+    await storage.set_daily_claim(1)
+    ok, wait = await storage.can_claim_daily(1)
+    assert not ok and bot.DAILY_COOLDOWN_SECONDS - 2 <= wait <= bot.DAILY_COOLDOWN_SECONDS
+    assert await storage.can_claim_daily(2) == (True, 0)
+
+
+# =========================
+# ARCHIVE
+# =========================
+async def test_archive_moves_settled_quests(storage):
+    keep = await storage.create_quest("Open", "b", None, 1, None, 0, 0)
+    done = await storage.create_quest("Done", "b", None, 2, None, 0, 0)
+    waiting = await storage.create_quest("Waiting", "b", None, 1, None, 0, 0)
+    _, approved, _, _ = await storage.create_submission(1, done, "u", None)
+    _, rejected, _, _ = await storage.create_submission(2, done, "u", None)
+    await storage.create_submission(3, waiting, "u", None)
+    await storage.review_submission(approved, "APPROVED", 2)
+    await storage.review_submission(rejected, "REJECTED", 0)
+    await storage.close_quest(done)
+    await storage.close_quest(waiting)
+    await storage.record_proof(approved, "a" * 64, 0x0F0F)
+
+    assert await storage.archive_batch(int(time.time()) - 3600, 100) == (0, 0)  # closed too recently
+    moved = (0, 0)
+    while True:
+        step = await storage.archive_batch(int(time.time()) + 1, 100)
+        if step == (0, 0):
+            break
+        moved = (moved[0] + step[0], moved[1] + step[1])
+    assert moved == (1, 2)
+    assert await storage.archive_counts() == {
+        "hot_quests": 2, "hot_submissions": 1, "archived_quests": 1, "archived_submissions": 2,
+    }
+
+    # archived rows still count and still show up
+    assert await storage.count_user_approved(1) == 1
+    assert [r[:4] for r in await storage.list_user_submissions(1, None, 10)] == [(approved, done, "Done", "APPROVED")]
+    assert (await storage.search_quests("done", 0, 10))[0] == 1
+    assert [m[0] for m in await storage.find_proof_matches("a" * 64, None, 3)] == [approved]
+    assert (await storage.get_quest(keep))[1] == "Open"
+    assert tuple(await storage.get_submission(approved)) == (approved, 1, done, "u", None, "APPROVED", 2, None, None)
+    assert (await storage.get_submission(rejected))[5] == "REJECTED"
+    # archived results are final
+    assert await storage.revoke_submission(approved) == (None, False)
+    assert await storage.get_user_stats(1) == (2, 0, 0)
+
+
+# =========================
+# PROOF INDEX
+# =========================
+async def test_proof_matches_exact_and_near(storage):
+    qid = await storage.create_quest("Q", "b", None, 1, None, 0, 0)
+    s1 = (await storage.create_submission(1, qid, "u", None))[1]
+    s2 = (await storage.create_submission(2, qid, "u", None))[1]
+    s3 = (await storage.create_submission(3, qid, "u", None))[1]
+    phash = 0x0123456789ABCDEF
+    await storage.record_proof(s1, "a" * 64, phash)
+    await storage.record_proof(s2, "b" * 64, phash ^ 0b101)  # 2 bits off
+    await storage.record_proof(s3, "c" * 64, phash ^ 0xFFFF)  # 16 bits off
+
+    assert same_rows(await storage.find_proof_matches("a" * 64, phash, 3)) == [
+        (s1, 1, qid, 0, "a" * 64), (s2, 2, qid, 2, "b" * 64),
+    ]
+    assert same_rows(await storage.find_proof_matches("a" * 64, None, 3)) == [(s1, 1, qid, 0, "a" * 64)]
+    assert await storage.find_proof_matches("d" * 64, None, 3) == []
+
+
+# =========================
+# COUNTERS, SETTINGS, OUTBOX
+# =========================
+async def test_counters(storage):
+    qid = await storage.create_quest("Q", "b", None, 2, None, 0, 0)
+    _, a, _, _ = await storage.create_submission(1, qid, "u", None)
+    _, b, _, _ = await storage.create_submission(2, qid, "u", None)
+    await storage.review_submission(a, "APPROVED", 2)
+    await storage.review_submission(b, "REJECTED", 0)
+    await storage.consume_envelope_and_award(1, 4, False, bot.TIERS[2][0])
+    await storage.adjust_user_field(2, "points", 3)
+    await storage.revoke_submission(a)
+
+    assert await storage.get_counters() == {
+        "submissions_received": 2,
+        "submissions_rejected": 1,
+        "submissions_revoked": 1,
+        "envelopes_awarded": 2,
+        "envelopes_opened": 1,
+        f"tier:{bot.TIERS[2][0]}": 1,
+        "points_awarded": 4,
+        "points_adjusted": 3,
+    }
+
+
+async def test_counters_have_no_zero_entries(storage):
+    qid = await storage.create_quest("Q", "b", None, 0, None, 0, 0)
+    _, sid, _, _ = await storage.create_submission(1, qid, "u", None)
+    await storage.review_submission(sid, "REJECTED", 0)
+    assert 0 not in (await storage.get_counters()).values()
+
+
+async def test_settings(storage):
+    assert await storage.get_setting("live_board") is None
+    await storage.set_setting("live_board", "1:2")
+    await storage.set_setting("live_board", "3:4")
+    assert await storage.get_setting("live_board") == "3:4"
+    await storage.set_setting("live_board", None)
+    assert await storage.get_setting("live_board") is None
+
+
+async def test_outbox(storage):
+    await storage.enqueue_effects([bot.effect_send(5, "hi"), bot.effect_quest_closed(6, 7)])
+    due = same_rows(await storage.due_effects(time.time(), 10))
+    assert [(kind, channel, json.loads(payload), attempts) for _, kind, channel, payload, attempts in due] == [
+        ("send", 5, {"content": "hi"}, 0), ("quest_closed", 6, {"message_id": 7}, 0),
+    ]
+    first, second = due[0][0], due[1][0]
+
+    await storage.fail_effect(first, "429", dead=False, next_attempt_at=time.time() + 60)
+    assert [r[0] for r in await storage.due_effects(time.time(), 10)] == [second]
+    assert await storage.count_pending_effects() == 2
+    await storage.fail_effect(second, "403", dead=True)
+    await storage.complete_effect(first)
+    assert await storage.due_effects(time.time() + 120, 10) == []
+    assert await storage.count_pending_effects() == 0
+
+
+async def test_reset_all(storage):
+    await storage.add_envelopes(1, 3)
+    qid = await storage.create_quest("Q", "b", None, 1, None, 0, 0)
+    await storage.create_submission(1, qid, "u", None)
+    await storage.set_setting("k", "v")
+    await storage.reset_all()
+    assert await storage.get_user_stats(1) == (0, 0, 0)
+    assert await storage.count_users() == 0
+    assert await storage.list_active_quests() == []
+    assert await storage.search_quests("q", 0, 10) == (0, [])
+    assert await storage.get_counters() == {}
+    assert await storage.get_setting("k") is None
+    assert await storage.create_quest("Q", "b", None, 1, None, 0, 0) == 1
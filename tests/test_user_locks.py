@@ -0,0 +1,93 @@
+import asyncio
+from collections import Counter
+
+import bot
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_stripes_spread_snowflakes():
+    locks = bot.UserLocks(64)
+    # consecutive snowflakes differ mostly in the low counter bits
+    base = 1_100_000_000_000_000_000
+    counts = Counter(locks.stripe_for(base + i) for i in range(6400))
+    assert len(counts) == 64
+    assert max(counts.values()) < 3 * 100
+
+
+async def test_same_user_is_serialised():
+    locks = bot.UserLocks(16)
+    events = []
+
+    async def act(tag):
+        async with locks.hold(42):
+            events.append(f"{tag} in")
+            await asyncio.sleep(0.01)
+            events.append(f"{tag} out")
+
+    await asyncio.gather(act("a"), act("b"), act("c"))
+    assert events == ["a in", "a out", "b in", "b out", "c in", "c out"]
+    assert (locks.acquired, locks.contended) == (3, 2)
+
+
+async def test_different_stripes_do_not_wait():
+    locks = bot.UserLocks(1024)
+    a, b = 1, next(u for u in range(2, 10_000) if locks.stripe_for(u) != locks.stripe_for(1))
+    release = asyncio.Event()
+
+    async def hold_a():
+        async with locks.hold(a):
+            await release.wait()
+
+    holder = asyncio.ensure_future(hold_a())
+    await _settle()
+    async with locks.hold(b):
+        pass  # would hang if b waited for a
+    assert locks.contended == 0
+    release.set()
+    await holder
+
+
+async def test_slots_only_exist_while_in_use():
+    locks = bot.UserLocks(8)
+    release = asyncio.Event()
+
+    async def hold(uid):
+        async with locks.hold(uid):
+            await release.wait()
+
+    tasks = [asyncio.ensure_future(hold(uid)) for uid in (1, 1, 2)]
+    await _settle()
+    assert locks.table[locks.stripe_for(1)][1] == 2
+    release.set()
+    await asyncio.gather(*tasks)
+    assert locks.table == {}
+
+
+async def test_slot_is_cleaned_up_when_a_waiter_is_cancelled_or_the_body_raises():
+    locks = bot.UserLocks(8)
+    release = asyncio.Event()
+
+    async def hold():
+        async with locks.hold(5):
+            await release.wait()
+
+    holder = asyncio.ensure_future(hold())
+    await _settle()
+    waiter = asyncio.ensure_future(hold())
+    await _settle()
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    release.set()
+    await holder
+    assert locks.table == {}
+
+    try:
+        async with locks.hold(5):
+            raise ValueError
+    except ValueError:
+        pass
+    assert locks.table == {}